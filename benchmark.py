@@ -0,0 +1,303 @@
+# benchmark.py - 上位機打印流程離線基準測試
+# 功能：不需任何硬體，以 layers.zip / temp_layers 測量每層額外開銷的各個環節，結果存成 JSON 以便跨版本比較。
+# 用法:
+#   python benchmark.py run [--layers 40] [--size 800x600] [-o bench.json]
+#   python benchmark.py compare old.json new.json [--threshold 10]
+
+import os
+import sys
+import json
+import time
+import socket
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client
+
+from profiling import percentile
+from slice_source import ZipSliceSource
+from layer_program import build_layer_program, program_lines, TRIGGER_BYTE
+
+AUTHKEY = b'benchmark'
+
+
+# --- 1. 計時工具 ---
+def measure(fn, repeat, warmup=1):
+    """先預熱，再執行 fn repeat 次並回傳統計 (毫秒)。"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {'n': repeat, 'mean_ms': sum(samples) / len(samples), 'p50_ms': percentile(samples, 50),
+            'p90_ms': percentile(samples, 90), 'min_ms': samples[0], 'max_ms': samples[-1]}
+
+
+def cycle(items):
+    """每次呼叫回傳下一個元素，讓逐層測試輪流使用不同的切片。"""
+    state = {'i': 0}
+
+    def next_item():
+        item = items[state['i'] % len(items)]
+        state['i'] += 1
+        return item
+    return next_item
+
+
+def pick_layers(source, count):
+    """平均抽樣 count 層，固定抽樣方式以確保結果可重現。"""
+    total = len(source)
+    count = min(count, total)
+    return [round(i * (total - 1) / max(1, count - 1)) for i in range(count)]
+
+
+# --- 2. 各項測試 ---
+def bench_zip(zip_path, repeat):
+    results = {}
+
+    def extract_all():
+        with tempfile.TemporaryDirectory() as tmp, zipfile.ZipFile(zip_path) as zf:
+            zf.extractall(tmp)
+    results['zip.extractall'] = measure(extract_all, max(1, repeat // 10))
+
+    def open_and_read():
+        source = ZipSliceSource(zip_path)
+        for i in range(len(source)):
+            source.read_bytes(i)
+        source.close()
+    results['zip.read_all_in_memory'] = measure(open_and_read, max(1, repeat // 10))
+    return results
+
+
+def bench_decode(source, layers, repeat):
+    payloads = [source.read_bytes(i) for i in layers]
+    from slice_source import decode_png
+    next_payload = cycle(payloads)
+    return {'png.decode': measure(lambda: decode_png(next_payload()), repeat)}
+
+
+def bench_scale(source, layers, size, repeat):
+    from PIL import Image
+    images = [Image.fromarray(source.decode(i)) for i in layers]
+    results = {}
+    for name, method in (('lanczos', Image.Resampling.LANCZOS), ('bicubic', Image.Resampling.BICUBIC),
+                         ('bilinear', Image.Resampling.BILINEAR), ('nearest', Image.Resampling.NEAREST)):
+        next_image = cycle(images)
+        results[f'scale.{name}'] = measure(lambda: next_image().resize(size, method), repeat)
+    # reducing_gap: 先以整數倍快速縮小再 LANCZOS，縮小比例大時明顯較快
+    next_image = cycle(images)
+    results['scale.lanczos_reducing_gap'] = measure(
+        lambda: next_image().resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0), repeat)
+    return results
+
+
+def bench_photoimage(source, layers, size, repeat):
+    try:
+        import tkinter as tk
+        from PIL import Image, ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        return {'convert.photoimage': {'skipped': f"{e}"}}
+    images = [Image.fromarray(source.decode(i)).resize(size) for i in layers]
+    next_image = cycle(images)
+    keep = []
+
+    def convert():
+        keep[:] = [ImageTk.PhotoImage(next_image(), master=root)]
+    try:
+        return {'convert.photoimage': measure(convert, repeat)}
+    finally:
+        keep.clear()
+        root.destroy()
+
+
+def bench_qpixmap(source, layers, size, repeat):
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtGui import QImage, QPixmap
+        app = QApplication.instance() or QApplication([])
+    except Exception as e:
+        return {'convert.qpixmap_from_png': {'skipped': f"{e}"}, 'convert.qpixmap_from_gray8': {'skipped': f"{e}"}}
+    from slice_source import scale_frame
+    payloads = [source.read_bytes(i) for i in layers]
+    frames = [scale_frame(source.decode(i), size) for i in layers]
+    next_payload = cycle(payloads)
+    next_frame = cycle(frames)
+
+    def from_png():
+        pixmap = QPixmap()
+        pixmap.loadFromData(next_payload(), 'PNG')
+
+    def from_gray8():
+        frame = next_frame()
+        h, w = frame.shape
+        QPixmap.fromImage(QImage(frame.tobytes(), w, h, w, QImage.Format_Grayscale8))
+    results = {'convert.qpixmap_from_png': measure(from_png, repeat),
+               'convert.qpixmap_from_gray8': measure(from_gray8, repeat)}
+    del app
+    return results
+
+
+def bench_projector_ipc(source, layers, size, repeat):
+    """與 projector_view.py 相同的 multiprocessing.connection 管道，測量路徑與像素兩種訊息的往返。"""
+    from slice_source import scale_frame
+    from projector_client import frame_message
+    listener = Listener(('localhost', 0), authkey=AUTHKEY)
+
+    def echo():
+        with listener.accept() as conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    break
+                conn.send({'status': 'ack'})
+                if msg.get('command') == 'close':
+                    break
+    server = threading.Thread(target=echo, daemon=True)
+    server.start()
+    conn = Client(listener.address, authkey=AUTHKEY)
+
+    def round_trip(msg):
+        conn.send(msg)
+        conn.recv()
+    next_frame = cycle([frame_message(scale_frame(source.decode(i), size)) for i in layers])
+    try:
+        return {'ipc.show_path': measure(lambda: round_trip({'command': 'show', 'path': 'temp_layers/1.png'}), repeat),
+                'ipc.frame_pixels': measure(lambda: round_trip(next_frame()), repeat)}
+    finally:
+        round_trip({'command': 'close'})
+        conn.close()
+        listener.close()
+
+
+def bench_motion(repeat):
+    from fake_esp32 import FakeESP32Server
+    server = FakeESP32Server().start()
+    sock = socket.create_connection(server.address, timeout=10)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reader = sock.makefile('r')
+
+    def request(cmd):
+        sock.sendall((cmd + "\n").encode())
+        return reader.readline()
+
+    # 逐層程式：一次上傳，之後每層只送一個觸發字節
+    program = build_layer_program(repeat + 1, {'peel_lift_z1': 5.05, 'peel_return_z2': 5.0})
+
+    def upload(steps):
+        lines = program_lines(steps)
+        sock.sendall(("\n".join(lines) + "\n").encode())
+        for _ in lines:
+            reader.readline()
+
+    def trigger():
+        sock.sendall(TRIGGER_BYTE)
+        reader.readline()
+    try:
+        return {
+            'motion.config_axis': measure(lambda: request("CONFIG_AXIS,z,12800.0,5.0"), repeat),
+            'motion.config_z_peel': measure(lambda: request("CONFIG_Z_PEEL,5.05,5.0,20.0,20.0"), repeat),
+            'motion.next_layer': measure(lambda: request("NEXT_LAYER"), repeat),
+            'motion.move_rel': measure(lambda: request("MOVE_REL,z,1.0,10.0,20.0"), repeat),
+            'motion.program_upload': measure(lambda: upload(program), max(1, repeat // 10)),
+            'motion.program_trigger': measure(trigger, repeat),
+        }
+    finally:
+        sock.close()
+        server.stop()
+
+
+# --- 3. 執行與比較 ---
+def run(args):
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    source = ZipSliceSource(args.zip)
+    layers = pick_layers(source, args.layers)
+    results = {}
+    suites = [
+        ('zip', lambda: bench_zip(args.zip, args.repeat)),
+        ('decode', lambda: bench_decode(source, layers, args.repeat)),
+        ('scale', lambda: bench_scale(source, layers, size, args.repeat)),
+        ('photoimage', lambda: bench_photoimage(source, layers, size, args.repeat)),
+        ('qpixmap', lambda: bench_qpixmap(source, layers, size, args.repeat)),
+        ('ipc', lambda: bench_projector_ipc(source, layers, size, args.repeat)),
+        ('motion', lambda: bench_motion(args.repeat)),
+    ]
+    for name, suite in suites:
+        if args.only and name not in args.only:
+            continue
+        print(f"執行 {name} ...", flush=True)
+        results.update(suite())
+    source.close()
+    versions = {}
+    for module in ('numpy', 'PIL', 'PyQt5.QtCore'):
+        try:
+            mod = __import__(module, fromlist=['_'])
+            versions[module] = getattr(mod, '__version__', getattr(mod, 'PYQT_VERSION_STR', '?'))
+        except ImportError:
+            versions[module] = None
+    report = {'meta': {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': sys.version.split()[0],
+                       'platform': platform.platform(), 'machine': platform.machine(), 'versions': versions,
+                       'zip': os.path.basename(args.zip), 'layers': layers, 'size': size, 'repeat': args.repeat},
+              'results': results}
+    for name, r in results.items():
+        if 'skipped' in r:
+            print(f"{name:<32s} 略過: {r['skipped']}")
+        else:
+            print(f"{name:<32s} 平均 {r['mean_ms']:9.3f} ms  p50 {r['p50_ms']:9.3f}  p90 {r['p90_ms']:9.3f}")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"結果已寫入 {args.output}")
+
+
+def compare(args):
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)['results']
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)['results']
+    regressions = 0
+    for name in sorted(set(old) | set(new)):
+        a, b = old.get(name, {}), new.get(name, {})
+        if 'p50_ms' not in a or 'p50_ms' not in b:
+            print(f"{name:<32s} (僅存在於其中一份結果或被略過)")
+            continue
+        change = 100.0 * (b['p50_ms'] - a['p50_ms']) / a['p50_ms'] if a['p50_ms'] else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  <-- 變慢"
+            regressions += 1
+        print(f"{name:<32s} {a['p50_ms']:9.3f} -> {b['p50_ms']:9.3f} ms ({change:+6.1f}%){flag}")
+    print(f"共 {regressions} 項超過 {args.threshold}% 的退步。")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上位機打印流程離線基準測試")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help="執行基準測試")
+    run_parser.add_argument('--zip', default='layers.zip')
+    run_parser.add_argument('--layers', type=int, default=40, help="平均抽樣的層數")
+    run_parser.add_argument('--repeat', type=int, default=50, help="每項測試的重複次數")
+    run_parser.add_argument('--size', default='800x600', help="縮放目標尺寸 WxH (預設為主螢幕預覽視窗尺寸)")
+    run_parser.add_argument('--only', nargs='*', help="只執行指定項目: zip decode scale photoimage qpixmap ipc motion")
+    run_parser.add_argument('-o', '--output', default='bench.json')
+    compare_parser = sub.add_parser('compare', help="比較兩份結果")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help="p50 變慢超過此百分比視為退步")
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# calibration.py - 投影幾何校正 (梯形 / 鏡頭畸變)
+# 流程:
+#   1. python calibration.py pattern pattern.png --size 1920x1080      產生圓點測試圖並投影
+#   2. 拍攝成型平台上的投影結果，裁切到名義投影範圍 (四角對齊平台標記)
+#   3. python calibration.py fit photo.png --size 1920x1080 -o remap.npz  擬合並儲存整數索引查找表
+#   4. 打印時以 GeometricRemap 對每一層做一次向量化 gather (已與縮放結果一起快取)
+
+import zlib
+import argparse
+
+import numpy as np
+
+
+# --- 1. 測試圖與圓點偵測 ---
+def grid_points(size, spacing, margin=None):
+    """名義圓點座標 (x, y)，以 spacing 為間距、距邊緣 margin。"""
+    width, height = size
+    margin = spacing // 2 if margin is None else margin
+    xs = np.arange(margin, width - margin + 1, spacing)
+    ys = np.arange(margin, height - margin + 1, spacing)
+    gx, gy = np.meshgrid(xs, ys)
+    return np.stack([gx.ravel(), gy.ravel()], axis=1).astype(np.float64)
+
+
+def make_test_pattern(size, spacing=120, radius=6):
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    pattern = np.zeros((height, width), dtype=np.uint8)
+    for x, y in grid_points(size, spacing):
+        pattern[(xx - x) ** 2 + (yy - y) ** 2 <= radius ** 2] = 255
+    return pattern
+
+
+def detect_dots(photo, nominal, search):
+    """
+    在每個名義位置附近 ±search 像素的視窗內計算亮度加權質心。
+    photo 須已裁切並縮放到投影解析度。回傳 (observed, valid)。
+    """
+    height, width = photo.shape
+    img = photo.astype(np.float64)
+    observed = np.zeros_like(nominal)
+    valid = np.zeros(len(nominal), dtype=bool)
+    for n, (x, y) in enumerate(nominal):
+        x0, x1 = int(max(0, x - search)), int(min(width, x + search + 1))
+        y0, y1 = int(max(0, y - search)), int(min(height, y + search + 1))
+        window = img[y0:y1, x0:x1]
+        window = np.clip(window - np.median(window), 0, None)  # 扣除背景亮度
+        total = window.sum()
+        if total <= 0:
+            continue
+        wy, wx = np.mgrid[y0:y1, x0:x1]
+        observed[n] = ((wx * window).sum() / total, (wy * window).sum() / total)
+        valid[n] = True
+    return observed, valid
+
+
+# --- 2. 多項式擬合 ---
+def _poly_terms(x, y, degree):
+    return np.stack([x ** i * y ** j for i in range(degree + 1) for j in range(degree + 1 - i)], axis=-1)
+
+
+def fit_polynomial(nominal, observed, size, degree=3):
+    """
+    擬合「顯示像素 -> 實際落點」的二維多項式。座標先正規化到 [-1, 1] 以保持數值穩定。
+    回傳 (係數 (terms, 2), 殘差 RMS 像素)。
+    """
+    scale = np.array(size, dtype=np.float64) / 2.0
+    terms = _poly_terms(*((nominal / scale) - 1.0).T, degree)
+    coeffs, _, _, _ = np.linalg.lstsq(terms, (observed / scale) - 1.0, rcond=None)
+    residual = (terms @ coeffs + 1.0) * scale - observed
+    return coeffs, float(np.sqrt((residual ** 2).sum(axis=1).mean()))
+
+
+# --- 3. 預先計算的查找表 ---
+class GeometricRemap:
+    """
+    整數索引查找表：輸出幀的顯示像素 d 取切片上 f(d) 位置的值，
+    使光線實際落點正好對應切片內容。套用時只需一次 gather。
+    """
+
+    def __init__(self, size, lut, invalid):
+        self.size = tuple(int(v) for v in size)
+        self.lut = lut
+        self.invalid = invalid
+        self.key = f"remap:{self.size}:{zlib.crc32(lut.tobytes()):08x}"
+
+    @classmethod
+    def from_polynomial(cls, coeffs, size, degree=3):
+        width, height = size
+        scale = np.array(size, dtype=np.float64) / 2.0
+        sx = np.empty(width * height, dtype=np.int64)
+        sy = np.empty(width * height, dtype=np.int64)
+        xs = np.arange(width) / scale[0] - 1.0
+        # 分塊計算，避免一次建立 (像素數 x 多項式項數) 的大矩陣
+        for row0 in range(0, height, 128):
+            rows = np.arange(row0, min(height, row0 + 128))
+            yy, xx = np.meshgrid(rows / scale[1] - 1.0, xs, indexing='ij')
+            target = (_poly_terms(xx.ravel(), yy.ravel(), degree) @ coeffs + 1.0) * scale
+            block = slice(row0 * width, (row0 + len(rows)) * width)
+            sx[block] = np.rint(target[:, 0])
+            sy[block] = np.rint(target[:, 1])
+        outside = (sx < 0) | (sx >= width) | (sy < 0) | (sy >= height)
+        lut = (np.clip(sy, 0, height - 1) * width + np.clip(sx, 0, width - 1)).astype(np.int32)
+        return cls(size, lut, np.flatnonzero(outside).astype(np.int32))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(tuple(data['size']), data['lut'], data['invalid'])
+
+    def save(self, path):
+        np.savez_compressed(path, size=np.array(self.size), lut=self.lut, invalid=self.invalid)
+
+    def __call__(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError(f"幀尺寸 {frame.shape[1]}x{frame.shape[0]} 與校正表 {self.size[0]}x{self.size[1]} 不符。")
+        out = frame.reshape(-1)[self.lut]
+        out[self.invalid] = 0  # 對應到投影範圍外的像素一律關閉
+        return out.reshape(frame.shape)
+
+
+def _load_gray(path, size=None):
+    from PIL import Image
+    with Image.open(path) as img:
+        img = img.convert('L')
+        if size and img.size != tuple(size):
+            img = img.resize(tuple(size), Image.Resampling.LANCZOS)
+        return np.asarray(img)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投影幾何校正")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('pattern', help="產生圓點測試圖")
+    p.add_argument('output')
+    p.add_argument('--size', default='1920x1080')
+    p.add_argument('--spacing', type=int, default=120)
+    p.add_argument('--radius', type=int, default=6)
+    f = sub.add_parser('fit', help="由拍攝的投影結果擬合校正表")
+    f.add_argument('photo', help="已裁切到名義投影範圍的照片")
+    f.add_argument('--size', default='1920x1080')
+    f.add_argument('--spacing', type=int, default=120)
+    f.add_argument('--degree', type=int, default=3)
+    f.add_argument('-o', '--output', default='remap.npz')
+    a = sub.add_parser('apply', help="對單張圖片套用校正表 (檢查用)")
+    a.add_argument('remap')
+    a.add_argument('input')
+    a.add_argument('output')
+    args = parser.parse_args()
+
+    from PIL import Image
+    if args.command == 'pattern':
+        size = tuple(int(v) for v in args.size.lower().split('x'))
+        Image.fromarray(make_test_pattern(size, args.spacing, args.radius)).save(args.output)
+        print(f"測試圖已寫入 {args.output}")
+    elif args.command == 'fit':
+        size = tuple(int(v) for v in args.size.lower().split('x'))
+        nominal = grid_points(size, args.spacing)
+        observed, valid = detect_dots(_load_gray(args.photo, size), nominal, args.spacing // 2 - 1)
+        print(f"偵測到 {valid.sum()} / {len(nominal)} 個圓點。")
+        coeffs, rms = fit_polynomial(nominal[valid], observed[valid], size, args.degree)
+        print(f"擬合殘差 RMS: {rms:.2f} 像素")
+        GeometricRemap.from_polynomial(coeffs, size, args.degree).save(args.output)
+        print(f"校正表已寫入 {args.output}")
+    else:
+        remap = GeometricRemap.load(args.remap)
+        Image.fromarray(remap(_load_gray(args.input, remap.size))).save(args.output)
+        print(f"已輸出 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
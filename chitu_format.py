@@ -0,0 +1,232 @@
+# chitu_format.py - ChiTuBox 系列切片格式 (.ctb / .cbddlp / .photon)
+# 功能：直接讀取切片軟體輸出的 RLE 壓縮切片與每層曝光 / 抬升參數，逐層延遲解碼，不需轉成 PNG 壓縮包。
+#       .cbddlp / .photon：1 位元 RLE，抗鋸齒時每個等級一張位元圖；.ctb (v2-v4)：7 位元灰階 RLE，可能帶層加密。
+# 用法:
+#   python chitu_format.py info part.ctb
+#   python chitu_format.py export part.ctb --layer 10 -o layer10.png
+
+import os
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC_CBDDLP = 0x12FD0019
+MAGIC_CTB = 0x12FD0086
+MAGIC_CTB_ENCRYPTED = 0x12FD0107
+
+# 檔頭 112 bytes：magic, version, 成型尺寸 xyz, 2 個保留欄, 總高度, 層高, 曝光, 底層曝光, 熄燈延遲,
+# 底層數, 解析度 x/y, 大預覽圖, 層定義表, 層數, 小預覽圖, 列印時間, 投影鏡像, 列印參數位置/大小,
+# 抗鋸齒等級, 光強 PWM, 底層光強 PWM, 加密金鑰, 切片軟體資訊位置/大小
+_HEADER = struct.Struct('<2I3f2I5f12I2H3I')
+_HEADER_FIELDS = ('magic', 'version', 'bed_x', 'bed_y', 'bed_z', '_r1', '_r2', 'total_height', 'layer_height',
+                  'exposure', 'bottom_exposure', 'light_off_delay', 'bottom_layers', 'width', 'height',
+                  'preview_large', 'layer_table', 'layer_count', 'preview_small', 'print_time', 'mirror',
+                  'params_offset', 'params_size', 'aa_level', 'pwm', 'bottom_pwm', 'encryption_key',
+                  'slicer_offset', 'slicer_size')
+# 列印參數：底層抬升高度 / 速度, 抬升高度 / 速度, 回程速度, 體積, 重量, 成本, 底層熄燈延遲, 熄燈延遲, 底層數
+_PARAMS = struct.Struct('<10fI')
+_PARAMS_FIELDS = ('bottom_lift_height', 'bottom_lift_speed', 'lift_height', 'lift_speed', 'retract_speed',
+                  'volume_ml', 'weight_g', 'cost', 'bottom_light_off_delay', 'light_off_delay', 'bottom_layer_count')
+# 層定義 36 bytes：高度 z, 曝光秒數, 熄燈秒數, 資料位置, 資料大小, 4 個保留欄
+_LAYER = struct.Struct('<3f2I16x')
+# ctb v3 以上每層資料前有 84 bytes 的延伸定義：層定義 (36) + 總大小 + 每層抬升 / 速度 / 停留時間等 11 個 float
+_LAYER_EX = struct.Struct('<3f2I16xI11f')
+_LAYER_EX_FIELDS = ('lift_height', 'lift_speed', 'lift_height2', 'lift_speed2', 'retract_speed2', 'retract_height2',
+                    'retract_speed', 'rest_before_lift', 'rest_after_lift', 'rest_after_retract', 'light_pwm')
+
+# 7 位元灰階 -> 8 位元：與參考解碼器相同，非零值左移後最低位補 1 (0x7F 對應 255)，0 維持全黑
+_GRAY7 = np.array([(g << 1) | 1 if g else 0 for g in range(128)], dtype=np.uint8)
+
+
+# --- 1. RLE 解碼 ---
+def decrypt_layer(data, seed, index):
+    """ctb 層資料的串流加密 (金鑰為 0 時未加密)；以 uint32 陣列一次算出所有金鑰字再 XOR。"""
+    if not seed:
+        return data
+    init = (seed * 0x2D83CDAC + 0xD8A83423) & 0xFFFFFFFF
+    key = ((index * 0x1E1530CD + 0xEC3D47CD) * init) & 0xFFFFFFFF
+    words = (len(data) + 3) // 4
+    keys = (np.uint64(key) + np.arange(words, dtype=np.uint64) * np.uint64(init)) & np.uint64(0xFFFFFFFF)
+    stream = keys.astype('<u4').view(np.uint8)[:len(data)]
+    return (np.frombuffer(data, dtype=np.uint8) ^ stream).tobytes()
+
+
+def expand_runs(values, lengths, pixel_count):
+    """(值, 長度) 序列以 np.repeat 一次展開；不足補 0，超出截斷。"""
+    pixels = np.repeat(values, lengths)
+    if pixels.size < pixel_count:
+        pixels = np.concatenate([pixels, np.zeros(pixel_count - pixels.size, dtype=np.uint8)])
+    return pixels[:pixel_count]
+
+
+def decode_bit_rle(data, pixel_count):
+    """cbddlp / photon：每字節最高位為顏色、低 7 位為長度，完全向量化。"""
+    codes = np.frombuffer(data, dtype=np.uint8)
+    return expand_runs(codes >> 7, codes & 0x7F, pixel_count)
+
+
+def decode_gray_rle(data, pixel_count):
+    """
+    ctb：低 7 位為灰階；最高位為 1 時後接 1-4 字節的長度 (以前綴位元區分)。
+    長度欄位長短不一，只能循序切出 (值, 長度)；展開與灰階換算以陣列處理。
+    """
+    values = bytearray()
+    lengths = []
+    i, n = 0, len(data)
+    while i < n:
+        code = data[i]
+        i += 1
+        run = 1
+        if code & 0x80:
+            b = data[i]
+            if b & 0x80 == 0:
+                run = b
+                i += 1
+            elif b & 0xC0 == 0x80:
+                run = ((b & 0x3F) << 8) | data[i + 1]
+                i += 2
+            elif b & 0xE0 == 0xC0:
+                run = ((b & 0x1F) << 16) | (data[i + 1] << 8) | data[i + 2]
+                i += 3
+            else:
+                run = ((b & 0x0F) << 24) | (data[i + 1] << 16) | (data[i + 2] << 8) | data[i + 3]
+                i += 4
+        values.append(code & 0x7F)
+        lengths.append(run)
+    return expand_runs(_GRAY7[np.frombuffer(bytes(values), dtype=np.uint8)], np.array(lengths, dtype=np.int64),
+                       pixel_count)
+
+
+# --- 2. 切片來源 ---
+class ChituSliceSource:
+    """
+    介面與 slice_source.ZipSliceSource 相同 (key / __len__ / decode / layer_meta / close)。
+    開啟時只讀檔頭與層定義表，層資料以 mmap 按需讀取並解碼，多執行緒同時讀取不需加鎖。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        stat = os.stat(self.path)
+        self.key = f"{self.path}:{stat.st_size}:{int(stat.st_mtime)}"
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_tables(path)
+        except Exception:
+            # 檔頭或層定義表無效時不保留 mmap
+            self._mm.close()
+            raise
+
+    def _read_tables(self, path):
+        h = self.header = dict(zip(_HEADER_FIELDS, _HEADER.unpack_from(self._mm, 0)))
+        if h['magic'] == MAGIC_CTB_ENCRYPTED:
+            raise ValueError(f"{path} 為加密的 ctb v5 格式，請在切片軟體中改存 ctb v4 以下版本。")
+        if h['magic'] not in (MAGIC_CBDDLP, MAGIC_CTB):
+            raise ValueError(f"{path} 不是 ChiTuBox 切片檔 (magic 0x{h['magic']:08X})。")
+        self.is_ctb = h['magic'] == MAGIC_CTB
+        self.size = (h['width'], h['height'])
+        self.params = {}
+        if h['params_offset'] and h['params_size'] >= _PARAMS.size:
+            self.params = dict(zip(_PARAMS_FIELDS, _PARAMS.unpack_from(self._mm, h['params_offset'])))
+        # cbddlp 抗鋸齒時層定義表依等級重複 aa_level 次，每個等級一張位元圖
+        self.aa_level = 1 if self.is_ctb else max(1, h['aa_level'])
+        self.layers = [[_LAYER.unpack_from(self._mm, h['layer_table'] + _LAYER.size * (a * h['layer_count'] + i))
+                        for a in range(self.aa_level)] for i in range(h['layer_count'])]
+        if not self.layers:
+            raise FileNotFoundError(f"錯誤: {path} 中沒有任何切片層。")
+
+    def __len__(self):
+        return len(self.layers)
+
+    def read_bytes(self, index, level=0):
+        _, _, _, offset, size = self.layers[index][level]
+        return self._mm[offset:offset + size]
+
+    def decode(self, index):
+        width, height = self.size
+        count = width * height
+        if self.is_ctb:
+            data = decrypt_layer(self.read_bytes(index), self.header['encryption_key'], index)
+            return decode_gray_rle(data, count).reshape(height, width)
+        total = np.zeros(count, dtype=np.uint16)
+        for level in range(self.aa_level):
+            total += decode_bit_rle(self.read_bytes(index, level), count)
+        return (total * 255 // self.aa_level).astype(np.uint8).reshape(height, width)
+
+    def _layer_ex(self, index):
+        """ctb v3+ 的每層延伸參數；內容與層定義表對不上時視為不存在。"""
+        if not self.is_ctb or self.header['version'] < 3:
+            return None
+        z, exposure, _, offset, size = self.layers[index][0]
+        start = offset - _LAYER_EX.size
+        if start < 0:
+            return None
+        values = _LAYER_EX.unpack_from(self._mm, start)
+        if values[3] != offset or values[4] != size or abs(values[0] - z) > 1e-4:
+            return None
+        return dict(zip(_LAYER_EX_FIELDS, values[6:]))
+
+    def layer_meta(self, index):
+        """
+        每層曝光秒數與層間運動 (見 slice_source.open_slice_source)：
+        lift = 抬升高度 + 下一層厚度，return = 抬升高度，與 main_gui 的 peel_lift_z1 / peel_return_z2 相同定義。
+        """
+        z, exposure, light_off, _, _ = self.layers[index][0]
+        bottom = index < self.header['bottom_layers']
+        lift = self.params.get('bottom_lift_height' if bottom else 'lift_height')
+        ex = self._layer_ex(index)
+        if ex and ex['lift_height'] > 0:
+            lift = ex['lift_height'] + ex['lift_height2']
+        if index + 1 < len(self.layers):
+            thickness = self.layers[index + 1][0][0] - z
+        else:
+            thickness = self.header['layer_height']
+        meta = {'z_mm': z, 'exposure_s': exposure, 'light_off_s': light_off}
+        if lift:
+            meta.update({'lift': lift + thickness, 'return': lift})
+        return meta
+
+    def close(self):
+        self._mm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChiTuBox 切片檔 (.ctb / .cbddlp / .photon) 工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    i = sub.add_parser('info', help="顯示檔頭、列印參數與解碼速度")
+    i.add_argument('path')
+    e = sub.add_parser('export', help="把一層輸出成 PNG")
+    e.add_argument('path')
+    e.add_argument('--layer', type=int, default=1, help="層號 (從 1 開始)")
+    e.add_argument('-o', '--output', default='layer.png')
+    args = parser.parse_args()
+
+    source = ChituSliceSource(args.path)
+    try:
+        if args.command == 'info':
+            import time
+            h = source.header
+            print(f"{'ctb' if source.is_ctb else 'cbddlp'} v{h['version']}，{h['width']}x{h['height']}，{len(source)} 層，"
+                  f"層高 {h['layer_height']:.3f} mm，抗鋸齒 {h['aa_level']}，加密 {'是' if h['encryption_key'] else '否'}")
+            print(f"曝光 {h['exposure']:.2f}s / 底層 {h['bottom_exposure']:.2f}s x {h['bottom_layers']} 層")
+            for k, v in source.params.items():
+                print(f"  {k}: {v:g}")
+            print(f"第 1 層參數: {source.layer_meta(0)}")
+            t0 = time.perf_counter()
+            count = min(len(source), 20)
+            raw = sum(len(source.read_bytes(n)) for n in range(count))
+            for n in range(count):
+                source.decode(n)
+            print(f"解碼 {count} 層平均 {(time.perf_counter() - t0) * 1000 / count:.1f} ms，RLE 平均 {raw / count / 1024:.1f} KB/層")
+        else:
+            from PIL import Image
+            Image.fromarray(source.decode(args.layer - 1)).save(args.output)
+            print(f"已輸出第 {args.layer} 層 -> {args.output}")
+    finally:
+        source.close()
+
+
+if __name__ == "__main__":
+    main()
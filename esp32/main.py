@@ -1,4 +1,5 @@
 # main.py - TCP 通訊版 (修正了 Stepper bug)
+import sys
 import machine
 import time
 import uasyncio
@@ -25,6 +26,15 @@ STEP_PIN = 26
 STEPS_PER_MM = 3200.0
 MAX_SPEED_MM_S = 10.0
 ACCELERATION_MM_S2 = 20.0
+# 快速移動 (回位 / 打印前定位等非打印動作)，可由 CONFIG_TRAVEL 修改
+TRAVEL_SPEED_MM_S = 20.0
+TRAVEL_ACCELERATION_MM_S2 = 40.0
+# USB 串口傳輸：True 時同時從 USB 串口 (stdin/stdout) 接收指令；串口即協議通道，因此不輸出除錯訊息
+SERIAL_TRANSPORT = False
+
+def log(*args):
+    if not SERIAL_TRANSPORT:
+        print(*args)
 
 # --- 3. 步進馬達加減速驅動類 ---
 class Stepper:
@@ -32,13 +42,23 @@ class Stepper:
         self.dir = machine.Pin(dir_pin, machine.Pin.OUT)
         self.step = machine.Pin(step_pin, machine.Pin.OUT)
         self.steps_per_mm = steps_per_mm
+        self.position = 0  # 絕對位置 (整數步數)，不受浮點距離換算漂移影響
         self.step.value(0)
         self.dir.value(0)
+    def to_steps(self, mm):
+        return int(round(mm * self.steps_per_mm))
+    def position_mm(self):
+        return self.position / self.steps_per_mm
     async def move_rel(self, distance_mm, max_speed, accel):
-        total_steps = int(abs(distance_mm) * self.steps_per_mm)
+        await self.move_steps(self.to_steps(distance_mm), max_speed, accel)
+    async def move_abs(self, target_mm, max_speed, accel):
+        await self.move_steps(self.to_steps(target_mm) - self.position, max_speed, accel)
+    async def move_steps(self, steps, max_speed, accel):
+        total_steps = abs(steps)
         if total_steps == 0:
             return
-        self.dir.value(1 if distance_mm < 0 else 0)
+        distance_mm = steps / self.steps_per_mm
+        self.dir.value(1 if steps < 0 else 0)
         max_speed_steps_s = max_speed * self.steps_per_mm
         accel_steps_s2 = accel * self.steps_per_mm
         accel_steps = int(0.5 * (max_speed_steps_s**2) / accel_steps_s2)
@@ -47,26 +67,31 @@ class Stepper:
         
         decel_start_step = total_steps - accel_steps
         
-        print(f"INFO: Moving {distance_mm}mm, {total_steps} steps.")
-        for i in range(total_steps):
-            step_count = i + 1
-            if step_count <= accel_steps:
-                speed = (max_speed_steps_s / accel_steps) * step_count
-            elif step_count > decel_start_step:
-                speed = max_speed_steps_s - (max_speed_steps_s / accel_steps) * (step_count - decel_start_step)
-            else:
-                speed = max_speed_steps_s
-            if speed > 0:
-                delay = 1_000_000 // int(speed)
-            else:
-                delay = 1_000_000
-            self.step.value(1)
-            time.sleep_us(2)
-            self.step.value(0)
-            time.sleep_us(max(2, delay))
+        log(f"INFO: Moving {distance_mm}mm, {total_steps} steps.")
+        done = 0
+        try:
+            for i in range(total_steps):
+                step_count = i + 1
+                if step_count <= accel_steps:
+                    speed = (max_speed_steps_s / accel_steps) * step_count
+                elif step_count > decel_start_step:
+                    speed = max_speed_steps_s - (max_speed_steps_s / accel_steps) * (step_count - decel_start_step)
+                else:
+                    speed = max_speed_steps_s
+                if speed > 0:
+                    delay = 1_000_000 // int(speed)
+                else:
+                    delay = 1_000_000
+                self.step.value(1)
+                time.sleep_us(2)
+                self.step.value(0)
+                done += 1
+                time.sleep_us(max(2, delay))
             
-            if i % 50 == 0:
-                await uasyncio.sleep_ms(0)
+                if i % 50 == 0:
+                    await uasyncio.sleep_ms(0)
+        finally:
+            self.position += done if steps > 0 else -done
 
 # --- 4. 全域變數 ---
 command_queue = AsyncQueue()
@@ -75,34 +100,51 @@ peel_lift_dist_mm = 5.0
 peel_return_dist_mm = 5.05
 
 # --- 5. 異步任務 ---
+async def client_loop(reader, writer):
+    """TCP 與串口共用的行讀取迴圈"""
+    while True:
+        try:
+            data = await reader.readline()
+            if data:
+                cmd = data.decode().strip()
+                await command_queue.put((cmd, writer))
+            else:
+                log("客戶端斷開連接")
+                break
+        except Exception as e:
+            log(f"讀取錯誤: {e}")
+            break
+
 async def tcp_server(host, port):
-    print(f"TCP 伺服器啟動於 {host}:{port}")
+    log(f"TCP 伺服器啟動於 {host}:{port}")
     async def handle_client(reader, writer):
-        print("客戶端已連接")
-        while True:
-            try:
-                data = await reader.readline()
-                if data:
-                    cmd = data.decode().strip()
-                    await command_queue.put((cmd, writer))
-                else:
-                    print("客戶端斷開連接")
-                    break
-            except Exception as e:
-                print(f"讀取錯誤: {e}")
-                break
+        log("客戶端已連接")
+        await client_loop(reader, writer)
         writer.close()
         await writer.wait_closed()
     await uasyncio.start_server(handle_client, host, port)
 
+async def serial_server():
+    import micropython
+    micropython.kbd_intr(-1)  # 避免串口上的 0x03 中斷程式
+    await client_loop(uasyncio.StreamReader(sys.stdin.buffer), uasyncio.StreamWriter(sys.stdout.buffer, {}))
+
 async def command_processor():
-    global peel_lift_dist_mm, peel_return_dist_mm
-    print("指令處理器已啟動")
+    global peel_lift_dist_mm, peel_return_dist_mm, TRAVEL_SPEED_MM_S, TRAVEL_ACCELERATION_MM_S2
+    log("指令處理器已啟動")
     while True:
         cmd, writer = await command_queue.get()
-        print(f"收到指令: {cmd}")
+        log(f"收到指令: {cmd}")
         response = ""
-        if cmd.startswith("CONFIG"):
+        if cmd.startswith("CONFIG_TRAVEL"):
+            try:
+                parts = cmd.split(',')
+                TRAVEL_SPEED_MM_S = float(parts[1])
+                TRAVEL_ACCELERATION_MM_S2 = float(parts[2])
+                response = "OK: Travel configured.\n"
+            except (IndexError, ValueError):
+                response = "ERROR: Invalid CONFIG_TRAVEL format.\n"
+        elif cmd.startswith("CONFIG"):
             try:
                 parts = cmd.split(',')
                 peel_lift_dist_mm = float(parts[1])
@@ -122,6 +164,22 @@ async def command_processor():
                 response = "DONE\n"
             except (IndexError, ValueError):
                 response = "ERROR: Invalid MOVE_REL format.\n"
+        elif cmd.startswith("MOVE_ABS"):
+            # MOVE_ABS,位置mm：以快速移動速度移動到絕對位置
+            try:
+                parts = cmd.split(',')
+                await stepper.move_abs(float(parts[1]), TRAVEL_SPEED_MM_S, TRAVEL_ACCELERATION_MM_S2)
+                response = f"DONE,{stepper.position_mm()}\n"
+            except (IndexError, ValueError):
+                response = "ERROR: Invalid MOVE_ABS format.\n"
+        elif cmd == "GET_POS":
+            response = f"POS,z={stepper.position}:{stepper.position_mm()}\n"
+        elif cmd.startswith("SET_POS"):
+            try:
+                stepper.position = stepper.to_steps(float(cmd.split(',')[1]))
+                response = "OK: Position set.\n"
+            except (IndexError, ValueError):
+                response = "ERROR: Invalid SET_POS format.\n"
 
         if response and writer:
             writer.write(response.encode())
@@ -132,12 +190,15 @@ async def main():
     host_ip = network.WLAN(network.STA_IF).ifconfig()[0]
     server_task = uasyncio.create_task(tcp_server(host_ip, 8899))
     processor_task = uasyncio.create_task(command_processor())
-    print("ESP32 Z-Axis Controller Ready.")
-    await uasyncio.gather(server_task, processor_task)
+    tasks = [server_task, processor_task]
+    if SERIAL_TRANSPORT:
+        tasks.append(uasyncio.create_task(serial_server()))
+    log("ESP32 Z-Axis Controller Ready.")
+    await uasyncio.gather(*tasks)
 
 # --- 6. 程式入口 ---
 if __name__ == "__main__":
     try:
         uasyncio.run(main())
     except KeyboardInterrupt:
-        print("Program stopped.")
\ No newline at end of file
+        log("Program stopped.")
\ No newline at end of file
@@ -0,0 +1,276 @@
+# fake_esp32.py - 模擬 ESP32 下位機的 TCP 應答器
+# 功能：在本機實作與韌體相同的行協議 (NEXT_LAYER / MOVE_REL / CONFIG_*)，供基準測試與離線除錯使用。
+# 用法: python fake_esp32.py [--port 8899] [--motion-scale 0.0]
+
+import time
+import threading
+from collections import deque
+import argparse
+import socketserver
+
+from layer_program import TRIGGER_BYTE
+
+
+# --- 1. 協議狀態機 ---
+class FakeESP32:
+    """
+    同時支援 main.py (四軸) 與 esp32/main.py (單 Z 軸) 兩種指令格式。
+    motion_scale > 0 時，依距離 / 速度估算並模擬運動耗時 (乘上此倍率)。
+    """
+
+    def __init__(self, motion_scale=0.0):
+        self.motion_scale = motion_scale
+        self.steps_per_mm = {'z': 200.0, 'a': 200.0, 'b': 200.0, 'c': 200.0}
+        self.params = {
+            'peel_lift_z1': 5.05, 'peel_return_z2': 5.0, 'z_speed_down': 20.0, 'z_speed_up': 20.0,
+            'wipe_dist': 50.0, 'wipe_speed_fast': 80.0, 'wipe_speed_slow': 10.0,
+            'b_speed_down': 2.0, 'b_speed_up': 2.0,
+        }
+        self.motion = {axis: ('linear', 0.0, 0.0) for axis in self.steps_per_mm}
+        self.position = {axis: 0 for axis in self.steps_per_mm}  # 整數步數，與韌體相同
+        self.travel = {axis: (20.0, 0.0) for axis in self.steps_per_mm}
+        self.single_z = False  # 收到舊版 CONFIG 後，NEXT_LAYER 依單 Z 軸韌體的方向計算位置
+        self.level_compensation_enabled = True
+        self.program = []
+        self.program_received = 0
+        self.program_default = None
+        self.program_cursor = 0
+        self.logs = deque(maxlen=256)  # 與韌體相同的 '<ticks_ms> <等級> 訊息' 紀錄
+        self.log_debug = False
+        self.config_hash = None  # CONFIG_BATCH 的版本雜湊 (韌體會存入快閃記憶體)
+        self.profiling = False
+        self.last_profile = {}  # PROFILE：模擬器沒有真實計時，回報理想值 (達成率 100%)
+        self.command_count = 0
+        self.lock = threading.Lock()
+
+    def _simulate_move(self, distance, speed):
+        if self.motion_scale > 0 and speed > 0:
+            time.sleep(abs(distance) / speed * self.motion_scale)
+
+    def _move(self, axis, distance, speed):
+        steps = int(round(distance * self.steps_per_mm[axis]))
+        self.position[axis] += steps
+        if self.profiling and steps and speed > 0:
+            sps = speed * self.steps_per_mm[axis]
+            self.last_profile[axis] = {'n': abs(steps), 'speed': sps, 'setup_us': 0.0, 'cmd_us': 1e6 / sps, 'act_us': 1e6 / sps,
+                                       'rate': 100.0, 'jitter_us': 0.0, 'max_late_us': 0.0, 'yield_us': 0.0,
+                                       'cruise_cmd_sps': sps, 'cruise_act_sps': sps}
+        self._simulate_move(distance, speed)
+
+    def _position_mm(self, axis):
+        return self.position[axis] / self.steps_per_mm[axis]
+
+    def handle(self, cmd):
+        """處理一行指令並回傳回覆 (不含換行)。"""
+        with self.lock:
+            self.command_count += 1
+        parts = cmd.strip().split(',')
+        command = parts[0].upper()
+        p = self.params
+        if self.log_debug and command != "LOGS":
+            self.logs.append(f"{int(time.monotonic() * 1000)} D 收到指令: {cmd.strip()}")
+        if command.startswith("CONFIG_") and command not in ("CONFIG_BATCH", "CONFIG_HASH"):
+            self.config_hash = None
+        try:
+            if command == "CONFIG_HASH":
+                return f"HASH,{self.config_hash or 'none'}"
+            if command == "CONFIG_BATCH":
+                _, version, batch = cmd.strip().split(',', 2)
+                for line in filter(None, batch.split(';')):
+                    if not line.upper().startswith("CONFIG_"):
+                        return f"ERROR: Not a config command: {line}"
+                    reply = self.handle(line)
+                    if not reply.startswith("OK"):
+                        return f"ERROR: Config failed: {line} -> {reply}"
+                self.config_hash = version
+                return f"OK: Config {version} saved."
+            if command == "CONFIG_AXIS":
+                axis, pulse_per_rev, lead = parts[1].lower(), float(parts[2]), float(parts[3])
+                if axis not in self.steps_per_mm:
+                    return "ERROR: Invalid axis."
+                self.steps_per_mm[axis] = pulse_per_rev / lead
+                return f"OK: Axis {axis} configured."
+            if command == "CONFIG_MOTION":
+                axis, profile = parts[1].lower(), parts[2].lower()
+                if axis not in self.steps_per_mm:
+                    return "ERROR: Invalid axis."
+                if profile not in ('linear', 'scurve'):
+                    return "ERROR: Invalid profile."
+                self.motion[axis] = (profile, float(parts[3]), float(parts[4]))
+                return f"OK: Axis {axis} motion {profile}."
+            if command == "CONFIG_Z_PEEL":
+                p['peel_lift_z1'], p['peel_return_z2'], p['z_speed_down'], p['z_speed_up'] = map(float, parts[1:5])
+                return "OK: Z peel params configured."
+            if command == "CONFIG_A_WIPE":
+                values = list(map(float, parts[1:]))
+                if len(values) == 3:
+                    p['wipe_dist'], p['wipe_speed_fast'], p['wipe_speed_slow'] = values
+                else:
+                    p['wipe_speed_fast'], p['wipe_speed_slow'] = values[:2]
+                return "OK: A wipe params configured."
+            if command == "CONFIG_B_LEVEL":
+                p['b_speed_down'], p['b_speed_up'] = map(float, parts[1:3])
+                return "OK: B level params configured."
+            if command == "CONFIG":
+                # 單 Z 軸舊版韌體: CONFIG,lift,return
+                p['peel_lift_z1'], p['peel_return_z2'] = float(parts[1]), float(parts[2])
+                self.single_z = True
+                return "OK: Config received."
+            if command == "NEXT_LAYER":
+                if self.single_z:
+                    self._move('z', p['peel_lift_z1'], 10.0)
+                    self._move('z', -p['peel_return_z2'], 10.0)
+                    return "DONE"
+                self._move('z', -p['peel_lift_z1'], p['z_speed_down'])
+                self._move('a', p['wipe_dist'], p['wipe_speed_fast'])
+                self._move('z', p['peel_return_z2'], p['z_speed_up'])
+                self._move('a', -p['wipe_dist'], p['wipe_speed_slow'])
+                return "DONE"
+            if command == "PROGRAM_BEGIN":
+                # 與韌體相同：預設步驟 + 依層號遞增的覆寫區段 (起-迄)
+                count = int(parts[1])
+                default = tuple(map(float, parts[2:7])) if len(parts) > 2 else None
+                self.program = [default] * count
+                self.program_received = self.program_cursor = 0
+                self.program_default = default
+                return f"OK: Program {count} steps."
+            if command == "PROGRAM_STEP":
+                first, _, last = parts[1].partition('-')
+                first = int(first)
+                last = int(last) if last else first
+                if first > last or last >= len(self.program):
+                    return "ERROR: Invalid program range."
+                self.program[first:last + 1] = [tuple(map(float, parts[2:7]))] * (last - first + 1)
+                self.program_received += last - first + 1
+                return "OK"
+            if command == "PROGRAM_END":
+                if self.program_default is None and self.program_received != len(self.program):
+                    return f"ERROR: Program incomplete ({self.program_received}/{len(self.program)})."
+                return "OK: Program ready."
+            if command == "STEP":
+                index = int(parts[1]) if len(parts) > 1 else self.program_cursor
+                if index >= len(self.program):
+                    return "ERROR: Program finished."
+                lift, ret, wipe, b_offset, _ = self.program[index]
+                self._move('z', -lift, p['z_speed_down'])
+                self._move('a', wipe, p['wipe_speed_fast'])
+                self._move('z', ret, p['z_speed_up'])
+                self._move('a', -wipe, p['wipe_speed_slow'])
+                self._move('b', b_offset, p['b_speed_up'])
+                self.program_cursor = index + 1
+                return f"STEP_DONE,{index}"
+            if command == "MOVE_REL":
+                if len(parts) == 2:
+                    self._move('z', float(parts[1]), 5.0)
+                    return "DONE"
+                axis, distance, speed = parts[1].lower(), float(parts[2]), float(parts[3])
+                if axis not in self.steps_per_mm:
+                    return "ERROR: Invalid axis."
+                self._move(axis, distance, speed)
+                return "DONE"
+            # 絕對定位：四軸韌體帶軸名 (MOVE_ABS,z,10[,speed])，單 Z 軸韌體不帶 (MOVE_ABS,10)
+            if command == "CONFIG_TRAVEL":
+                if parts[1].lower() in self.travel:
+                    self.travel[parts[1].lower()] = (float(parts[2]), float(parts[3]))
+                    return f"OK: Axis {parts[1].lower()} travel configured."
+                self.travel['z'] = (float(parts[1]), float(parts[2]))
+                return "OK: Travel configured."
+            if command == "MOVE_ABS":
+                axis, args = (parts[1].lower(), parts[2:]) if parts[1].lower() in self.position else ('z', parts[1:])
+                speed = float(args[1]) if len(args) > 1 else self.travel[axis][0]
+                self._move(axis, float(args[0]) - self._position_mm(axis), speed)
+                return f"DONE,{self._position_mm(axis)}"
+            if command == "GET_POS":
+                axes = [parts[1].lower()] if len(parts) > 1 else list(self.position)
+                if any(a not in self.position for a in axes):
+                    return "ERROR: Invalid axis."
+                return "POS," + ",".join(f"{a}={self.position[a]}:{self._position_mm(a)}" for a in axes)
+            if command == "SET_POS":
+                axis, value = (parts[1].lower(), parts[2]) if len(parts) > 2 else ('z', parts[1])
+                self.position[axis] = int(round(float(value) * self.steps_per_mm[axis]))
+                return "OK: Position set."
+            if command == "PROFILE":
+                arg = parts[1].upper() if len(parts) > 1 else ""
+                if arg in ("ON", "OFF"):
+                    self.profiling = arg == "ON"
+                    return f"OK: Profiling {arg.lower()}."
+                axes = [arg.lower()] if arg else list(self.position)
+                groups = [a + ":" + ":".join(f"{k}={v:.1f}" for k, v in self.last_profile[a].items())
+                          for a in axes if a in self.last_profile]
+                return "PROFILE," + ",".join(groups)
+            if command == "LOGS":
+                if len(parts) > 1 and parts[1].upper() == "CLEAR":
+                    self.logs.clear()
+                    return "OK: Logs cleared."
+                return "\n".join([f"LOGS,{len(self.logs)}"] + list(self.logs))
+            if command == "LOG_LEVEL":
+                self.log_debug = parts[1].upper() == "DEBUG"
+                return f"OK: Log level {parts[1].upper()}."
+            if command == "ENABLE_LEVEL_COMP":
+                self.level_compensation_enabled = int(parts[1]) == 1
+                status = "enabled" if self.level_compensation_enabled else "disabled"
+                return f"OK: Level compensation {status}."
+            return "ERROR: Unknown command."
+        except Exception as e:
+            return f"ERROR: Processing command failed: {e}"
+
+
+# --- 2. TCP 伺服器 ---
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            # 與韌體相同：行首的單一觸發字節代表 STEP
+            first = self.rfile.read(1)
+            if not first:
+                break
+            if first == TRIGGER_BYTE:
+                line = "STEP"
+            else:
+                line = (first + self.rfile.readline()).decode(errors='replace').strip()
+                if not line:
+                    continue
+            self.wfile.write((self.server.device.handle(line) + "\n").encode())
+
+
+class FakeESP32Server(socketserver.ThreadingTCPServer):
+    """在背景執行緒中運行；port=0 時由系統分配空閒埠號，見 self.address。"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, motion_scale=0.0, device=None):
+        super().__init__((host, port), _Handler)
+        self.device = device or FakeESP32(motion_scale)
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-esp32', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬 ESP32 下位機 (TCP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--motion-scale", type=float, default=0.0, help="模擬運動耗時的倍率 (0 = 立即完成)")
+    args = parser.parse_args()
+    server = FakeESP32Server(args.host, args.port, args.motion_scale)
+    print(f"模擬 ESP32 已啟動於 {server.address[0]}:{server.address[1]}，按 Ctrl+C 結束。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("模擬 ESP32 已停止。")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
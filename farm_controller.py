@@ -0,0 +1,531 @@
+# farm_controller.py - 多台打印機農場控制器 (asyncio 單進程版)
+# 功能：一個進程同時驅動 N 組 ESP32 + 投影儀，所有打印機共用切片解碼 / 縮放快取。
+# 用法: python farm_controller.py farm.json
+#
+# farm.json 範例:
+# {
+#   "cache": {"max_decoded": 32, "max_scaled": 64},
+#   "printers": [
+#     {"name": "P1", "esp32_ip": "10.10.17.187", "monitor_index": 1, "projector_port": 6001, "zip_path": "layers.zip",
+#      "remap_path": "remap_p1.npz", "flat_field_path": "flat_p1.npz", "normal_expo": 2.1,
+#      "light_engine": {"class": "light_engine_uia:UIALightEngine", "kwargs": {"window_title": "Full-HD UV LE Controller v2.1"}}},
+#     {"name": "P2", "esp32_ip": "10.10.17.188", "monitor_index": 2, "projector_port": 6002,
+#      "nest": [{"zip_path": "a.zip", "x": 0, "y": 0}, {"zip_path": "b.zip", "x": 900, "y": 0}], "nest_gap": 10,
+#      "light_engine": "main_controller_iic:HybridLightEngineControl"},
+#     {"name": "P3", "esp32_ip": "10.10.17.189", "zip_path": "big.zip", "projector_port": 6100,
+#      "tiles": {"monitors": [1, 2], "grid": "2x1", "tile": "1920x1080", "overlap": 120}, "light_engine": "manual"},
+#     {"name": "P4", "esp32_ip": "10.10.17.190", "monitor_index": 3, "projector_port": 6003, "zip_path": "fine.zip",
+#      "normal_expo": 2.0, "subframes": {"bulk": 0.8, "wall": 1.0, "thin": 1.3, "wall_px": 4, "thin_px": 3},
+#      "xy_compensation": {"offset_px": -1.5, "aa_px": 1}, "light_engine": "manual"},
+#     {"name": "P5", "esp32_ip": "10.10.17.191", "monitor_index": 4, "projector_port": 6004, "zip_path": "part.ctb",
+#      "protocol_trace_path": "p5.trace", "light_engine": "manual"}
+#   ]
+# }
+# light_engine 為每台打印機的光機 LED 控制："module:Class" 或 {"class": ..., "args": [...], "kwargs": {...}}，
+# 物件需有 led_on() / led_off()；"manual" 表示 LED 由操作者自行控制 (例如常亮)。未設定時啟動即報錯。
+# zip_path 也可以是切片軟體的原生格式 (.ctb / .cbddlp / .photon)，此時預設使用檔案內每層的曝光與抬升參數
+# (use_slice_meta 設為 false 則改用設定檔中的數值)。
+
+import os
+import sys
+import json
+import time
+import importlib
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from slice_source import open_slice_source, FrameCache, TransformChain
+from plate_nesting import build_nest
+from calibration import GeometricRemap
+from flat_field import FlatField
+from subframe_exposure import SubframeSplit, EachSubframe
+from xy_compensation import XYCompensation
+from tiled_display import TileLayout, TiledProjector, parse_pair
+from layer_program import build_layer_program, program_lines, TRIGGER_BYTE
+from motion_transport import open_transport
+from motion_config import config_lines, config_hash, batch_command
+from protocol_trace import TraceRecorder, TracedConnection
+from profiling import percentile
+from projector_client import launch_projector, connect_projector, update_message, frame_message, DEFAULT_AUTHKEY
+
+
+# --- 1. 每台打印機的預設參數 (與 main_gui.PrintConfig 一致) ---
+DEFAULT_PRINTER_PARAMS = {
+    'esp32_port': 8899, 'projector_host': 'localhost',
+    'z_pulse_rev': 12800.0, 'z_lead': 5.0, 'a_pulse_rev': 12800.0, 'a_lead': 75.0, 'c_pulse_rev': 12800.0, 'c_lead': 5.0,
+    'peel_lift_z1': 5.05, 'peel_return_z2': 5.0, 'z_speed_down': 20.0, 'z_speed_up': 20.0,
+    'a_fast_speed': 80.0, 'a_slow_speed': 10.0, 'use_layer_program': True, 'use_slice_meta': True,
+    'motion_profiles': {'z': ['scurve', 40.0, 400.0], 'a': ['scurve', 160.0, 1600.0], 'c': ['linear', 0.0, 0.0]},
+    'first_layer_expo': 5.0, 'normal_expo': 2.5, 'transition_layers': 5,
+}
+
+
+def load_light_engine(spec):
+    """依設定建立光機 LED 控制物件；"manual" 回傳 None (不切換 LED)。"""
+    if spec == 'manual':
+        return None
+    if isinstance(spec, str):
+        spec = {'class': spec}
+    module, _, name = spec['class'].partition(':')
+    target = getattr(importlib.import_module(module), name)
+    return target(*spec.get('args', []), **spec.get('kwargs', {}))
+
+
+def exposure_for_layer(layer_num, params):
+    """底層曝光 -> 過渡層線性遞減 -> 正常曝光，與單機腳本相同的計算方式。"""
+    first, normal, transition = params['first_layer_expo'], params['normal_expo'], params['transition_layers']
+    if layer_num == 1:
+        return first
+    if layer_num <= transition:
+        progress = (layer_num - 1) / (transition - 1)
+        return first - (first - normal) * progress
+    return normal
+
+
+# --- 2. 非同步 ESP32 運動客戶端 ---
+class AsyncMotionClient:
+    """
+    與四軸韌體 main.py 相同的行協議。TCP 以 asyncio stream 實作，不佔用執行緒；
+    esp32_ip 為 'serial:COM3' 時改用 USB 串口 (motion_transport.SerialTransport)，阻塞讀寫放在執行緒池中。
+    trace 為 protocol_trace.TraceRecorder 時記錄每筆送出與回覆。
+    """
+
+    def __init__(self, host, port, timeout=60, executor=None, trace=None):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.executor = executor
+        self.reader = None
+        self.writer = None
+        self.link = None
+        self.latencies = []
+        self.lock = asyncio.Lock()
+        self.trace = trace
+        self.stale = False  # 串口上有逾時的指令，遲到的回覆仍可能在緩衝區中
+
+    async def connect(self):
+        if self.host.startswith('serial:'):
+            self.link = await asyncio.get_running_loop().run_in_executor(
+                self.executor, open_transport, self.host, self.port, self.timeout)
+            return
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    def _serial_exchange(self, data, lines):
+        if self.stale:
+            # 丟棄上一筆逾時指令遲到的回覆，否則它會被當成這筆指令的回覆
+            self.link.discard_input()
+            self.stale = False
+        self.link.write(data)
+        replies = [self.link.readline() for _ in range(lines)]
+        if not replies[-1]:
+            self.stale = True
+            raise TimeoutError(f"ESP32 回覆逾時 ({self.timeout}s)")
+        return replies
+
+    async def exchange(self, data, lines=1):
+        """送出 data 並讀回 lines 行回覆，記錄整體往返時間。"""
+        async with self.lock:
+            if self.trace:
+                self.trace.record('motion', 'tx', data=data.decode('latin-1'))
+            t0 = time.perf_counter()
+            if self.link:
+                replies = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._serial_exchange, data, lines)
+            else:
+                self.writer.write(data)
+                await self.writer.drain()
+                try:
+                    replies = [(await asyncio.wait_for(self.reader.readline(), self.timeout)).decode().strip()
+                               for _ in range(lines)]
+                except asyncio.TimeoutError:
+                    # 遲到的回覆會被當成下一筆指令的回覆：關閉連線並重連，舊連線上的回覆一併丟棄
+                    self.writer.close()
+                    await self.connect()
+                    raise
+            self.latencies.append(time.perf_counter() - t0)
+            if self.trace:
+                for line in replies:
+                    self.trace.record('motion', 'rx', line=line)
+            return replies
+
+    async def request(self, cmd):
+        return (await self.exchange((cmd + "\n").encode()))[0]
+
+    async def configure(self, params):
+        """與 motion_config.sync_config 相同：雜湊相同時不重送，否則一筆 CONFIG_BATCH；舊版韌體逐條送出。"""
+        lines = config_lines(params)
+        version = config_hash(lines)
+        reply = await self.request("CONFIG_HASH")
+        if reply == f"HASH,{version}":
+            return True
+        if reply.startswith("HASH,"):
+            return (await self.request(batch_command(lines, version))).startswith("OK")
+        for line in lines:
+            if "OK" not in await self.request(line):
+                return False
+        return True
+
+    async def move_to_next_layer(self):
+        return "DONE" in await self.request("NEXT_LAYER")
+
+    async def upload_program(self, steps):
+        """一次寫出整個逐層程式再讀取所有回覆；任一行被拒 (含 PROGRAM_BEGIN) 即視為失敗。"""
+        lines = program_lines(steps)
+        replies = await self.exchange(("\n".join(lines) + "\n").encode(), len(lines))
+        return all(r.startswith("OK") for r in replies)
+
+    async def step_program(self):
+        return (await self.exchange(TRIGGER_BYTE))[0].startswith("STEP_DONE")
+
+    async def close(self):
+        if self.link:
+            self.link.close()
+        if self.writer:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+# --- 3. 投影通道 ---
+class ProjectorChannel:
+    """
+    每台打印機一個 projector_view.py 進程。
+    主進程送出已縮放好的像素 ('frame' 指令)，投影端不再自行解碼 PNG。
+    投影端保留最近一幀 (黑畫面不會清除)，相鄰層只送出有變化的矩形 ('patch' 指令)。
+    """
+
+    def __init__(self, monitor_index, address, executor, trace=None):
+        self.monitor_index = monitor_index
+        self.address = address
+        self.executor = executor
+        self.process = None
+        self.conn = None
+        self.size = None
+        # 投影端目前保留的幀
+        self.shown = None
+        self.trace = trace
+        self.seq = 0
+        self.ack_timeout = 5.0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.process = launch_projector(self.monitor_index, self.address, DEFAULT_AUTHKEY)
+        self.conn, ready = await loop.run_in_executor(self.executor, connect_projector, self.address, DEFAULT_AUTHKEY)
+        self.size = (ready['width'], ready['height'])
+        if self.trace:
+            self.conn = TracedConnection(self.conn, self.trace, 'projector', ready)
+
+    async def send(self, msg):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.conn.send, msg)
+
+    def _send_acked(self, msg):
+        """送出並等待對應 seq 的回報；投影端回報 'shown' 時回傳 True。"""
+        self.seq += 1
+        msg.update(ack=True, seq=self.seq)
+        self.conn.send(msg)
+        deadline = time.monotonic() + self.ack_timeout
+        while True:
+            if not self.conn.poll(max(0.0, deadline - time.monotonic())):
+                raise RuntimeError(f"投影進程未在 {self.ack_timeout}s 內回報畫面切換。")
+            reply = self.conn.recv()
+            if reply.get('seq') == self.seq:
+                return reply.get('status') == 'shown'
+
+    def prepare(self, frame, base):
+        """在執行緒池中算好 frame 相對 base 的更新指令，回傳 (base, 指令)。"""
+        return base, update_message(base, frame)
+
+    async def show_frame(self, frame, update=None):
+        """update 為 prepare() 預先算好的結果；其基準不是投影端目前保留的幀時重新計算。"""
+        if update is None or update[0] is not self.shown:
+            update = await asyncio.get_running_loop().run_in_executor(self.executor, self.prepare, frame, self.shown)
+        msg = update[1]
+        self.shown = None
+        if msg['command'] == 'patch':
+            # patch 要等投影端確認已套用；投影端沒有基準幀時不能照舊曝光上一層，改送完整幀
+            if not await asyncio.get_running_loop().run_in_executor(self.executor, self._send_acked, msg):
+                await self.send(frame_message(frame))
+        else:
+            await self.send(msg)
+        self.shown = frame
+
+    async def blank(self):
+        await self.send({'command': 'blank'})
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.send({'command': 'close'})
+            except OSError:
+                pass
+            self.conn.close()
+        if self.process:
+            self.process.terminate()
+
+
+class TiledChannel:
+    """拼接投影：與 ProjectorChannel 相同的介面，show_frame 收到的是 TileLayout 切好的分塊。"""
+
+    def __init__(self, layout, monitors, host, base_port, executor, trace=None):
+        self.projector = TiledProjector(layout, monitors, host, base_port)
+        self.executor = executor
+        self.size = layout.canvas_size
+        self.shown = None
+        self.trace = trace
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def open(self):
+        await self._run(self.projector.open)
+        if self.trace:
+            # 每個分塊一個通道：projector0、projector1 ...
+            self.projector.conns = [TracedConnection(conn, self.trace, f'projector{k}')
+                                    for k, conn in enumerate(self.projector.conns)]
+
+    def prepare(self, tiles, base):
+        """每個分塊各自與上一幀的同一分塊比較。"""
+        return base, [update_message(None if base is None else base[k], tile) for k, tile in enumerate(tiles)]
+
+    async def show_frame(self, tiles, update=None):
+        if update is None or update[0] is not self.shown:
+            update = await self._run(self.prepare, tiles, self.shown)
+        # 顯示失敗時投影端保留的幀未知，下一層改送完整分塊 (TiledProjector.show 已對 patch 被拒的情況重送完整分塊)
+        self.shown = None
+        await self._run(self.projector.show, tiles, update[1])
+        self.shown = tiles
+
+    async def blank(self):
+        await self._run(self.projector.blank)
+
+    def close(self):
+        self.projector.close()
+
+
+# --- 4. 單台打印機任務 ---
+class FarmPrinter:
+    def __init__(self, spec, cache, executor):
+        self.params = dict(DEFAULT_PRINTER_PARAMS, **spec)
+        self.name = self.params.get('name', self.params['esp32_ip'])
+        # 沒有曝光控制時 LED 不會隨層開關，必須明確指定 "manual" (由人工控制) 才允許啟動
+        if not self.params.get('light_engine'):
+            raise ValueError(f"{self.name}: 未設定 light_engine (光機 LED 控制)，若由人工控制請設為 \"manual\"。")
+        self.cache = cache
+        self.executor = executor
+        if 'nest' in self.params:
+            # 拼版任務：多個零件逐層合併後直接送入打印循環，不必先輸出壓縮包
+            self.source = build_nest([(n['zip_path'], n['x'], n['y']) for n in self.params['nest']],
+                                     gap=self.params.get('nest_gap', 0))
+        else:
+            self.source = open_slice_source(self.params['zip_path'])
+        # 協議追蹤 (protocol_trace.py)：記錄運動與投影的每筆指令、回覆與時間，供離線重播
+        self.trace = None
+        if self.params.get('protocol_trace_path'):
+            self.trace = TraceRecorder(self.params['protocol_trace_path'], meta={'controller': 'farm_controller',
+                                                                                  'printer': self.name})
+        self.motion = AsyncMotionClient(self.params['esp32_ip'], self.params['esp32_port'], executor=executor,
+                                        trace=self.trace)
+        tiles = self.params.get('tiles')
+        layout = None
+        if tiles:
+            # 拼接投影：切割與融合是最後一個投影空間處理，分塊結果隨縮放幀一起快取與預取
+            layout = TileLayout(parse_pair(tiles.get('tile', '1920x1080')), parse_pair(tiles.get('grid', '2x1')),
+                                tiles.get('overlap', 0), tiles.get('gamma', 1.0))
+            self.display = TiledChannel(layout, tiles['monitors'], self.params['projector_host'],
+                                        self.params['projector_port'], executor, self.trace)
+        else:
+            self.display = ProjectorChannel(self.params['monitor_index'],
+                                            (self.params['projector_host'], self.params['projector_port']), executor,
+                                            self.trace)
+        # 平場補償 (flat_field.py) 在成型面座標下先做，再以幾何校正 (calibration.py) 搬到顯示座標；
+        # 兩者都在幀進入快取時套用一次，曝光期間不再重算
+        self.transform = TransformChain([
+            FlatField.load(self.params['flat_field_path']) if self.params.get('flat_field_path') else None,
+            GeometricRemap.load(self.params['remap_path']) if self.params.get('remap_path') else None,
+            layout,
+        ]) or None
+        # 多段曝光：分區在成型面座標下先做，其餘處理逐一套用到每個子幀，整組子幀隨縮放幀一起快取與預取
+        self.subframes = SubframeSplit.from_params(self.params['subframes']) if self.params.get('subframes') else None
+        if self.subframes:
+            self.transform = TransformChain([self.subframes, EachSubframe(self.transform) if self.transform else None])
+        # XY 尺寸補償改變的是零件輪廓，放在所有處理之前 (多段曝光的分區也以補償後的輪廓計算)
+        xy = XYCompensation.from_params(self.params['xy_compensation']) if self.params.get('xy_compensation') else None
+        if xy:
+            self.transform = TransformChain([xy, self.transform])
+        self.light_engine = load_light_engine(self.params['light_engine'])
+        self.led_future = None
+        self.layer = 0
+        self.status = "等待中"
+        self.started_at = None
+
+    @property
+    def total_layers(self):
+        return len(self.source)
+
+    async def _led(self, on):
+        if self.light_engine:
+            # 保留執行緒池中的工作：被取消時它仍會執行完，關燈前要先等它結束
+            self.led_future = self.executor.submit(self.light_engine.led_on if on else self.light_engine.led_off)
+            await asyncio.wrap_future(self.led_future)
+
+    async def _frame(self, index, base=None):
+        """
+        回傳 (幀, 更新指令)。預取時順便在執行緒池中算出相對上一層 base 的變化矩形，
+        曝光結束後送出的只是變化區域；多段曝光的子幀在顯示時才逐幀比較。
+        """
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(
+            self.executor, self.cache.scaled, self.source, index, self.display.size, self.transform)
+        if self.subframes:
+            return frame, None
+        return frame, await loop.run_in_executor(self.executor, self.display.prepare, frame, base)
+
+    async def _expose_subframes(self, planes, exposure_time):
+        """
+        依序顯示子幀，LED 全程開啟；以第一幀開始的時刻為基準排定切換時間，顯示延遲不會累積。
+        底層與過渡層只顯示包含全部區域的第一幀，維持原本的曝光時間。
+        """
+        if self.layer <= self.params['transition_layers']:
+            schedule = [(planes[0], exposure_time)]
+        else:
+            schedule = list(zip(planes, self.subframes.durations(exposure_time, len(planes))))
+            self.status = f"曝光 {len(schedule)} 段 {sum(d for _, d in schedule):.2f}s"
+        await self.display.show_frame(schedule[0][0])
+        await self._led(True)
+        start = time.monotonic()
+        elapsed = 0.0
+        for k, (plane, seconds) in enumerate(schedule):
+            if k:
+                await self.display.show_frame(plane)
+            elapsed += seconds
+            await asyncio.sleep(max(0.0, start + elapsed - time.monotonic()))
+
+    async def run(self):
+        try:
+            self.status = "連接中"
+            await asyncio.gather(self.motion.connect(), self.display.open())
+            if not await self.motion.configure(self.params):
+                raise RuntimeError("ESP32 配置失敗")
+            use_program = self.params['use_layer_program']
+            if use_program:
+                steps = build_layer_program(self.total_layers, self.params,
+                                            layer_meta=self.source.layer_meta if self.params['use_slice_meta'] else None)
+                if not await self.motion.upload_program(steps):
+                    # 韌體不支援或記憶體不足：改回逐層 NEXT_LAYER，打印照常進行
+                    use_program = False
+                    self.status = "逐層程式被拒，改用 NEXT_LAYER"
+            await self.display.blank()
+            self.started_at = time.monotonic()
+            next_frame = asyncio.ensure_future(self._frame(0))
+            for i in range(self.total_layers):
+                self.layer = i + 1
+                frame, update = await next_frame
+                # 曝光期間預先準備下一層
+                if i + 1 < self.total_layers:
+                    next_frame = asyncio.ensure_future(self._frame(i + 1, frame))
+                meta = self.source.layer_meta(i) if self.params['use_slice_meta'] else {}
+                exposure_time = meta.get('exposure_s') or exposure_for_layer(self.layer, self.params)
+                self.status = f"曝光 {exposure_time:.2f}s"
+                if self.subframes:
+                    await self._expose_subframes(frame, exposure_time)
+                else:
+                    await self.display.show_frame(frame, update)
+                    await self._led(True)
+                    await asyncio.sleep(exposure_time)
+                await self._led(False)
+                await self.display.blank()
+                if self.layer < self.total_layers:
+                    self.status = "層間運動"
+                    moved = await (self.motion.step_program() if use_program else self.motion.move_to_next_layer())
+                    if not moved:
+                        raise RuntimeError("層間運動失敗")
+            self.status = "完成"
+        except asyncio.CancelledError:
+            self.status = "已取消"
+            raise
+        except Exception as e:
+            self.status = f"錯誤: {e}"
+        finally:
+            # 曝光中出錯或被取消時 LED 可能仍亮著，會固化整槽樹脂：先直接關燈 (不經執行緒池，
+            # 取消時事件循環可能已在關閉)，再關閉其他資源
+            if self.light_engine:
+                try:
+                    if self.led_future:
+                        self.led_future.exception(timeout=10)
+                    self.light_engine.led_off()
+                except Exception as e:
+                    self.status += f" (關閉 LED 失敗: {e})"
+            await self.motion.close()
+            self.display.close()
+            self.source.close()
+            if self.light_engine:
+                self.light_engine.close()
+            if self.trace:
+                self.trace.close()
+
+    def progress_line(self):
+        pct = 100.0 * self.layer / self.total_layers
+        eta = ""
+        if self.started_at and self.layer > 1:
+            per_layer = (time.monotonic() - self.started_at) / (self.layer - 1)
+            eta = f"剩餘 ~{per_layer * (self.total_layers - self.layer + 1) / 60:.1f} 分"
+        rtt = ""
+        if self.motion.latencies:
+            rtt = f"往返 p50 {1000.0 * percentile(sorted(self.motion.latencies[-100:]), 50):.1f}ms"
+        return f"{self.name:<10s} {self.layer:>5d}/{self.total_layers:<5d} {pct:5.1f}%  {self.status:<16s} {eta} {rtt}"
+
+
+# --- 5. 農場引擎 ---
+class FarmEngine:
+    """
+    單一事件迴圈 + 共用執行緒池 + 共用幀快取。
+    每多一台打印機只多一條 TCP 連線與一個投影進程；相同切片只解碼、縮放一次。
+    """
+
+    def __init__(self, printer_specs, max_decoded=32, max_scaled=64, workers=None):
+        self.cache = FrameCache(max_decoded, max_scaled)
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 2) + 2))
+        self.printers = [FarmPrinter(spec, self.cache, self.executor) for spec in printer_specs]
+
+    async def _progress(self, interval):
+        while True:
+            self.print_progress()
+            await asyncio.sleep(interval)
+
+    def print_progress(self):
+        lines = [p.progress_line() for p in self.printers]
+        stats = self.cache.stats()
+        lines.append(f"快取: 縮放命中 {stats['scaled_hits']} / 未命中 {stats['scaled_misses']}，佔用 {stats['megabytes']:.1f} MB")
+        # 以 ANSI 游標上移覆寫上一輪的輸出
+        sys.stdout.write("\x1b[2K" + "\n\x1b[2K".join(lines) + f"\x1b[{len(lines) - 1}F")
+        sys.stdout.flush()
+
+    async def run(self, progress_interval=1.0):
+        progress = asyncio.ensure_future(self._progress(progress_interval))
+        try:
+            await asyncio.gather(*(p.run() for p in self.printers))
+        finally:
+            progress.cancel()
+            self.print_progress()
+            sys.stdout.write("\n" * len(self.printers) + "\n")
+            self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多台 DLP 打印機農場控制器")
+    parser.add_argument("config", help="農場設定檔 (JSON)")
+    parser.add_argument("--interval", type=float, default=1.0, help="進度刷新間隔 (秒)")
+    args = parser.parse_args()
+    with open(args.config, 'r', encoding='utf-8') as f:
+        farm = json.load(f)
+    engine = FarmEngine(farm['printers'], **farm.get('cache', {}))
+    print(f"農場啟動: {len(engine.printers)} 台打印機")
+    try:
+        asyncio.run(engine.run(args.interval))
+    except KeyboardInterrupt:
+        print("\n農場任務被用戶終止。")
+    for p in engine.printers:
+        print(f"{p.name}: {p.status}")
+
+
+if __name__ == "__main__":
+    main()
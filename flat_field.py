@@ -0,0 +1,109 @@
+# flat_field.py - 光強均勻度補償 (平場校正)
+# 功能：依實測光強分佈衰減較亮區域的灰階值，使整個成型面的曝光劑量一致。
+# 用法:
+#   python flat_field.py build measured.csv --size 1920x1080 --reference mean -o flat.npz
+#   measured 可為 CSV 網格 (光強計讀數)、.npy 陣列或灰階照片；會以雙線性插值放大到投影尺寸。
+
+import zlib
+import argparse
+
+import numpy as np
+
+
+def load_intensity_map(path):
+    """讀取實測光強分佈，回傳 float64 陣列 (相對值即可)。"""
+    lower = path.lower()
+    if lower.endswith('.csv'):
+        return np.loadtxt(path, delimiter=',', dtype=np.float64, ndmin=2)
+    if lower.endswith('.npy'):
+        return np.load(path).astype(np.float64)
+    from PIL import Image
+    with Image.open(path) as img:
+        return np.asarray(img.convert('F'), dtype=np.float64)
+
+
+def resize_map(intensity, size):
+    """以雙線性插值把光強分佈縮放到投影尺寸。"""
+    from PIL import Image
+    if (intensity.shape[1], intensity.shape[0]) == tuple(size):
+        return intensity
+    img = Image.fromarray(intensity.astype(np.float32), mode='F')
+    return np.asarray(img.resize(tuple(size), Image.Resampling.BILINEAR), dtype=np.float64)
+
+
+class FlatField:
+    """
+    每個像素的衰減係數 (<= 1)，以 8.8 定點數儲存，套用時為一次整數乘法與位移。
+    reference 為目標光強：
+    - 'min' : 全部衰減到最暗處，劑量完全一致，曝光時間維持原本以最暗處設定的值。
+    - 'mean': 衰減到平均光強，曝光時間可依平均光強設定 (縮短為 min/mean 倍)；
+              比平均暗的區域無法提亮，會略為欠曝，建議搭配 stats() 檢查。
+    - 數字  : 以該百分位數的光強為目標。
+    """
+
+    def __init__(self, gain_q8, reference_level, stats=None):
+        self.gain_q8 = gain_q8
+        self.reference_level = reference_level
+        self.info = stats or {}
+        self.size = (gain_q8.shape[1], gain_q8.shape[0])
+        self.key = f"flat:{self.size}:{zlib.crc32(gain_q8.tobytes()):08x}"
+
+    @classmethod
+    def from_intensity(cls, intensity, size, reference='mean'):
+        intensity = resize_map(intensity, size)
+        intensity = np.clip(intensity, intensity.max() * 1e-3, None)
+        if reference == 'min':
+            level = intensity.min()
+        elif reference == 'mean':
+            level = intensity.mean()
+        else:
+            level = np.percentile(intensity, float(reference))
+        gain = np.minimum(1.0, level / intensity)
+        stats = {
+            'min': float(intensity.min()), 'mean': float(intensity.mean()), 'max': float(intensity.max()),
+            'reference': float(level),
+            # 曝光時間相對於「以最暗處設定」的倍率
+            'exposure_scale': float(intensity.min() / level),
+            # 比目標暗、無法補償的面積比例與最大欠曝程度
+            'under_area_fraction': float((intensity < level).mean()),
+            'worst_under_dose': float(intensity.min() / level),
+        }
+        gain_q8 = np.rint(gain * 256.0).astype(np.uint16)
+        return cls(gain_q8, float(level), stats)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['gain_q8'], float(data['reference_level']))
+
+    def save(self, path):
+        np.savez_compressed(path, gain_q8=self.gain_q8, reference_level=self.reference_level)
+
+    def __call__(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            raise ValueError(f"幀尺寸 {frame.shape[1]}x{frame.shape[0]} 與平場表 {self.size[0]}x{self.size[1]} 不符。")
+        return ((frame.astype(np.uint16) * self.gain_q8 + 128) >> 8).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立光強均勻度補償表")
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('build', help="由實測光強分佈建立補償表")
+    b.add_argument('measured', help="CSV 網格、.npy 或灰階照片")
+    b.add_argument('--size', default='1920x1080', help="投影尺寸 WxH")
+    b.add_argument('--reference', default='mean', help="目標光強: min / mean / 百分位數 (例如 25)")
+    b.add_argument('-o', '--output', default='flat.npz')
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    flat = FlatField.from_intensity(load_intensity_map(args.measured), size, args.reference)
+    s = flat.info
+    print(f"光強 最小 {s['min']:.3f} / 平均 {s['mean']:.3f} / 最大 {s['max']:.3f}，目標 {s['reference']:.3f}")
+    print(f"曝光時間可調整為原本 (以最暗處設定) 的 {s['exposure_scale']:.3f} 倍")
+    if s['under_area_fraction'] > 0:
+        print(f"注意: {100 * s['under_area_fraction']:.1f}% 的面積比目標暗，最暗處劑量為目標的 {100 * s['worst_under_dose']:.1f}%")
+    flat.save(args.output)
+    print(f"補償表已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
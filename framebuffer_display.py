@@ -0,0 +1,242 @@
+# framebuffer_display.py - Linux framebuffer 直接輸出
+# 功能：不經過 Tk / Qt 事件循環，把灰階切片直接寫入記憶體映射的 /dev/fbN，
+#       以雙緩衝 + 頁面切換 (FBIOPAN_DISPLAY) 顯示，適合無桌面環境的 Linux 上位機。
+#       每頁記住目前的內容，只轉換並寫入有變化的矩形。
+#       device 指向一般檔案時以檔案模擬 framebuffer (需指定 size)，可離線測試。
+# 用法:
+#   python framebuffer_display.py /dev/fb1 temp_layers/1.png
+#   python framebuffer_display.py fake_fb.raw temp_layers/1.png --size 1920x1080 --bpp 32
+
+import os
+import mmap
+import stat
+import struct
+import argparse
+
+import numpy as np
+
+from slice_source import scale_frame
+from projector_client import dirty_rects
+
+FBIOGET_VSCREENINFO = 0x4600
+FBIOPUT_VSCREENINFO = 0x4601
+FBIOGET_FSCREENINFO = 0x4602
+FBIOPAN_DISPLAY = 0x4606
+FBIO_WAITFORVSYNC = 0x40044620
+
+# struct fb_var_screeninfo 共 40 個 u32：
+# 0 xres, 1 yres, 2 xres_virtual, 3 yres_virtual, 4 xoffset, 5 yoffset, 6 bits_per_pixel, 7 grayscale,
+# 8-10 red (offset, length, msb_right), 11-13 green, 14-16 blue, 17-19 transp, 20- 其餘時序欄位
+_VAR_FORMAT = '=40I'
+# struct fb_fix_screeninfo 前段：id, smem_start, smem_len, type, type_aux, visual, xpanstep, ypanstep, ywrapstep, line_length
+_FIX_FORMAT = '@16sLIIIIHHHI'
+
+# 一般檔案模擬時的預設像素格式：(offset, length) for red / green / blue / transp
+_DEFAULT_BITFIELDS = {
+    8: ((0, 8), (0, 8), (0, 8), (0, 0)),
+    16: ((11, 5), (5, 6), (0, 5), (0, 0)),
+    24: ((16, 8), (8, 8), (0, 8), (0, 0)),
+    32: ((16, 8), (8, 8), (0, 8), (24, 8)),
+}
+
+
+def pixel_lut(bpp, bitfields):
+    """灰階 0-255 -> framebuffer 像素值的查找表；24 bpp 回傳 (256, 3) 的位元組。"""
+    gray = np.arange(256, dtype=np.uint32)
+    if bpp == 8:
+        return gray.astype(np.uint8)
+    value = np.zeros(256, dtype=np.uint32)
+    for offset, length in bitfields[:3]:
+        if length:
+            value |= (gray >> (8 - length)) << offset
+    t_offset, t_length = bitfields[3]
+    if t_length:
+        value |= np.uint32(((1 << t_length) - 1) << t_offset)
+    if bpp == 16:
+        return value.astype(np.uint16)
+    if bpp == 24:
+        return np.stack([(value >> (8 * k)) & 0xFF for k in range(3)], axis=1).astype(np.uint8)
+    return value
+
+
+class FramebufferDisplay:
+    """
+    介面與 main_controller.ProjectorDisplay 相同 (show_image / blank_screen / close)，
+    另提供 show_frame(frame) 直接顯示 HxW uint8 陣列。
+    虛擬解析度可容納兩頁時使用雙緩衝：寫入後頁再切換顯示；否則直接寫入可見頁。
+    變化面積超過 max_fraction 或頁面內容未知時整頁寫入。
+    """
+
+    def __init__(self, device='/dev/fb0', size=None, bpp=None, wait_vsync=True, max_fraction=0.5):
+        self.device = device
+        # 只有明確指定 size，或路徑本來就是一般檔案時才以檔案模擬；裝置不存在時不可在裝置路徑建立檔案
+        exists = os.path.exists(device)
+        self.is_file = stat.S_ISREG(os.stat(device).st_mode) if exists else size is not None
+        if not exists and not self.is_file:
+            raise FileNotFoundError(f"找不到 framebuffer 裝置 {device}。")
+        if self.is_file and size is None:
+            raise ValueError("以一般檔案模擬 framebuffer 時需要指定 size。")
+        self.fd = os.open(device, os.O_RDWR | (os.O_CREAT if self.is_file and not exists else 0))
+        self.wait_vsync = wait_vsync and not self.is_file
+        if self.is_file:
+            self._init_file(size, bpp or 8)
+        else:
+            self._init_device()
+        self.bytes_per_pixel = self.bpp // 8
+        self.pages = 2 if self.yres_virtual >= 2 * self.height else 1
+        self.mm = mmap.mmap(self.fd, self.line_length * self.yres_virtual,
+                            mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.rows = np.frombuffer(self.mm, dtype=np.uint8).reshape(self.yres_virtual, self.line_length)
+        self.lut = pixel_lut(self.bpp, self.bitfields)
+        self.front = self.var[5] // self.height if self.pages == 2 else 0
+        self.max_fraction = max_fraction
+        # 每頁目前寫入的灰階幀 (None 表示未知)
+        self.page_frames = [None] * self.pages
+        self.black = np.zeros((self.height, self.width), dtype=np.uint8)
+        print(f"Framebuffer {device}: {self.width}x{self.height} {self.bpp}bpp，"
+              f"{'雙緩衝' if self.pages == 2 else '單緩衝'}。")
+        self.blank_screen()
+
+    # --- 初始化 ---
+    def _init_file(self, size, bpp):
+        self.width, self.height = size
+        self.bpp = bpp
+        self.bitfields = _DEFAULT_BITFIELDS[bpp]
+        self.line_length = self.width * bpp // 8
+        self.yres_virtual = 2 * self.height
+        os.ftruncate(self.fd, self.line_length * self.yres_virtual)
+        self.var = [self.width, self.height, self.width, self.yres_virtual, 0, 0, bpp, 0] + [0] * 32
+
+    def _read_var(self):
+        import fcntl
+        buf = bytearray(struct.calcsize(_VAR_FORMAT))
+        fcntl.ioctl(self.fd, FBIOGET_VSCREENINFO, buf, True)
+        return list(struct.unpack(_VAR_FORMAT, buf))
+
+    def _init_device(self):
+        import fcntl
+        self.var = self._read_var()
+        if self.var[3] < 2 * self.var[1]:
+            # 嘗試把虛擬高度加倍以取得第二頁；驅動不支援時維持單緩衝
+            want = list(self.var)
+            want[3] = 2 * want[1]
+            try:
+                fcntl.ioctl(self.fd, FBIOPUT_VSCREENINFO, struct.pack(_VAR_FORMAT, *want))
+                self.var = self._read_var()
+            except OSError:
+                pass
+        fix = bytearray(128)
+        fcntl.ioctl(self.fd, FBIOGET_FSCREENINFO, fix, True)
+        self.line_length = struct.unpack_from(_FIX_FORMAT, fix)[-1]
+        self.width, self.height, self.yres_virtual, self.bpp = self.var[0], self.var[1], self.var[3], self.var[6]
+        v = self.var
+        self.bitfields = ((v[8], v[9]), (v[11], v[12]), (v[14], v[15]), (v[17], v[18]))
+        if self.bpp not in (8, 16, 24, 32):
+            raise RuntimeError(f"不支援的像素格式: {self.bpp} bpp")
+
+    # --- 寫入與切換 ---
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def _page(self, page):
+        rows = self.rows[page * self.height:(page + 1) * self.height, :self.width * self.bytes_per_pixel]
+        if self.bpp == 24:
+            return rows.reshape(self.height, self.width, 3)
+        return rows.view(self.lut.dtype)
+
+    def _flip(self, page):
+        if self.pages == 2 and not self.is_file:
+            import fcntl
+            if self.wait_vsync:
+                try:
+                    fcntl.ioctl(self.fd, FBIO_WAITFORVSYNC, struct.pack('I', 0))
+                except OSError:
+                    self.wait_vsync = False
+            self.var[4], self.var[5] = 0, page * self.height
+            fcntl.ioctl(self.fd, FBIOPAN_DISPLAY, struct.pack(_VAR_FORMAT, *self.var))
+        self.front = page
+
+    def _write(self, page, frame):
+        """與該頁現有內容比較，只把變化的矩形經查找表轉換後寫入。"""
+        base = self.page_frames[page]
+        target = self._page(page)
+        rects = None if base is None else dirty_rects(base, frame)
+        if rects is None or sum(w * h for _, _, w, h in rects) > self.max_fraction * frame.size:
+            target[:] = self.lut[frame]
+        else:
+            for x, y, w, h in rects:
+                target[y:y + h, x:x + w] = self.lut[frame[y:y + h, x:x + w]]
+        # 保存副本，呼叫端之後改寫陣列也不影響下次比較
+        self.page_frames[page] = frame if frame is self.black else frame.copy()
+
+    def present_frame(self, frame):
+        """frame 須與螢幕尺寸相同；寫入後頁 (單緩衝時為可見頁) 並切換。"""
+        page = (self.front + 1) % self.pages
+        self._write(page, frame)
+        self._flip(page)
+
+    def read_front(self):
+        """讀回目前可見頁的原始像素 (測試與除錯用)。"""
+        return self._page(self.front).copy()
+
+    def show_frame(self, frame):
+        self.present_frame(scale_frame(frame, self.size))
+
+    # --- 與 ProjectorDisplay 相同的介面 ---
+    def load_image(self, image_path):
+        from PIL import Image
+        with Image.open(image_path) as img:
+            return np.asarray(img.convert('L'))
+
+    def scale_image(self, frame):
+        return scale_frame(frame, self.size)
+
+    def present(self, frame):
+        self.present_frame(frame)
+
+    def show_image(self, image_path, profiler=None):
+        try:
+            if profiler is None:
+                self.present(self.scale_image(self.load_image(image_path)))
+                return
+            with profiler.phase('load'):
+                frame = self.load_image(image_path)
+            with profiler.phase('scale'):
+                frame = self.scale_image(frame)
+            with profiler.phase('display'):
+                self.present(frame)
+        except Exception as e:
+            print(f"顯示圖片錯誤: {e}")
+
+    def blank_screen(self):
+        page = (self.front + 1) % self.pages
+        self._write(page, self.black)
+        self._flip(page)
+
+    def close(self):
+        self.rows = None
+        self.mm.close()
+        os.close(self.fd)
+        print("Framebuffer 已關閉。")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="直接寫入 Linux framebuffer 顯示切片")
+    parser.add_argument('device', help="/dev/fbN 或用於模擬的一般檔案")
+    parser.add_argument('image')
+    parser.add_argument('--size', help="模擬檔案的尺寸 WxH")
+    parser.add_argument('--bpp', type=int, default=8, choices=(8, 16, 24, 32), help="模擬檔案的像素位元數")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x')) if args.size else None
+    display = FramebufferDisplay(args.device, size, args.bpp)
+    try:
+        display.show_image(args.image)
+        input("已顯示，按 Enter 結束...")
+    finally:
+        display.blank_screen()
+        display.close()
+
+
+if __name__ == "__main__":
+    main()
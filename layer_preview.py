@@ -0,0 +1,308 @@
+# layer_preview.py - main_gui 的切片預覽面板
+# 功能：選擇層號時在背景執行緒池 (QThreadPool) 解碼並縮小成預覽圖，結果放進小型 LRU；
+#       縮圖列只顯示目前層附近的幾層，捲動時取消尚未開始的舊請求。
+#       另有一個低優先的掃描工作逐層計算亮起面積 (每層一次陣列加總)，畫成面積曲線，點擊曲線可跳到該層。
+#       GUI 執行緒只做 QImage 轉換與繪圖，數千層的任務也不會卡住介面。
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from PyQt5.QtWidgets import (QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QListWidget, QListWidgetItem,
+                             QListView, QWidget, QSizePolicy)
+from PyQt5.QtGui import QImage, QPixmap, QIcon, QPainter, QColor, QPen, QPolygonF
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, QSize, QPointF, pyqtSignal
+
+PREVIEW_SIZE = (320, 180)
+STRIP_RADIUS = 6
+SCAN_CHUNK = 32
+
+
+def downsample(frame, size):
+    """以區塊平均縮小到不超過 size=(width, height)，純陣列運算 (不需 PIL)。"""
+    h, w = frame.shape[:2]
+    factor = max(1, -(-w // size[0]), -(-h // size[1]))
+    if factor == 1:
+        return frame
+    h2, w2 = h // factor * factor, w // factor * factor
+    blocks = frame[:h2, :w2].reshape(h2 // factor, factor, w2 // factor, factor)
+    return blocks.mean(axis=(1, 3)).astype(np.uint8)
+
+
+def layer_area(frame):
+    """亮起面積 (像素)，灰階邊緣依亮度計入部分面積。"""
+    return float(frame.sum(dtype=np.uint64)) / 255.0
+
+
+def to_qimage(frame):
+    height, width = frame.shape[:2]
+    return QImage(np.ascontiguousarray(frame).tobytes(), width, height, width, QImage.Format_Grayscale8).copy()
+
+
+# --- 1. 背景工作 ---
+class _Signals(QObject):
+    preview_ready = pyqtSignal(int, int, object, str)   # (世代, 層號, 預覽陣列 (失敗時為 None), 錯誤訊息)
+    scan_progress = pyqtSignal(int)
+
+
+class _PreviewTask(QRunnable):
+    def __init__(self, pane, generation, index):
+        super().__init__()
+        self.pane, self.generation, self.index = pane, generation, index
+
+    def run(self):
+        if self.generation != self.pane.generation:
+            return
+        try:
+            frame, error = downsample(self.pane.source.decode(self.index), PREVIEW_SIZE), ""
+        except Exception as e:
+            frame, error = None, str(e)
+        self.pane.signals.preview_ready.emit(self.generation, self.index, frame, error)
+
+
+class _ScanTask(QRunnable):
+    """計算一段連續層的面積，直接寫入預先配置的陣列 (各工作的區段互不重疊)。"""
+
+    def __init__(self, pane, generation, start, stop):
+        super().__init__()
+        self.pane, self.generation, self.start, self.stop = pane, generation, start, stop
+
+    def run(self):
+        areas = self.pane.areas
+        for i in range(self.start, self.stop):
+            if self.generation != self.pane.generation:
+                return
+            try:
+                areas[i] = layer_area(self.pane.source.decode(i))
+            except Exception:
+                areas[i] = 0.0
+        self.pane.signals.scan_progress.emit(self.generation)
+
+
+# --- 2. 面積曲線 ---
+class AreaPlot(QWidget):
+    """以 QPolygonF 畫出每層面積；寬度小於層數時每個像素取該區段的最大值。"""
+    layer_clicked = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.areas = None
+        self.current = 0
+        self.setMinimumHeight(80)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
+    def set_areas(self, areas):
+        self.areas = areas
+        self.update()
+
+    def set_current(self, index):
+        self.current = index
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(20, 20, 20))
+        if self.areas is None or not len(self.areas):
+            return
+        w, h = self.width(), self.height()
+        n = len(self.areas)
+        values = np.nan_to_num(self.areas, nan=0.0)
+        columns = min(w, n)
+        # 每個像素欄一個區段，以 reduceat 一次取各區段最大值
+        edges = np.linspace(0, n, columns + 1).astype(np.int64)[:-1]
+        peaks = np.maximum.reduceat(values, edges)
+        top = max(float(peaks.max()), 1.0)
+        xs = np.linspace(0, w - 1, columns)
+        ys = h - 2 - (h - 4) * peaks / top
+        painter.setPen(QPen(QColor(80, 200, 255)))
+        painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)]))
+        painter.setPen(QPen(QColor(255, 160, 0)))
+        x = (w - 1) * self.current / max(n - 1, 1)
+        painter.drawLine(QPointF(x, 0), QPointF(x, h))
+
+    def mousePressEvent(self, event):
+        if self.areas is not None and len(self.areas):
+            n = len(self.areas)
+            self.layer_clicked.emit(min(n - 1, max(0, int(round(event.x() / max(self.width() - 1, 1) * (n - 1))))))
+
+
+# --- 3. 預覽面板 ---
+class LayerPreviewPane(QGroupBox):
+    def __init__(self, cache_size=96, workers=None):
+        super().__init__("切片預覽")
+        self.source = None
+        self.generation = 0
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.pending = set()
+        self.areas = None
+        self.lock = threading.Lock()
+        self.signals = _Signals()
+        self.signals.preview_ready.connect(self._on_preview)
+        self.signals.scan_progress.connect(self._on_scan_progress)
+        # 預覽與掃描分開兩個執行緒池，掃描只用一個執行緒，不會搶走預覽的工作者
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(workers or max(1, min(4, (os.cpu_count() or 2) - 1)))
+        self.scan_pool = QThreadPool()
+        self.scan_pool.setMaxThreadCount(1)
+
+        self.image_label = QLabel("未載入切片")
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.setFixedSize(*PREVIEW_SIZE)
+        self.image_label.setStyleSheet("background: black; color: gray;")
+        self.info_label = QLabel("")
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setEnabled(False)
+        self.slider.valueChanged.connect(self.show_layer)
+        self.strip = QListWidget()
+        self.strip.setViewMode(QListView.IconMode)
+        self.strip.setFlow(QListView.LeftToRight)
+        self.strip.setWrapping(False)
+        self.strip.setIconSize(QSize(PREVIEW_SIZE[0] // 4, PREVIEW_SIZE[1] // 4))
+        self.strip.setFixedHeight(PREVIEW_SIZE[1] // 4 + 40)
+        self.strip.itemClicked.connect(lambda item: self.slider.setValue(item.data(Qt.UserRole)))
+        self.plot = AreaPlot()
+        self.plot.layer_clicked.connect(self.slider.setValue)
+
+        top = QHBoxLayout()
+        top.addWidget(self.image_label)
+        right = QVBoxLayout()
+        right.addWidget(self.info_label)
+        right.addWidget(self.plot)
+        top.addLayout(right)
+        layout = QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self.slider)
+        layout.addWidget(self.strip)
+        self.setLayout(layout)
+        # 掃描期間定時重繪曲線，不必每段完成都重繪
+        self.plot_timer = QTimer(self)
+        self.plot_timer.timeout.connect(self.plot.update)
+
+    def load(self, path):
+        """開啟切片 (.zip / .ctb / ...)；舊任務的背景工作以世代編號作廢。"""
+        from slice_source import open_slice_source
+        self.close_source()
+        self.source = open_slice_source(path)
+        count = len(self.source)
+        self.areas = np.full(count, np.nan, dtype=np.float64)
+        self.plot.set_areas(self.areas)
+        if count == 0:
+            self.slider.setEnabled(False)
+            self.strip.clear()
+            self.image_label.setText("切片中沒有任何層")
+            self.info_label.setText("")
+            return
+        # 調整範圍與歸零時不觸發 valueChanged，第一層只在下面請求一次
+        self.slider.blockSignals(True)
+        self.slider.setRange(0, count - 1)
+        self.slider.setValue(0)
+        self.slider.blockSignals(False)
+        self.slider.setEnabled(True)
+        generation = self.generation
+        for start in range(0, count, SCAN_CHUNK):
+            self.scan_pool.start(_ScanTask(self, generation, start, min(count, start + SCAN_CHUNK)))
+        self.plot_timer.start(250)
+        self.show_layer(0)
+
+    def close_source(self):
+        self.generation += 1
+        self.pool.clear()
+        self.scan_pool.clear()
+        self.plot_timer.stop()
+        with self.lock:
+            self.cache.clear()
+            self.pending.clear()
+        if self.source:
+            # 已開始的工作可能仍在讀取，等它們結束 (各自最多一層) 再關閉
+            self.pool.waitForDone()
+            self.scan_pool.waitForDone()
+            self.source.close()
+            self.source = None
+
+    def _request(self, index):
+        """快取命中時回傳預覽陣列，否則排入背景解碼並回傳 None。"""
+        with self.lock:
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                return self.cache[index]
+            if index in self.pending:
+                return None
+            self.pending.add(index)
+        # 目前層優先於縮圖列
+        self.pool.start(_PreviewTask(self, self.generation, index), 1 if index == self.slider.value() else 0)
+        return None
+
+    def show_layer(self, index):
+        if not self.source:
+            return
+        # 層號改變時，尚未開始的舊請求不再需要
+        self.pool.clear()
+        with self.lock:
+            self.pending.clear()
+        self._update_info(index)
+        self.plot.set_current(index)
+        frame = self._request(index)
+        if frame is not None:
+            self.image_label.setPixmap(QPixmap.fromImage(to_qimage(frame)))
+        self._fill_strip(index)
+
+    def _update_info(self, index):
+        area = self.areas[index] if self.areas is not None else np.nan
+        total = len(self.source)
+        text = f"第 {index + 1} / {total} 層"
+        if not np.isnan(area):
+            text += f"，面積 {area:.0f} 像素"
+        done = int(np.count_nonzero(~np.isnan(self.areas)))
+        if done < total:
+            text += f" (面積掃描 {100.0 * done / total:.0f}%)"
+        self.info_label.setText(text)
+
+    def _fill_strip(self, index):
+        self.strip.clear()
+        for i in range(max(0, index - STRIP_RADIUS), min(len(self.source), index + STRIP_RADIUS + 1)):
+            item = QListWidgetItem(str(i + 1))
+            item.setData(Qt.UserRole, i)
+            frame = self._request(i)
+            if frame is not None:
+                item.setIcon(QIcon(QPixmap.fromImage(to_qimage(frame))))
+            self.strip.addItem(item)
+            if i == index:
+                item.setSelected(True)
+
+    def _on_preview(self, generation, index, frame, error):
+        if generation != self.generation:
+            return
+        with self.lock:
+            self.pending.discard(index)
+            if frame is not None:
+                self.cache[index] = frame
+                self.cache.move_to_end(index)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        if frame is None:
+            # 解碼失敗不進快取，再次選到這層時會重試
+            if index == self.slider.value():
+                self.image_label.setText(f"第 {index + 1} 層解碼失敗:\n{error}")
+            for row in range(self.strip.count()):
+                item = self.strip.item(row)
+                if item.data(Qt.UserRole) == index:
+                    item.setToolTip(f"解碼失敗: {error}")
+            return
+        current = self.slider.value()
+        if index == current:
+            self.image_label.setPixmap(QPixmap.fromImage(to_qimage(frame)))
+        for row in range(self.strip.count()):
+            item = self.strip.item(row)
+            if item.data(Qt.UserRole) == index:
+                item.setIcon(QIcon(QPixmap.fromImage(to_qimage(frame))))
+
+    def _on_scan_progress(self, generation):
+        if generation != self.generation:
+            return
+        self._update_info(self.slider.value())
+        if not np.isnan(self.areas).any():
+            self.plot_timer.stop()
+            self.plot.update()
@@ -0,0 +1,54 @@
+# layer_program.py - 逐層運動程式
+# 功能：打印開始時把每一層的剝離 / 擦拭 / 液位位移一次上傳到四軸韌體 (main.py)，
+#       之後每層只需送出一個觸發字節 (或由韌體自行計時)，不再逐層傳送並解析 NEXT_LAYER。
+
+from collections import Counter
+
+TRIGGER_BYTE = b'\x01'
+FIELDS = ('lift', 'return', 'wipe', 'b_offset', 'dwell_ms')
+
+
+def build_layer_program(total_layers, params, exposure_s=None, layer_meta=None):
+    """
+    回傳每層一個 tuple: (Z 抬升, Z 回程, A 擦拭距離, B 補償位移, 停留 ms)。
+    - 預設值與 NEXT_LAYER 相同，取自 params。
+    - exposure_s(i) 提供時作為停留時間 (自動模式下韌體依此計時)。
+    - layer_meta(i) 回傳的字典可覆寫任一欄位 (鍵名同 FIELDS)。
+    """
+    base = {
+        'lift': params['peel_lift_z1'], 'return': params['peel_return_z2'],
+        'wipe': params.get('wipe_dist', 50.0), 'b_offset': 0.0, 'dwell_ms': 0.0,
+    }
+    steps = []
+    for i in range(total_layers):
+        step = dict(base)
+        if exposure_s is not None:
+            step['dwell_ms'] = exposure_s(i) * 1000.0
+        if layer_meta is not None:
+            step.update((k, v) for k, v in layer_meta(i).items() if k in step)
+        steps.append(tuple(float(step[k]) for k in FIELDS))
+    return steps
+
+
+def _fmt(step):
+    return ",".join(f"{v:g}" for v in step)
+
+
+def program_lines(steps):
+    """
+    上傳用的指令行。PROGRAM_BEGIN 帶最常見的一層作為預設步驟，只有與預設不同的層以 PROGRAM_STEP 送出，
+    連續相同的層合併成一段 (起-迄)；韌體只保存預設步驟與這些區段，不必為每層配置記憶體。
+    """
+    default = Counter(steps).most_common(1)[0][0] if steps else (0.0,) * len(FIELDS)
+    lines = [f"PROGRAM_BEGIN,{len(steps)},{_fmt(default)}"]
+    start = 0
+    while start < len(steps):
+        end = start
+        while end + 1 < len(steps) and steps[end + 1] == steps[start]:
+            end += 1
+        if steps[start] != default:
+            span = f"{start}-{end}" if end > start else f"{start}"
+            lines.append(f"PROGRAM_STEP,{span},{_fmt(steps[start])}")
+        start = end + 1
+    lines.append("PROGRAM_END")
+    return lines
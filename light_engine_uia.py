@@ -0,0 +1,140 @@
+# light_engine_uia.py - 光機控制軟體的 UIA 自動化 (快取元素 + 直接呼叫 UIA 模式)
+# 功能：連線時只解析一次主視窗、LED 下拉選單 (含 On / Off 選項) 與設定按鈕的元素包裝，之後每次開關燈
+#       直接呼叫 SelectionItem.Select / Invoke.Invoke，不再每次由 child_window 規格重新搜尋 UI 樹，
+#       也不需要 set_focus 與模擬點擊之間的固定等待。控制軟體重啟或元素失效時自動重新解析。
+#       每次開關燈的耗時都會記錄，可用 stats() 取得分佈。
+# 用法:
+#   python light_engine_uia.py bench [--count 20]   比較快取模式與舊做法 (set_focus + select + click) 的開關燈延遲
+
+import time
+import argparse
+
+from profiling import percentile
+
+LIGHT_ENGINE_WINDOW_TITLE = "Full-HD UV LE Controller v2.1"
+LED_COMBO_ID = "ComboBoxLedEnable"
+LED_BUTTON_ID = "ButtonSetLedOnOff"
+
+
+def _window_alive(handle):
+    """以 Win32 IsWindow 檢查視窗控制代碼是否仍有效 (微秒級，不走訪 UI 樹)。"""
+    if not handle:
+        return True
+    import ctypes
+    return bool(ctypes.windll.user32.IsWindow(handle))
+
+
+class UIALightEngine:
+    """
+    介面與原本的 LightEngineGUIControl 相同 (led_on / led_off / close)。
+    失效偵測分兩層：每次操作前先確認快取的主視窗控制代碼仍存在；操作本身丟出例外 (元素已不可用) 時，
+    重新解析一次後重試，仍失敗才回報錯誤。
+    """
+
+    def __init__(self, window_title=LIGHT_ENGINE_WINDOW_TITLE, timeout=60):
+        from pywinauto.application import Application
+        self.window_title = window_title
+        self.app = Application(backend="uia").connect(title=window_title, timeout=timeout)
+        self.latencies = []
+        self.resolves = 0
+        self.resolve()
+
+    def resolve(self):
+        """解析並快取所有元素包裝；下拉選項找不到 (選單收合時不在 UI 樹中) 時改用 Value 模式或 select()。"""
+        spec = self.app.window(title=self.window_title)
+        spec.wait('ready', timeout=30)
+        self.main_win = spec.wrapper_object()
+        self.handle = self.main_win.handle
+        self.led_combo = spec.child_window(auto_id=LED_COMBO_ID).wrapper_object()
+        self.led_button = spec.child_window(auto_id=LED_BUTTON_ID).wrapper_object()
+        self.items = {}
+        for item in self.led_combo.descendants(control_type="ListItem"):
+            self.items[item.window_text()] = item
+        self.resolves += 1
+
+    def _select(self, text):
+        item = self.items.get(text)
+        if item is not None:
+            item.iface_selection_item.Select()
+            return
+        try:
+            self.led_combo.iface_value.SetValue(text)
+        except Exception:
+            # 不支援 Value 模式的下拉選單：由 pywinauto 展開後選取 (較慢，但只在這種控制項上發生)
+            self.led_combo.select(text)
+
+    def _apply(self, text):
+        self._select(text)
+        self.led_button.iface_invoke.Invoke()
+
+    def set_led(self, on):
+        text = "On" if on else "Off"
+        t0 = time.perf_counter()
+        try:
+            if not _window_alive(self.handle):
+                self.resolve()
+            try:
+                self._apply(text)
+            except Exception:
+                # 快取的元素已失效 (控制軟體重建了控制項)，重新解析後再試一次
+                self.resolve()
+                self._apply(text)
+        except Exception as e:
+            raise RuntimeError(f"自動化控制 'LED {text}' 失敗: {e}")
+        self.latencies.append(time.perf_counter() - t0)
+
+    def led_on(self):
+        self.set_led(True)
+
+    def led_off(self):
+        self.set_led(False)
+
+    def stats(self):
+        samples = sorted(self.latencies)
+        if not samples:
+            return {'n': 0, 'resolves': self.resolves}
+        return {'n': len(samples), 'resolves': self.resolves,
+                'mean_ms': 1000.0 * sum(samples) / len(samples), 'p50_ms': 1000.0 * percentile(samples, 50),
+                'p90_ms': 1000.0 * percentile(samples, 90), 'max_ms': 1000.0 * samples[-1]}
+
+    def close(self):
+        pass
+
+
+def legacy_toggle(app, window_title, text):
+    """舊做法：每次由規格重新搜尋元素，set_focus + select + 固定等待 + 模擬點擊。"""
+    main_win = app.window(title=window_title)
+    main_win.set_focus()
+    main_win.child_window(auto_id=LED_COMBO_ID).select(text)
+    time.sleep(0.1)
+    main_win.child_window(auto_id=LED_BUTTON_ID).click()
+    time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="光機軟體 UIA 開關燈延遲測試")
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('bench', help="比較快取模式與舊做法的開關燈延遲 (光機 LED 會實際開關)")
+    b.add_argument('--count', type=int, default=20, help="每種做法的開關次數")
+    b.add_argument('--title', default=LIGHT_ENGINE_WINDOW_TITLE)
+    args = parser.parse_args()
+
+    engine = UIALightEngine(args.title)
+    legacy = []
+    for k in range(args.count):
+        t0 = time.perf_counter()
+        legacy_toggle(engine.app, args.title, "On" if k % 2 == 0 else "Off")
+        legacy.append(time.perf_counter() - t0)
+    for k in range(args.count):
+        engine.set_led(k % 2 == 0)
+    engine.led_off()
+    legacy.sort()
+    print(f"舊做法   n={len(legacy):<4d} 平均 {1000.0 * sum(legacy) / len(legacy):7.1f} ms  "
+          f"p90 {1000.0 * percentile(legacy, 90):7.1f}  最大 {1000.0 * legacy[-1]:7.1f}")
+    s = engine.stats()
+    print(f"快取模式 n={s['n']:<4d} 平均 {s['mean_ms']:7.1f} ms  p90 {s['p90_ms']:7.1f}  最大 {s['max_ms']:7.1f}"
+          f"  (解析 {s['resolves']} 次)")
+
+
+if __name__ == "__main__":
+    main()
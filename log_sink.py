@@ -0,0 +1,68 @@
+# log_sink.py - 打印日誌輸出
+# 功能：打印執行緒只寫入 logging；GUI 端定時批次取出顯示，完整日誌寫入輪替檔案。
+
+import os
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+LOGGER_NAME = 'uv_print'
+
+
+class StructuredFormatter(logging.Formatter):
+    """在訊息後附上 record.fields 中的結構化欄位，例如每層的計時資料。"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += " | " + " ".join(
+                f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class BufferedLogHandler(logging.Handler):
+    """
+    只把訊息放進緩衝區，不跨執行緒發送 Qt 信號。
+    GUI 執行緒用計時器呼叫 drain() 批次取出；緩衝區滿時丟棄最舊的訊息並計數。
+    """
+
+    def __init__(self, max_buffer=5000):
+        super().__init__()
+        self.buffer = deque()
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(self, record):
+        # Handler.handle() 已持有 self.lock
+        if len(self.buffer) >= self.max_buffer:
+            self.buffer.popleft()
+            self.dropped += 1
+        self.buffer.append(self.format(record))
+
+    def drain(self, max_lines):
+        """取出最多 max_lines 行；回傳 (lines, 自上次以來被丟棄的行數)。"""
+        self.acquire()
+        try:
+            count = min(max_lines, len(self.buffer))
+            lines = [self.buffer.popleft() for _ in range(count)]
+            dropped, self.dropped = self.dropped, 0
+        finally:
+            self.release()
+        return lines, dropped
+
+
+def get_print_logger(log_path, max_bytes=5 * 1024 * 1024, backup_count=5):
+    """取得打印日誌 logger；首次呼叫時掛上輪替檔案輸出。"""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
+        log_dir = os.path.dirname(log_path)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        file_handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(StructuredFormatter("%(asctime)s %(levelname)s %(threadName)s %(message)s"))
+        logger.addHandler(file_handler)
+    return logger
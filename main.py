@@ -1,7 +1,9 @@
 # main.py - 四軸 TCP 控制版 (支援動態參數配置)
+import sys
 import machine
 import time
 import uasyncio
+from array import array
 
 # --- 1. 自定義異步隊列類 (保持不變) ---
 class AsyncQueue:
@@ -19,8 +21,121 @@ A_STEP_PIN, A_DIR_PIN, A_ENA_PIN = 23, 22, 21
 B_STEP_PIN, B_DIR_PIN, B_ENA_PIN = 19, 18, 5
 C_STEP_PIN, C_DIR_PIN, C_ENA_PIN = 17, 16, 4
 LEVEL_SENSOR_PIN = 34
+# USB 串口傳輸：True 時同時從 USB 串口 (stdin/stdout) 接收同一套行協議，延遲與抖動都低於 Wi-Fi。
+# 串口即協議通道，因此啟用時日誌一律不回顯到 UART。
+SERIAL_TRANSPORT = False
+
+# 步進執行緒：True 時步進脈衝由獨立執行緒 (_thread) 產生，asyncio 事件循環只處理通訊與控制；
+# 韌體不支援 _thread 時自動退回單執行緒 (每 YIELD_EVERY 步讓出一次)。
+STEP_THREAD = True
+MOVE_SLOTS = 8  # 移動佇列格數
+STEP_THREAD_STACK = 8192
+try: import _thread
+except ImportError: STEP_THREAD = False
+
+# 日誌：每筆紀錄格式化一次後寫入固定大小的 RAM 環形緩衝，以 LOGS 指令整批下載；
+# 預設不回顯到 UART (同步輸出會拖慢指令與運動)，需要時以 LOG_LEVEL,<等級>,1 開啟
+LOG_DEBUG, LOG_INFO, LOG_WARN, LOG_ERROR = 10, 20, 30, 40
+LOG_LEVELS = {'DEBUG': LOG_DEBUG, 'INFO': LOG_INFO, 'WARN': LOG_WARN, 'ERROR': LOG_ERROR}
+LOG_TAGS = {LOG_DEBUG: 'D', LOG_INFO: 'I', LOG_WARN: 'W', LOG_ERROR: 'E'}
+LOG_BUFFER_SIZE = 8192
+log_buf = bytearray(LOG_BUFFER_SIZE)
+log_state = {'pos': 0, 'wrapped': False, 'level': LOG_INFO, 'echo': False}
+log_lock = _thread.allocate_lock() if STEP_THREAD else None  # 步進執行緒也會寫日誌
+
+def log(*args, level=LOG_INFO):
+    if level < log_state['level']: return
+    line = f"{time.ticks_ms()} {LOG_TAGS[level]} " + " ".join(str(a) for a in args)
+    if log_state['echo'] and not SERIAL_TRANSPORT: print(line)
+    data = line.encode()[:LOG_BUFFER_SIZE // 4] + b"\n"
+    if log_lock: log_lock.acquire()
+    try:
+        pos = log_state['pos']; end = pos + len(data)
+        if end <= LOG_BUFFER_SIZE: log_buf[pos:end] = data
+        else:
+            k = LOG_BUFFER_SIZE - pos; log_buf[pos:] = data[:k]; log_buf[:end - LOG_BUFFER_SIZE] = data[k:]
+        if end >= LOG_BUFFER_SIZE: log_state['wrapped'] = True
+        log_state['pos'] = end % LOG_BUFFER_SIZE
+    finally:
+        if log_lock: log_lock.release()
+
+def log_records():
+    """依時間順序取出環形緩衝中的完整紀錄 (覆寫後最舊的半筆會被略去)。"""
+    if log_lock: log_lock.acquire()
+    try:
+        pos = log_state['pos']
+        data = bytes(log_buf[pos:]) + bytes(log_buf[:pos]) if log_state['wrapped'] else bytes(log_buf[:pos])
+    finally:
+        if log_lock: log_lock.release()
+    chunks = data.split(b"\n")
+    if log_state['wrapped']: chunks = chunks[1:]
+    records = []
+    for c in chunks:
+        # 截斷的多位元組字元無法解碼，略過該筆
+        try: records.append(c.decode())
+        except UnicodeError: pass
+    return [r for r in records if r]
+
+# --- 3. 步進馬達驅動類 ---
+MIN_STEP_DELAY_US = 2
+RAMP_CACHE_SIZE = 6  # 每軸快取的加速曲線數 (剝離 / 回程 / 刮刀等固定動作)
+
+def linear_ramp(max_speed_steps_s, accel_steps_s2, total_steps):
+    """
+    梯形曲線的加速段：每步延遲 (us)，速度隨步數線性上升。加速步數先限制在 total_steps // 2 再產生列表，
+    短距離移動不會先配置整段曲線；回傳 (延遲列表, 實際到達的最高速 steps/s)。
+    """
+    full_steps = int(0.5 * (max_speed_steps_s**2) / accel_steps_s2) if accel_steps_s2 > 0 else 0
+    accel_steps = min(full_steps, total_steps // 2)
+    if accel_steps == 0: return [], max_speed_steps_s
+    ramp = [1_000_000 // max(1, int(max_speed_steps_s * k / full_steps)) for k in range(1, accel_steps + 1)]
+    return ramp, max_speed_steps_s * accel_steps / full_steps
+
+def scurve_ramp(max_speed_steps_s, accel_steps_s2, jerk_steps_s3):
+    """
+    S 曲線 (限制加加速度) 的加速段：加速度以 jerk 斜率升到 accel，
+    接近最高速時再以 jerk 斜率降回，起步與到速時都不會有加速度突變。
+    """
+    delays = []
+    v = max(1.0, max_speed_steps_s * 0.02)
+    a = 0.0
+    a_floor = accel_steps_s2 * 0.05  # 收尾時保留的最小加速度，確保能到達最高速
+    while v < max_speed_steps_s:
+        delays.append(1_000_000 // int(v))
+        dt = 1.0 / v
+        if max_speed_steps_s - v <= a * a / (2 * jerk_steps_s3):
+            a = max(a_floor, a - jerk_steps_s3 * dt)
+        elif a < accel_steps_s2:
+            a = min(accel_steps_s2, a + jerk_steps_s3 * dt)
+        v += a * dt
+    return delays
+
+# 步進計時剖析 (PROFILE)：取樣陣列預先配置，移動中只寫入 ticks_us 與區間內的指令時間，移動結束後才計算統計
+PROFILE_SAMPLES = 2048
+YIELD_EVERY = 100  # 單執行緒模式下步進迴圈每隔多少步讓出一次事件循環
+# 取樣陣列全域共用 (每軸各一份太佔記憶體)：同一時間只有一個移動 (owner) 記錄，其他同時進行的移動 (例如液位補償的 B 軸) 不取樣
+step_profile = {'enabled': False, 'stride': 1, 'owner': None, 'ticks': array('i', bytes(4 * PROFILE_SAMPLES)), 'cmd': array('i', bytes(4 * PROFILE_SAMPLES))}
+
+def profile_stats(ticks, cmd, n, stride, ramp_len, decel_start, yield_every=YIELD_EVERY):
+    """
+    取樣點 k-1 -> k 之間實際經過的 us 與指令時間 cmd[k] 比較。回傳每步平均指令 / 實際週期、達成率、
+    每步誤差的標準差 (抖動)、單一區間最大延遲、含事件循環讓出的區間平均多花的時間，以及等速段的指令 / 實際步頻。
+    """
+    if n < 2: return None
+    c_sum = a_sum = e_sum = e_sq = 0.0; late_max = 0; y_extra = 0.0; y_n = 0; cc = ca = 0.0; cn = 0
+    for k in range(1, n):
+        actual = time.ticks_diff(ticks[k], ticks[k - 1]); err = actual - cmd[k]
+        first = (k - 1) * stride; last = k * stride - 1
+        c_sum += cmd[k]; a_sum += actual; e_sum += err / stride; e_sq += (err / stride) ** 2
+        if err > late_max: late_max = err
+        if yield_every and last // yield_every != (first - 1) // yield_every: y_extra += err; y_n += 1
+        if first >= ramp_len and last < decel_start: cc += cmd[k]; ca += actual; cn += stride
+    m = n - 1; steps = m * stride; mean_e = e_sum / m
+    return {'n': steps, 'cmd_us': c_sum / steps, 'act_us': a_sum / steps, 'rate': 100.0 * c_sum / a_sum if a_sum else 0.0,
+            'jitter_us': max(0.0, e_sq / m - mean_e * mean_e) ** 0.5, 'max_late_us': late_max,
+            'yield_us': y_extra / y_n if y_n else 0.0,
+            'cruise_cmd_sps': 1_000_000 * cn / cc if cc else 0.0, 'cruise_act_sps': 1_000_000 * cn / ca if ca else 0.0}
 
-# --- 3. 步進馬達驅動類 (保持不變) ---
 class Stepper:
     def __init__(self, step_pin, dir_pin, ena_pin, is_dm_driver=False):
         self.step_pin_num = step_pin
@@ -31,6 +146,16 @@ class Stepper:
             self.ena = machine.Pin(ena_pin, machine.Pin.OUT)
         self.steps_per_mm = 200.0
         self.pwm = None
+        # 運動曲線 (CONFIG_MOTION)：accel 為 0 時沿用舊規則 speed * 2
+        self.profile = 'linear'
+        self.accel = 0.0
+        self.jerk = 0.0
+        # 絕對位置以整數步數累計，不隨浮點距離換算漂移；快速移動 (非打印) 使用獨立的速度與加速度
+        self.position = 0
+        self.travel_speed = 20.0
+        self.travel_accel = 0.0
+        self.last_profile = None  # 最近一次剖析的移動統計 (PROFILE)
+        self.ramp_cache = {}
         self.dir.value(0)
         self.step.value(0)
         self.disable()
@@ -40,141 +165,433 @@ class Stepper:
     def disable(self):
         if self.use_ena: self.ena.value(1)
 
-    async def move_rel(self, distance_mm, speed_mm_s, accel_mm_s2):
+    def accel_for(self, speed_mm_s):
+        return self.accel if self.accel > 0 else speed_mm_s * 2
+
+    def build_ramp(self, total_steps, max_speed_steps_s, accel_steps_s2):
+        """
+        回傳 (加速段延遲, 最高速 steps/s)，減速段為其反向；等速段必須使用這裡回傳的最高速。
+        S 曲線步數不足時降低最高速，而不是截斷曲線。每層的剝離動作參數相同，結果依參數快取，不必每次重算。
+        """
+        key = (self.profile, max_speed_steps_s, accel_steps_s2, self.jerk, self.steps_per_mm, total_steps)
+        cached = self.ramp_cache.get(key)
+        if cached: return cached
+        if self.profile == 'scurve' and self.jerk > 0 and accel_steps_s2 > 0:
+            jerk_steps_s3 = self.jerk * self.steps_per_mm
+            peak = max_speed_steps_s
+            for _ in range(8):
+                ramp = scurve_ramp(peak, accel_steps_s2, jerk_steps_s3)
+                if 2 * len(ramp) <= total_steps: break
+                peak *= 0.7
+            else:
+                # 降速 8 次仍放不下：截斷曲線，最高速取截斷處的速度
+                ramp = ramp[:total_steps // 2]
+                if ramp: peak = 1_000_000 / ramp[-1]
+            result = (ramp, peak)
+        else:
+            result = linear_ramp(max_speed_steps_s, accel_steps_s2, total_steps)
+        if len(self.ramp_cache) >= RAMP_CACHE_SIZE: self.ramp_cache.clear()
+        self.ramp_cache[key] = result
+        return result
+
+    def to_steps(self, mm): return int(round(mm * self.steps_per_mm))
+    def position_mm(self): return self.position / self.steps_per_mm if self.steps_per_mm else 0.0
+
+    async def move_rel(self, distance_mm, speed_mm_s, accel_mm_s2=None):
         if self.steps_per_mm == 0: return
-        total_steps = int(abs(distance_mm) * self.steps_per_mm)
-        if total_steps == 0: return
-        
+        await self.move_steps(self.to_steps(distance_mm), speed_mm_s, accel_mm_s2)
+
+    async def move_abs(self, target_mm, speed_mm_s=None, accel_mm_s2=None):
+        """移動到絕對位置；未指定速度時使用快速移動設定 (CONFIG_TRAVEL)。"""
+        if self.steps_per_mm == 0: return
+        if not speed_mm_s: speed_mm_s, accel_mm_s2 = self.travel_speed, accel_mm_s2 or self.travel_accel
+        # 步數在移動真正開始時才以當下位置換算，前面排隊中的同軸移動不會讓目標偏移
+        await self.move_steps(None, speed_mm_s, accel_mm_s2, target_mm)
+
+    async def move_steps(self, steps, speed_mm_s, accel_mm_s2=None, target_mm=None):
+        if steps == 0: return
+        if step_thread: await step_thread.run(self, steps, speed_mm_s, accel_mm_s2, target_mm); return
+        # 單執行緒模式：每 YIELD_EVERY 步讓出一次事件循環。MicroPython 不會在產生器被丟棄時關閉它，
+        # 被取消 (例如 PROGRAM_STOP) 時必須自行 close()，finally 才會記錄已送出的步數
+        gen = self.step_gen(steps, speed_mm_s, accel_mm_s2, YIELD_EVERY, target_mm)
+        try:
+            for _ in gen: await uasyncio.sleep_ms(0)
+        finally: gen.close()
+
+    def step_gen(self, steps, speed_mm_s, accel_mm_s2, yield_every, target_mm=None, abort=None):
+        """
+        實際送出步進脈衝；yield_every 為 0 時整段不讓出 (步進執行緒使用)。
+        target_mm 指定時 steps 以開始當下的位置計算；abort 為這次移動專用的旗標 ([False])，設定後在下一步停止。
+        """
+        if target_mm is not None: steps = self.to_steps(target_mm) - self.position
+        total_steps = abs(steps)
+        t_entry = time.ticks_us()
+        if not accel_mm_s2: accel_mm_s2 = self.accel_for(speed_mm_s)
+        distance_mm = steps / self.steps_per_mm
+        sign = -1 if steps < 0 else 1
+
         self.enable()
-        self.dir.value(1 if distance_mm < 0 else 0)
-        
-        max_speed_steps_s = speed_mm_s * self.steps_per_mm
-        accel_steps_s2 = accel_mm_s2 * self.steps_per_mm
-        
-        delays = []
-        accel_steps = int(0.5 * (max_speed_steps_s**2) / accel_steps_s2) if accel_steps_s2 > 0 else 0
-        if total_steps <= 2 * accel_steps: accel_steps = total_steps // 2
-        decel_start_step = total_steps - accel_steps
-        
-        for i in range(total_steps):
-            step_count = i + 1
-            if step_count <= accel_steps:
-                speed = (max_speed_steps_s / accel_steps) * step_count if accel_steps > 0 else max_speed_steps_s
-            elif step_count > decel_start_step:
-                speed = max_speed_steps_s - (max_speed_steps_s / accel_steps) * (step_count - decel_start_step) if accel_steps > 0 else max_speed_steps_s
-            else:
-                speed = max_speed_steps_s
-            
-            if speed > 0:
-                delays.append(1_000_000 // int(speed))
-            else:
-                delays.append(1_000_000)
-        
-        print(f"INFO: Moving {distance_mm}mm with acceleration...")
-        for i, delay in enumerate(delays):
-            self.step.value(1)
-            time.sleep_us(2)
-            self.step.value(0)
-            time.sleep_us(max(2, delay))
-            if i % 100 == 0:
-                await uasyncio.sleep_ms(0)
+        self.dir.value(1 if steps < 0 else 0)
+
+        # 步數不足以加速到設定速度時，等速段沿用加速段終點的速度，不會在加速段結束後突然跳速
+        ramp, max_speed_steps_s = self.build_ramp(total_steps, speed_mm_s * self.steps_per_mm, accel_mm_s2 * self.steps_per_mm)
+        ramp_len = len(ramp)
+        cruise_delay = 1_000_000 // max(1, int(max_speed_steps_s))
+        decel_start_step = total_steps - ramp_len
+
+        # 只保存加速段，減速段反向讀取，長距離移動不再配置整段延遲列表
+        # 除錯等級未開啟時不組字串 (每次移動都會經過這裡)
+        if log_state['level'] <= LOG_DEBUG: log(f"Moving {distance_mm}mm ({self.profile}, ramp {ramp_len} steps)", level=LOG_DEBUG)
+        done = 0
+        # 剖析開啟時取樣：ticks[n] 為該步開始的時刻，cmd[n] 為上一個取樣點以來各步的指令週期 (脈衝寬度 + 延遲) 總和
+        prof = step_profile['enabled'] and step_profile['owner'] is None; stride = step_profile['stride']; ticks = step_profile['ticks']; cmd = step_profile['cmd']
+        if prof: step_profile['owner'] = self
+        n = 0; cmd_sum = 0
+        try:
+            for i in range(total_steps):
+                if abort and abort[0]: break
+                if i < ramp_len: delay = ramp[i]
+                elif i >= decel_start_step: delay = ramp[total_steps - 1 - i]
+                else: delay = cruise_delay
+                if prof and i % stride == 0 and n < PROFILE_SAMPLES:
+                    ticks[n] = time.ticks_us(); cmd[n] = cmd_sum; cmd_sum = 0; n += 1
+                self.step.value(1)
+                time.sleep_us(2)
+                self.step.value(0)
+                done += 1
+                time.sleep_us(max(MIN_STEP_DELAY_US, delay))
+                if prof: cmd_sum += 2 + max(MIN_STEP_DELAY_US, delay)
+                if yield_every and i % yield_every == 0: yield
+        finally:
+            # 被取消 (例如 PROGRAM_STOP) 時也只計入實際送出的步數
+            self.position += sign * done
+            if prof:
+                self.last_profile = profile_stats(ticks, cmd, n, stride, ramp_len, decel_start_step, yield_every)
+                step_profile['owner'] = None
+                if self.last_profile:
+                    # setup_us: 進入 move_steps 到第一步之間 (計算加速曲線與輸出日誌) 的時間
+                    self.last_profile['speed'] = max_speed_steps_s; self.last_profile['setup_us'] = time.ticks_diff(ticks[0], t_entry)
+
+class StepThread:
+    """
+    步進執行緒：asyncio 端把移動放進固定大小的環形佇列，執行緒依序執行。
+    單一生產者 (事件循環) / 單一消費者 (步進執行緒)，各自只遞增 head / tail，不需要鎖；
+    每格有一個 ThreadSafeFlag，移動完成後喚醒等待中的協程。事件循環只負責通訊與控制。
+    """
+    def __init__(self, slots=MOVE_SLOTS):
+        self.slots = [None] * slots; self.errors = [None] * slots
+        self.flags = [uasyncio.ThreadSafeFlag() for _ in range(slots)]
+        self.head = 0; self.tail = 0
+
+    def start(self):
+        _thread.stack_size(STEP_THREAD_STACK)
+        _thread.start_new_thread(self.worker, ())
+
+    def worker(self):
+        n = len(self.slots)
+        while True:
+            if self.tail == self.head: time.sleep_ms(1); continue
+            k = self.tail % n; stepper, steps, speed, accel, target, abort = self.slots[k]
+            try:
+                for _ in stepper.step_gen(steps, speed, accel, 0, target, abort): pass
+            except Exception as e: self.errors[k] = e
+            self.slots[k] = None; self.tail += 1
+            self.flags[k].set()
+
+    async def run(self, stepper, steps, speed, accel, target=None):
+        n = len(self.slots)
+        while self.head - self.tail >= n: await uasyncio.sleep_ms(1)
+        # 每個移動有自己的中止旗標，取消這個移動不會停掉同一軸上其他協程的移動 (例如液位補償的 B 軸)
+        abort = [False]
+        k = self.head % n; self.errors[k] = None; self.slots[k] = (stepper, steps, speed, accel, target, abort)
+        self.head += 1
+        try: await self.flags[k].wait()
+        except uasyncio.CancelledError:
+            # 被取消 (例如 PROGRAM_STOP) 時通知執行緒在下一步停止 (尚未開始則不送出任何步)，等位置記錄完成後才結束
+            abort[0] = True
+            await self.flags[k].wait()
+            raise
+        if self.errors[k]: raise self.errors[k]
 
 # --- 4. 全域變數 ---
 command_queue = AsyncQueue()
+step_thread = StepThread() if STEP_THREAD else None
 steppers = { 'z': Stepper(Z_STEP_PIN, Z_DIR_PIN, Z_ENA_PIN, is_dm_driver=True), 'a': Stepper(A_STEP_PIN, A_DIR_PIN, A_ENA_PIN, is_dm_driver=True), 'b': Stepper(B_STEP_PIN, B_DIR_PIN, B_ENA_PIN, is_dm_driver=False), 'c': Stepper(C_STEP_PIN, C_DIR_PIN, C_ENA_PIN, is_dm_driver=True) }
 adc = machine.ADC(machine.Pin(LEVEL_SENSOR_PIN)); adc.atten(machine.ADC.ATTN_11DB)
 LEVEL_LOW_THRESHOLD = 1000; LEVEL_HIGH_THRESHOLD = 3000
 level_compensation_enabled = True
+# 逐層程式 (PROGRAM_*)：只保存一組預設步驟與「和預設不同」的區段，數千層的程式也只佔幾百位元組
+# 欄位: Z 抬升, Z 回程, A 擦拭距離, B 補償位移, 停留 ms (自動模式下的曝光時間)
+# 區段以起迄層號 (含) 存在 starts / ends，欄位每段 PROGRAM_FIELDS 個浮點數連續存放在 fields
+PROGRAM_FIELDS = 5
+TRIGGER_BYTE = b'\x01'  # 單字節觸發：執行程式的下一層
+program = {'default': None, 'starts': array('i'), 'ends': array('i'), 'fields': array('f'), 'count': 0, 'received': 0, 'cursor': 0, 'auto': None}
+
+def program_step(index):
+    """第 index 層的欄位：落在覆寫區段內時取該段 (區段依層號遞增，二分搜尋)，否則取預設步驟。"""
+    starts = program['starts']; lo = 0; hi = len(starts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if starts[mid] <= index: lo = mid + 1
+        else: hi = mid
+    k = lo - 1
+    if k >= 0 and index <= program['ends'][k]: return program['fields'][k * PROGRAM_FIELDS:(k + 1) * PROGRAM_FIELDS]
+    return program['default']
 
 # --- 5. 異步任務 ---
+async def client_loop(reader, writer):
+    """TCP 與串口共用的讀取迴圈：行首單一觸發字節代表 STEP，其餘為一行指令。"""
+    while True:
+        try:
+            data = await reader.read(1)
+            if not data: log("客戶端斷開連接"); break
+            if data == TRIGGER_BYTE: await command_queue.put(("STEP", writer)); continue
+            if data != b'\n': data += await reader.readline()
+            # 空行 (單獨的換行或 \r\n) 不回覆，否則多出的 "Unknown command" 會讓上位機的回覆錯位
+            line = data.decode().strip()
+            if line: await command_queue.put((line, writer))
+        except Exception as e: log(f"讀取錯誤: {e}", level=LOG_WARN); break
+
 async def tcp_server(host, port):
-    print(f"TCP 伺服器啟動於 {host}:{port}")
+    log(f"TCP 伺服器啟動於 {host}:{port}")
     async def handle_client(reader, writer):
-        print("客戶端已連接")
-        while True:
-            try:
-                data = await reader.readline();
-                if data: await command_queue.put((data.decode().strip(), writer))
-                else: print("客戶端斷開連接"); break
-            except Exception as e: print(f"讀取錯誤: {e}"); break
+        log("客戶端已連接")
+        await client_loop(reader, writer)
         writer.close(); await writer.wait_closed()
     await uasyncio.start_server(handle_client, host, port)
 
+async def serial_server():
+    # 關閉 Ctrl-C 中斷，避免二進位觸發字節或雜訊打斷程式；回覆直接寫回 USB 串口
+    import micropython
+    micropython.kbd_intr(-1)
+    await client_loop(uasyncio.StreamReader(sys.stdin.buffer), uasyncio.StreamWriter(sys.stdout.buffer, {}))
+
 async def level_compensator():
-    print("液位補償任務已啟動。")
+    log("液位補償任務已啟動。")
     b_move_step = 0.05
     b_speed_down, b_speed_up = 2.0, 2.0 # 將由 command_processor 更新
     while True:
         if level_compensation_enabled:
             current_level_adc = adc.read()
             if current_level_adc < LEVEL_LOW_THRESHOLD:
-                print(f"檢測到液位過低 (ADC: {current_level_adc})，向下補償...")
-                await steppers['b'].move_rel(-b_move_step, b_speed_down, b_speed_down * 2)
+                log(f"檢測到液位過低 (ADC: {current_level_adc})，向下補償")
+                await steppers['b'].move_rel(-b_move_step, b_speed_down)
             elif current_level_adc > LEVEL_HIGH_THRESHOLD:
-                print(f"檢測到液位過高 (ADC: {current_level_adc})，向上補償...")
-                await steppers['b'].move_rel(b_move_step, b_speed_up, b_speed_up * 2)
+                log(f"檢測到液位過高 (ADC: {current_level_adc})，向上補償")
+                await steppers['b'].move_rel(b_move_step, b_speed_up)
         await uasyncio.sleep_ms(1000)
 
+async def run_layer_step(params, lift, ret, wipe, b_offset):
+    """一層的剝離 / 擦拭 / 液位位移；NEXT_LAYER 與逐層程式共用。"""
+    # 加速度與曲線由各軸 CONFIG_MOTION 設定決定
+    await steppers['z'].move_rel(-lift, params['z_speed_down'])
+    if wipe: await steppers['a'].move_rel(wipe, params['wipe_speed_fast'])
+    await steppers['z'].move_rel(ret, params['z_speed_up'])
+    if wipe: await steppers['a'].move_rel(-wipe, params['wipe_speed_slow'])
+    if b_offset: await steppers['b'].move_rel(b_offset, params['b_speed_down'] if b_offset < 0 else params['b_speed_up'])
+
+async def run_program_step(params, index):
+    st = program_step(index)
+    await run_layer_step(params, st[0], st[1], st[2], st[3])
+    program['cursor'] = index + 1
+
+async def program_auto(params, start, guard_ms, writer):
+    """自動模式：每層先通知上位機曝光 (LAYER,n)，依該層停留時間計時後在本地執行運動，不再等待網路指令。"""
+    try:
+        for index in range(start, program['count']):
+            writer.write(f"LAYER,{index}\n".encode()); await writer.drain()
+            await uasyncio.sleep_ms(int(program_step(index)[4]) + guard_ms)
+            await run_program_step(params, index)
+            writer.write(f"STEP_DONE,{index}\n".encode()); await writer.drain()
+        writer.write(b"PROGRAM_DONE\n"); await writer.drain()
+    except uasyncio.CancelledError:
+        writer.write(b"PROGRAM_STOPPED\n"); await writer.drain()
+    finally:
+        program['auto'] = None
+
+# 參數預設值 (由 CONFIG_* 指令修改，CONFIG_BATCH 會一併寫入快閃記憶體，重開機後自動套用)
+params = {
+    'peel_lift_z1': 5.05, 'peel_return_z2': 5.0,
+    'z_speed_down': 20.0, 'z_speed_up': 20.0,
+    'wipe_dist': 50.0, 'wipe_speed_fast': 80.0, 'wipe_speed_slow': 10.0,
+    'b_speed_down': 2.0, 'b_speed_up': 2.0,
+}
+
+# 已存配置：CONFIG_BATCH 的指令與上位機給的版本雜湊寫入快閃記憶體，開機時重新套用；
+# 上位機重新連線時以 CONFIG_HASH 比對，相同就不必重送
+CONFIG_FILE = 'config.txt'
+config_state = {'hash': None}
+
+def save_config(config_hash, lines):
+    import os
+    # 先寫暫存檔再改名，寫入途中斷電不會留下半份配置
+    with open(CONFIG_FILE + '.tmp', 'w') as f: f.write(config_hash + '\n' + '\n'.join(lines) + '\n')
+    os.rename(CONFIG_FILE + '.tmp', CONFIG_FILE)
+
+async def load_config():
+    try:
+        with open(CONFIG_FILE) as f: stored = [l.strip() for l in f if l.strip()]
+    except OSError: log("沒有已存配置。"); return
+    for line in stored[1:]:
+        response = await handle_command(line, None)
+        if not response.startswith("OK"): log(f"已存配置套用失敗: {line} -> {response.strip()}", level=LOG_ERROR); return
+    config_state['hash'] = stored[0]
+    log(f"已套用已存配置 {stored[0]} ({len(stored) - 1} 項)。")
+
+async def handle_command(cmd, writer):
+    """執行一行指令並回傳回覆；command_processor 與開機載入的已存配置共用。"""
+    response = ""; parts = cmd.split(','); command = parts[0].upper()
+    try:
+        if command == "CONFIG_AXIS":
+            axis, pulse_per_rev, lead = parts[1].lower(), float(parts[2]), float(parts[3])
+            if axis in steppers: steppers[axis].steps_per_mm = pulse_per_rev / lead; response = f"OK: Axis {axis} configured.\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "CONFIG_Z_PEEL": # Z軸剝離參數
+            params['peel_lift_z1'], params['peel_return_z2'], params['z_speed_down'], params['z_speed_up'] = map(float, parts[1:])
+            response = "OK: Z peel params configured.\n"
+        elif command == "CONFIG_A_WIPE": # A軸擦拭參數
+            params['wipe_dist'], params['wipe_speed_fast'], params['wipe_speed_slow'] = map(float, parts[1:])
+            response = "OK: A wipe params configured.\n"
+        elif command == "CONFIG_B_LEVEL": # B軸液位補償速度
+            params['b_speed_down'], params['b_speed_up'] = map(float, parts[1:])
+            # 更新 level_compensator 任務中的變數 (如果需要)
+            global b_speed_down, b_speed_up
+            b_speed_down, b_speed_up = params['b_speed_down'], params['b_speed_up']
+            response = "OK: B level params configured.\n"
+        elif command == "NEXT_LAYER":
+            # 使用動態配置的參數
+            await run_layer_step(params, params['peel_lift_z1'], params['peel_return_z2'], params['wipe_dist'], 0.0)
+            response = "DONE\n"
+        elif command == "PROGRAM_BEGIN": # PROGRAM_BEGIN,層數[,lift,return,wipe,b_offset,dwell_ms]：帶預設步驟時未覆寫的層都使用它
+            count = int(parts[1])
+            program['starts'], program['ends'], program['fields'] = array('i'), array('i'), array('f')
+            program['default'] = array('f', [float(v) for v in parts[2:2 + PROGRAM_FIELDS]]) if len(parts) > 2 else None
+            program['count'], program['received'], program['cursor'] = count, 0, 0
+            response = f"OK: Program {count} steps.\n"
+        elif command == "PROGRAM_STEP": # PROGRAM_STEP,n 或 起-迄,lift,return,wipe,b_offset,dwell_ms (區段須依層號遞增)
+            first, _, last = parts[1].partition('-'); first = int(first); last = int(last) if last else first
+            if first > last or last >= program['count'] or (program['ends'] and first <= program['ends'][-1]): response = "ERROR: Invalid program range.\n"
+            else:
+                program['starts'].append(first); program['ends'].append(last)
+                for k in range(PROGRAM_FIELDS): program['fields'].append(float(parts[2 + k]))
+                program['received'] += last - first + 1
+                response = "OK\n"
+        elif command == "PROGRAM_END":
+            ok = program['default'] is not None or program['received'] == program['count']
+            response = "OK: Program ready.\n" if ok else f"ERROR: Program incomplete ({program['received']}/{program['count']}).\n"
+        elif command == "STEP": # 單字節觸發或 STEP[,n]：執行下一層 (或第 n 層)
+            index = int(parts[1]) if len(parts) > 1 else program['cursor']
+            if program['auto']: response = "ERROR: Program running in auto mode.\n"
+            elif index >= program['count']: response = "ERROR: Program finished.\n"
+            else: await run_program_step(params, index); response = f"STEP_DONE,{index}\n"
+        elif command == "PROGRAM_AUTO": # PROGRAM_AUTO,起始層,保護時間 ms
+            if program['auto']: response = "ERROR: Program already running.\n"
+            else:
+                start = int(parts[1]) if len(parts) > 1 else program['cursor']; guard_ms = int(parts[2]) if len(parts) > 2 else 0
+                program['auto'] = uasyncio.create_task(program_auto(params, start, guard_ms, writer))
+                response = "OK: Program auto started.\n"
+        elif command == "PROGRAM_STOP":
+            if program['auto']: program['auto'].cancel()
+            response = "OK: Program stopped.\n"
+        elif command == "CONFIG_MOTION": # 各軸運動曲線: CONFIG_MOTION,axis,linear|scurve,accel,jerk
+            axis, profile = parts[1].lower(), parts[2].lower()
+            if axis not in steppers: response = "ERROR: Invalid axis.\n"
+            elif profile not in ('linear', 'scurve'): response = "ERROR: Invalid profile.\n"
+            else:
+                st = steppers[axis]; st.profile, st.accel, st.jerk = profile, float(parts[3]), float(parts[4])
+                response = f"OK: Axis {axis} motion {profile}.\n"
+        elif command == "MOVE_REL": # MOVE_REL,axis,distance,speed[,accel]，省略 accel 時使用該軸設定
+            axis, distance, speed = parts[1].lower(), float(parts[2]), float(parts[3])
+            accel = float(parts[4]) if len(parts) > 4 else None
+            if axis in steppers: await steppers[axis].move_rel(distance, speed, accel); response = "DONE\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "CONFIG_TRAVEL": # 快速移動: CONFIG_TRAVEL,axis,speed,accel (accel 0 = 沿用該軸規則)
+            axis = parts[1].lower()
+            if axis in steppers: steppers[axis].travel_speed, steppers[axis].travel_accel = float(parts[2]), float(parts[3]); response = f"OK: Axis {axis} travel configured.\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "MOVE_ABS": # MOVE_ABS,axis,position_mm[,speed]，省略 speed 時以快速移動執行
+            axis = parts[1].lower(); speed = float(parts[3]) if len(parts) > 3 else None
+            if axis in steppers: await steppers[axis].move_abs(float(parts[2]), speed); response = f"DONE,{steppers[axis].position_mm()}\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "GET_POS": # GET_POS[,axis] -> POS,axis=steps:mm,...
+            axes = [parts[1].lower()] if len(parts) > 1 else list(steppers)
+            if all(a in steppers for a in axes): response = "POS," + ",".join(f"{a}={steppers[a].position}:{steppers[a].position_mm()}" for a in axes) + "\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "SET_POS": # SET_POS,axis,position_mm：把目前位置定義為指定座標 (例如手動對位後歸零)
+            axis = parts[1].lower()
+            if axis in steppers: steppers[axis].position = steppers[axis].to_steps(float(parts[2])); response = f"OK: Axis {axis} position set.\n"
+            else: response = "ERROR: Invalid axis.\n"
+        elif command == "PROFILE": # PROFILE,ON[,stride] / PROFILE,OFF / PROFILE[,axis] -> 最近一次移動的步進計時統計
+            arg = parts[1].upper() if len(parts) > 1 else ""
+            if arg == "ON":
+                step_profile['stride'] = max(1, int(parts[2])) if len(parts) > 2 else 1; step_profile['enabled'] = True
+                response = f"OK: Profiling on, stride {step_profile['stride']}.\n"
+            elif arg == "OFF": step_profile['enabled'] = False; response = "OK: Profiling off.\n"
+            else:
+                axes = [arg.lower()] if arg else list(steppers)
+                if not all(a in steppers for a in axes): response = "ERROR: Invalid axis.\n"
+                else:
+                    fields = ('n', 'speed', 'setup_us', 'cmd_us', 'act_us', 'rate', 'jitter_us', 'max_late_us', 'yield_us', 'cruise_cmd_sps', 'cruise_act_sps')
+                    groups = [a + ":" + ":".join(f"{k}={steppers[a].last_profile[k]:.1f}" for k in fields) for a in axes if steppers[a].last_profile]
+                    response = "PROFILE," + ",".join(groups) + "\n"
+        elif command == "CONFIG_BATCH": # CONFIG_BATCH,版本雜湊,指令1;指令2;...：一次套用所有 CONFIG_* 並寫入快閃記憶體
+            _, config_hash, batch = cmd.split(',', 2); lines = [l for l in batch.split(';') if l]
+            names = [l.split(',')[0].upper() for l in lines]
+            bad = [l for l, name in zip(lines, names) if not name.startswith("CONFIG_") or name in ("CONFIG_BATCH", "CONFIG_HASH")]
+            if bad: response = f"ERROR: Not a config command: {bad[0]}\n"
+            else:
+                failed = None
+                for line in lines:
+                    r = await handle_command(line, None)
+                    if not r.startswith("OK"): failed = f"{line} -> {r.strip()}"; break
+                if failed: config_state['hash'] = None; response = f"ERROR: Config failed: {failed}\n"
+                else: save_config(config_hash, lines); config_state['hash'] = config_hash; response = f"OK: Config {config_hash} saved.\n"
+        elif command == "CONFIG_HASH": # 目前生效配置的版本雜湊 (單獨的 CONFIG_* 指令會使其失效)
+            response = f"HASH,{config_state['hash'] or 'none'}\n"
+        elif command == "LOGS": # LOGS -> LOGS,筆數 後接逐行紀錄；LOGS,CLEAR 清空
+            if len(parts) > 1 and parts[1].upper() == "CLEAR": log_state['pos'], log_state['wrapped'] = 0, False; response = "OK: Logs cleared.\n"
+            else:
+                records = log_records()
+                response = f"LOGS,{len(records)}\n" + "".join(r + "\n" for r in records)
+        elif command == "LOG_LEVEL": # LOG_LEVEL,DEBUG|INFO|WARN|ERROR[,回顯 0/1]
+            name = parts[1].upper()
+            if name not in LOG_LEVELS: response = "ERROR: Invalid log level.\n"
+            else:
+                log_state['level'] = LOG_LEVELS[name]
+                if len(parts) > 2: log_state['echo'] = parts[2] == "1"
+                response = f"OK: Log level {name}, echo {'on' if log_state['echo'] else 'off'}.\n"
+        elif command == "ENABLE_LEVEL_COMP":
+            global level_compensation_enabled
+            is_enabled = int(parts[1]); level_compensation_enabled = (is_enabled == 1)
+            status = "enabled" if level_compensation_enabled else "disabled"
+            response = f"OK: Level compensation {status}.\n"
+        else: response = "ERROR: Unknown command.\n"
+    except Exception as e: response = f"ERROR: Processing command failed: {e}\n"; log(f"指令失敗: {cmd} ({e})", level=LOG_WARN)
+    return response
+
 async def command_processor():
-    print("指令處理器已啟動")
-    # 參數預設值
-    params = {
-        'peel_lift_z1': 5.05, 'peel_return_z2': 5.0,
-        'z_speed_down': 20.0, 'z_speed_up': 20.0,
-        'wipe_dist': 50.0, 'wipe_speed_fast': 80.0, 'wipe_speed_slow': 10.0,
-        'b_speed_down': 2.0, 'b_speed_up': 2.0,
-    }
-    
+    log("指令處理器已啟動")
     while True:
         cmd, writer = await command_queue.get()
-        print(f"收到指令: {cmd}")
-        response = ""; parts = cmd.split(','); command = parts[0].upper()
-        try:
-            if command == "CONFIG_AXIS":
-                axis, pulse_per_rev, lead = parts[1].lower(), float(parts[2]), float(parts[3])
-                if axis in steppers: steppers[axis].steps_per_mm = pulse_per_rev / lead; response = f"OK: Axis {axis} configured.\n"
-                else: response = "ERROR: Invalid axis.\n"
-            elif command == "CONFIG_Z_PEEL": # Z軸剝離參數
-                params['peel_lift_z1'], params['peel_return_z2'], params['z_speed_down'], params['z_speed_up'] = map(float, parts[1:])
-                response = "OK: Z peel params configured.\n"
-            elif command == "CONFIG_A_WIPE": # A軸擦拭參數
-                params['wipe_dist'], params['wipe_speed_fast'], params['wipe_speed_slow'] = map(float, parts[1:])
-                response = "OK: A wipe params configured.\n"
-            elif command == "CONFIG_B_LEVEL": # B軸液位補償速度
-                params['b_speed_down'], params['b_speed_up'] = map(float, parts[1:])
-                # 更新 level_compensator 任務中的變數 (如果需要)
-                global b_speed_down, b_speed_up
-                b_speed_down, b_speed_up = params['b_speed_down'], params['b_speed_up']
-                response = "OK: B level params configured.\n"
-            elif command == "NEXT_LAYER":
-                # 使用動態配置的參數
-                await steppers['z'].move_rel(-params['peel_lift_z1'], params['z_speed_down'], params['z_speed_down'] * 2)
-                await steppers['a'].move_rel(params['wipe_dist'], params['wipe_speed_fast'], params['wipe_speed_fast'] * 2)
-                await steppers['z'].move_rel(params['peel_return_z2'], params['z_speed_up'], params['z_speed_up'] * 2)
-                await steppers['a'].move_rel(-params['wipe_dist'], params['wipe_speed_slow'], params['wipe_speed_slow'] * 2)
-                response = "DONE\n"
-            elif command == "MOVE_REL":
-                axis, distance, speed, accel = parts[1].lower(), float(parts[2]), float(parts[3]), float(parts[4])
-                if axis in steppers: await steppers[axis].move_rel(distance, speed, accel); response = "DONE\n"
-                else: response = "ERROR: Invalid axis.\n"
-            elif command == "ENABLE_LEVEL_COMP":
-                global level_compensation_enabled
-                is_enabled = int(parts[1]); level_compensation_enabled = (is_enabled == 1)
-                status = "enabled" if level_compensation_enabled else "disabled"
-                response = f"OK: Level compensation {status}.\n"
-            else: response = "ERROR: Unknown command.\n"
-        except Exception as e: response = f"ERROR: Processing command failed: {e}\n"
+        if log_state['level'] <= LOG_DEBUG: log(f"收到指令: {cmd}", level=LOG_DEBUG)
+        name = cmd.split(',')[0].upper()
+        if name.startswith("CONFIG_") and name not in ("CONFIG_BATCH", "CONFIG_HASH"): config_state['hash'] = None
+        response = await handle_command(cmd, writer)
         if response and writer: writer.write(response.encode()); await writer.drain()
 
 async def main():
     import network
+    if step_thread: step_thread.start()
+    await load_config()
     host_ip = network.WLAN(network.STA_IF).ifconfig()[0]
     server_task = uasyncio.create_task(tcp_server(host_ip, 8899))
     processor_task = uasyncio.create_task(command_processor())
     level_task = uasyncio.create_task(level_compensator())
-    print("ESP32 4-Axis Controller Ready.")
-    await uasyncio.gather(server_task, processor_task, level_task)
+    tasks = [server_task, processor_task, level_task]
+    if SERIAL_TRANSPORT: tasks.append(uasyncio.create_task(serial_server()))
+    log(f"ESP32 4-Axis Controller Ready ({'step thread' if step_thread else 'single loop'}).")
+    await uasyncio.gather(*tasks)
 
 if __name__ == "__main__":
     try: uasyncio.run(main())
-    except KeyboardInterrupt: print("Program stopped.")
+    except KeyboardInterrupt: log("Program stopped.")
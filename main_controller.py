@@ -5,13 +5,12 @@
 import os
 import time
 import zipfile
-import tkinter as tk
-from PIL import Image, ImageTk
-import socket
-from pywinauto.application import Application
-from screeninfo import get_monitors
 import subprocess
 
+from profiling import StartupProfile, LayerProfiler, summarize
+from motion_transport import open_transport
+from light_engine_uia import UIALightEngine, LIGHT_ENGINE_WINDOW_TITLE
+
 
 # --- 1. 使用者設定區 ---
 class PrintConfig:
@@ -24,33 +23,40 @@ class PrintConfig:
     PEEL_LIFT_DISTANCE = 5.05
     PEEL_RETURN_DISTANCE = 5.0
 
+    # 快速移動 (打印前定位與結束回位)：速度 mm/s、加速度 mm/s^2
+    TRAVEL_SPEED = 20.0
+    TRAVEL_ACCELERATION = 40.0
+    # 打印前移動到的 Z 絕對位置 (mm，以 ESP32 開機或 SET_POS 時為原點)；None 表示留在目前位置
+    PRINT_START_Z = None
+    # 打印結束後停在起始位置上方的距離 (mm)
+    END_LIFT_DISTANCE = 2.0
+
     # 曝光參數 (僅用於計算打印時間)
     NORMAL_EXPOSURE_TIME_S = 2.5
     FIRST_LAYER_EXPOSURE_TIME_S = 5
     TRANSITION_LAYERS = 5
 
     # 硬體連接設定
-    ESP32_IP_ADDRESS = "10.10.17.187"  # 請修改為您 ESP32 的實際 IP
+    ESP32_IP_ADDRESS = "10.10.17.187"  # 請修改為您 ESP32 的實際 IP；USB 串口連接時改為 "serial:COM3"
     ESP32_PORT = 8899
 
     # 投影儀螢幕索引 (0=主螢幕, 1=第二個螢幕, ...)
     PROJECTOR_MONITOR_INDEX = 1
+    # 顯示後端: 'tk' (視窗) 或 'framebuffer' (Linux 無桌面環境，直接寫入 FRAMEBUFFER_DEVICE)
+    DISPLAY_BACKEND = 'tk'
+    FRAMEBUFFER_DEVICE = '/dev/fb1'
+
+    # 逐層計時追蹤檔 (.json 或 .csv)，設為 None 則不輸出
+    PROFILE_TRACE_PATH = "print_trace.json"
 
 
 # --- 2. 光機 GUI 自動化控制模組 (簡化版) ---
-class LightEngineGUIControl:
+class LightEngineGUIControl(UIALightEngine):
     def __init__(self):
-        """僅連接到已手動打開的軟體"""
-        self.app = None
-        self.main_win = None
+        """僅連接到已手動打開的軟體；元素解析一次後快取，開關燈直接呼叫 UIA 模式 (見 light_engine_uia.py)"""
         try:
-            window_title = "Full-HD UV LE Controller v2.1"
-            print(f"正在連接到已手動設定好的視窗: '{window_title}'...")
-            self.app = Application(backend="uia").connect(title=window_title, timeout=60)
-            self.main_win = self.app.window(title=window_title)
-            self.main_win.wait('ready', timeout=30)
-            self.led_combo = self.main_win.child_window(auto_id="ComboBoxLedEnable")
-            self.set_led_onoff_button = self.main_win.child_window(auto_id="ButtonSetLedOnOff")
+            print(f"正在連接到已手動設定好的視窗: '{LIGHT_ENGINE_WINDOW_TITLE}'...")
+            super().__init__(LIGHT_ENGINE_WINDOW_TITLE)
             print("成功連接到光機軟體，自動化已準備就緒。")
         except Exception as e:
             print(f"錯誤: 連接到控制軟體失敗。請確認您已手動打開並設定好軟體。 {e}")
@@ -58,23 +64,26 @@ class LightEngineGUIControl:
 
     def led_on(self):
         print("指令: 開啟曝光 (LED ON)")
-        self.led_combo.select("On")
-        self.set_led_onoff_button.click()
-        time.sleep(0.1)
+        super().led_on()
 
     def led_off(self):
         print("指令: 關閉曝光 (LED OFF)")
-        self.led_combo.select("Off")
-        self.set_led_onoff_button.click()
-        time.sleep(0.1)
+        super().led_off()
 
     def close(self):
+        st = self.stats()
+        if st['n']:
+            print(f"光機開關燈 (UIA): {st['n']} 次，平均 {st['mean_ms']:.1f} ms，p90 {st['p90_ms']:.1f} ms，"
+                  f"最大 {st['max_ms']:.1f} ms，元素解析 {st['resolves']} 次")
         print("自動化打印流程已結束，請手動關閉光機控制軟體。")
 
 
 # --- 3. 投影儀HDMI顯示模組 (螢幕索引版) ---
 class ProjectorDisplay:
     def __init__(self, monitor_index):
+        # tkinter / screeninfo 僅在建立投影視窗時才導入，縮短腳本啟動時間
+        import tkinter as tk
+        from screeninfo import get_monitors
         self.root = tk.Tk()
         monitors = sorted(get_monitors(), key=lambda m: m.x)
         print(f"偵測到 {len(monitors)} 個螢幕，並已排序。")
@@ -101,17 +110,41 @@ class ProjectorDisplay:
         self.label.pack(expand=True, fill=tk.BOTH)
         self.root.update_idletasks()
 
-    def show_image(self, image_path):
+    def load_image(self, image_path):
+        """讀取並解碼切片 (不縮放)"""
+        from PIL import Image
+        img = Image.open(image_path)
+        img.load()
+        return img
+
+    def scale_image(self, img):
+        """縮放到投影視窗尺寸"""
+        from PIL import Image
+        win_width = self.root.winfo_width()
+        win_height = self.root.winfo_height()
+        if win_width > 1 and win_height > 1:
+            if img.size != (win_width, win_height):
+                img = img.resize((win_width, win_height), Image.Resampling.LANCZOS)
+        return img
+
+    def present(self, img):
+        """轉成 PhotoImage 並刷新視窗"""
+        from PIL import ImageTk
+        self.tk_image = ImageTk.PhotoImage(img)
+        self.label.config(image=self.tk_image)
+        self.root.update()
+
+    def show_image(self, image_path, profiler=None):
         try:
-            img = Image.open(image_path)
-            win_width = self.root.winfo_width()
-            win_height = self.root.winfo_height()
-            if win_width > 1 and win_height > 1:
-                if img.size != (win_width, win_height):
-                    img = img.resize((win_width, win_height), Image.Resampling.LANCZOS)
-            self.tk_image = ImageTk.PhotoImage(img)
-            self.label.config(image=self.tk_image)
-            self.root.update()
+            if profiler is None:
+                self.present(self.scale_image(self.load_image(image_path)))
+                return
+            with profiler.phase('load'):
+                img = self.load_image(image_path)
+            with profiler.phase('scale'):
+                img = self.scale_image(img)
+            with profiler.phase('display'):
+                self.present(img)
         except Exception as e:
             print(f"顯示圖片錯誤: {e}")
 
@@ -127,25 +160,20 @@ class ProjectorDisplay:
 # --- 4. Z軸TCP通訊模組 (同步通訊版) ---
 class ZAxisControl:
     def __init__(self, host, port, timeout=120):
+        # host 可為 IP (Wi-Fi TCP) 或 'serial:COM3' (USB 串口)，見 motion_transport.py
         self.host = host
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.settimeout(timeout)
         try:
-            print(f"正在通過 TCP 連接到 ESP32 於 {host}:{port}...")
-            self.sock.connect((host, port))
-            self.reader = self.sock.makefile('r')
-            print(f"成功連接到 ESP32。")
+            print(f"正在連接到 ESP32 於 {host}...")
+            self.transport = open_transport(host, port, timeout)
+            print(f"成功連接到 ESP32 ({self.transport.name})。")
         except Exception as e:
-            print(f"錯誤: 無法通過 TCP 連接到 ESP32。 {e}")
+            print(f"錯誤: 無法連接到 ESP32。 {e}")
             exit()
 
     def _send_cmd_and_wait_response(self, cmd):
         try:
-            full_cmd = cmd + "\n"
-            self.sock.sendall(full_cmd.encode())
-            response = self.reader.readline().strip()
-            return response
+            return self.transport.request(cmd)
         except Exception as e:
             print(f"通訊錯誤: {e}")
             return "ERROR"
@@ -179,9 +207,32 @@ class ZAxisControl:
             print(f"相對移動錯誤！響應: {response}")
             return False
 
+    def config_travel(self, speed, accel):
+        return "OK" in self._send_cmd_and_wait_response(f"CONFIG_TRAVEL,{speed},{accel}")
+
+    def move_absolute(self, position_mm):
+        print(f"發送絕對移動指令: {position_mm} mm...")
+        response = self._send_cmd_and_wait_response(f"MOVE_ABS,{position_mm}")
+        if "DONE" in response:
+            print("絕對移動完成。")
+            return True
+        print(f"絕對移動錯誤！響應: {response}")
+        return False
+
+    def get_position(self):
+        """回傳 Z 軸絕對位置 (mm)；舊版韌體不支援時回傳 None。"""
+        response = self._send_cmd_and_wait_response("GET_POS")
+        if not response.startswith("POS,"):
+            return None
+        return float(response.split('=')[1].split(':')[1])
+
     def close(self):
-        self.sock.close()
-        print("TCP 連接已關閉。")
+        st = self.transport.stats()
+        if st['n']:
+            print(f"運動指令往返 ({st['transport']}): {st['n']} 次，平均 {st['mean_ms']:.1f} ms，"
+                  f"p90 {st['p90_ms']:.1f} ms，最大 {st['max_ms']:.1f} ms")
+        self.transport.close()
+        print("ESP32 連接已關閉。")
 
 
 # --- 5. 主流程控制 (混合模式版) ---
@@ -192,6 +243,9 @@ def main():
     light_engine = None
     print_completed_successfully = False
     total_layers = 0
+    start_z = None
+    profile = StartupProfile()
+    profiler = LayerProfiler(config.PROFILE_TRACE_PATH, meta={'controller': 'main_controller'})
     try:
         print(f"正在從 {config.ZIP_FILE_PATH} 解壓縮文件...")
         if not os.path.exists(config.TEMP_EXTRACT_DIR):
@@ -205,28 +259,45 @@ def main():
             raise FileNotFoundError("錯誤: 壓縮包中未找到任何PNG文件。")
         image_paths = [os.path.join(config.TEMP_EXTRACT_DIR, f) for f in image_files]
         print(f"找到 {total_layers} 個切片文件。")
+        profile.mark('slices_extracted')
 
         exe_path = os.path.abspath(config.CONTROLLER_EXE_PATH)
         exe_dir = os.path.dirname(exe_path)
         print(f"正在從目錄 '{exe_dir}' 啟動軟體: {os.path.basename(exe_path)}")
         subprocess.Popen(exe_path, cwd=exe_dir)
+        profile.mark('exe_launched')
         z_axis = ZAxisControl(config.ESP32_IP_ADDRESS, config.ESP32_PORT)
         if not z_axis.send_config(config.PEEL_LIFT_DISTANCE, config.PEEL_RETURN_DISTANCE):
             raise RuntimeError("下位機配置失敗，程式終止。")
-        while True:
-            user_command = input(
-                "\n>>> 軟體已啟動。請手動完成設定（Projector ON -> 點擊彈窗 -> 選HDMI -> 設電流），完成後在此處輸入 'print' 並按 Enter 鍵繼續：")
-            if user_command.strip().lower() == 'print':
-                break
+        if not z_axis.config_travel(config.TRAVEL_SPEED, config.TRAVEL_ACCELERATION):
+            # 舊版韌體沒有 CONFIG_TRAVEL：沿用韌體預設的快速移動速度，不中止打印
+            print("警告: 下位機不支援快速移動配置 (esp32/main.py 可能未更新)，沿用韌體預設值。")
+        if config.PRINT_START_Z is not None and not z_axis.move_absolute(config.PRINT_START_Z):
+            raise RuntimeError("打印前定位失敗，程式終止。")
+        start_z = z_axis.get_position()
+        profile.mark('esp32_configured')
+        with profile.user_wait('manual_setup'):
+            while True:
+                user_command = input(
+                    "\n>>> 軟體已啟動。請手動完成設定（Projector ON -> 點擊彈窗 -> 選HDMI -> 設電流），完成後在此處輸入 'print' 並按 Enter 鍵繼續：")
+                if user_command.strip().lower() == 'print':
+                    break
         light_engine = LightEngineGUIControl()
+        profile.mark('light_engine_connected')
         print("正在創建投影顯示視窗...")
-        display = ProjectorDisplay(config.PROJECTOR_MONITOR_INDEX)
+        if config.DISPLAY_BACKEND == 'framebuffer':
+            from framebuffer_display import FramebufferDisplay
+            display = FramebufferDisplay(config.FRAMEBUFFER_DEVICE)
+        else:
+            display = ProjectorDisplay(config.PROJECTOR_MONITOR_INDEX)
         display.blank_screen()
+        profile.mark('display_ready')
         print("\n--- 所有硬體已初始化，準備開始打印 ---")
         start_time = time.time()
         for i, image_path in enumerate(image_paths):
             layer_num = i + 1
             print(f"\n--- 正在打印第 {layer_num} / {total_layers} 層 ---")
+            profiler.begin_layer(layer_num)
             if layer_num == 1:
                 exposure_time = config.FIRST_LAYER_EXPOSURE_TIME_S
             elif layer_num <= config.TRANSITION_LAYERS:
@@ -236,15 +307,26 @@ def main():
             else:
                 exposure_time = config.NORMAL_EXPOSURE_TIME_S
             print(f"曝光時間: {exposure_time:.2f} 秒")
-            display.show_image(image_path)
-            light_engine.led_on()
-            time.sleep(exposure_time)
-            light_engine.led_off()
-            display.blank_screen()
+            display.show_image(image_path, profiler)
+            with profiler.phase('led_on'):
+                light_engine.led_on()
+            if layer_num == 1:
+                profile.mark('first_layer')
+                print("\n".join(profile.report()))
+            with profiler.phase('exposure'):
+                time.sleep(exposure_time)
+            with profiler.phase('led_off'):
+                light_engine.led_off()
+            with profiler.phase('blank'):
+                display.blank_screen()
             if layer_num < total_layers:
-                if not z_axis.move_to_next_layer():
+                with profiler.phase('motion'):
+                    moved = z_axis.move_to_next_layer()
+                if not moved:
+                    profiler.end_layer()
                     print("Z軸運動失敗，打印終止！")
                     break
+            profiler.end_layer()
         else:
             print_completed_successfully = True
         end_time = time.time()
@@ -257,12 +339,19 @@ def main():
     finally:
         if print_completed_successfully and z_axis and total_layers > 1:
             print("\n正在執行打印結束後的回位程序...")
-            layer_height = config.PEEL_LIFT_DISTANCE - config.PEEL_RETURN_DISTANCE
-            total_print_height = (total_layers - 1) * layer_height
-            if total_print_height > 0:
-                z_axis.move_relative(-total_print_height)
-            z_axis.move_relative(2)
+            if start_z is not None:
+                # 韌體以整數步數記錄位置，直接快速移動到起始位置上方，不累積逐層誤差
+                z_axis.move_absolute(start_z + config.END_LIFT_DISTANCE)
+            else:
+                layer_height = config.PEEL_LIFT_DISTANCE - config.PEEL_RETURN_DISTANCE
+                total_print_height = (total_layers - 1) * layer_height
+                if total_print_height > 0:
+                    z_axis.move_relative(-total_print_height)
+                z_axis.move_relative(config.END_LIFT_DISTANCE)
             print("回位程序完成。")
+        if profiler.save():
+            print("\n".join(summarize(profiler.records)))
+            print(f"逐層計時已寫入 {config.PROFILE_TRACE_PATH}，可用 'python profiling.py report {config.PROFILE_TRACE_PATH}' 查看。")
         print("\n正在關閉所有設備...")
         if light_engine:
             light_engine.close()
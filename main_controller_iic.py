@@ -5,11 +5,10 @@
 import os
 import time
 import zipfile
-import tkinter as tk
-from PIL import Image, ImageTk
-import socket
-from screeninfo import get_monitors
 import subprocess
+
+from profiling import StartupProfile, LayerProfiler, summarize
+from motion_transport import open_transport
 import ctypes  # 用於I2C控制
 
 
@@ -41,6 +40,12 @@ class PrintConfig:
 
     # 投影儀螢幕索引 (0=主螢幕, 1=第二個螢幕, ...)
     PROJECTOR_MONITOR_INDEX = 1
+    # 顯示後端: 'tk' (視窗) 或 'framebuffer' (Linux 無桌面環境，直接寫入 FRAMEBUFFER_DEVICE)
+    DISPLAY_BACKEND = 'tk'
+    FRAMEBUFFER_DEVICE = '/dev/fb1'
+
+    # 逐層計時追蹤檔 (.json 或 .csv)，設為 None 則不輸出
+    PROFILE_TRACE_PATH = "print_trace.json"
 
 
 # --- 2. 混合光機控制模組 (I2C + GUI) ---
@@ -168,6 +173,9 @@ class HybridLightEngineControl:
 # --- (ProjectorDisplay 和 ZAxisControl 類別保持不變) ---
 class ProjectorDisplay:
     def __init__(self, monitor_index):
+        # tkinter / screeninfo 僅在建立投影視窗時才導入，縮短腳本啟動時間
+        import tkinter as tk
+        from screeninfo import get_monitors
         self.root = tk.Tk()
         try:
             monitors = sorted(get_monitors(), key=lambda m: m.x)
@@ -194,10 +202,20 @@ class ProjectorDisplay:
         self.root.update_idletasks()
         self.target_size = (self.root.winfo_width(), self.root.winfo_height())
 
-    def show_image(self, image_path):
+    def show_image(self, image_path, profiler=None):
+        from PIL import Image, ImageTk
         try:
-            img = Image.open(image_path).resize(self.target_size, Image.Resampling.LANCZOS)
-            self.tk_image = ImageTk.PhotoImage(img)
+            if profiler is None:
+                img = Image.open(image_path).resize(self.target_size, Image.Resampling.LANCZOS)
+                self.tk_image = ImageTk.PhotoImage(img)
+            else:
+                with profiler.phase('load'):
+                    img = Image.open(image_path)
+                    img.load()
+                with profiler.phase('scale'):
+                    img = img.resize(self.target_size, Image.Resampling.LANCZOS)
+                with profiler.phase('display'):
+                    self.tk_image = ImageTk.PhotoImage(img)
             self.label.config(image=self.tk_image)
             self.root.update()
         except Exception as e:
@@ -213,18 +231,17 @@ class ProjectorDisplay:
 class ZAxisControl:
     def __init__(self, host, port, timeout=120):
         try:
-            print(f"正在連接到ESP32於 {host}:{port}...")
-            self.sock = socket.create_connection((host, port), timeout)
-            self.reader = self.sock.makefile('r', encoding='utf-8')
-            print("成功連接到 ESP32。")
+            # host 可為 IP (Wi-Fi TCP) 或 'serial:COM3' (USB 串口)
+            print(f"正在連接到ESP32於 {host}...")
+            self.transport = open_transport(host, port, timeout)
+            print(f"成功連接到 ESP32 ({self.transport.name})。")
         except Exception as e:
             raise ConnectionError(f"無法連接到 ESP32: {e}")
 
     def _send_cmd_and_wait_response(self, cmd):
         try:
-            self.sock.sendall((cmd + "\n").encode('utf-8'))
-            return self.reader.readline().strip()
-        except (socket.timeout, ConnectionResetError) as e:
+            return self.transport.request(cmd)
+        except (OSError, ConnectionResetError) as e:
             print(f"通訊錯誤: {e}"); return "ERROR"
 
     def send_config(self, lift_dist, return_dist):
@@ -241,7 +258,9 @@ class ZAxisControl:
         return "DONE" in self._send_cmd_and_wait_response(f"MOVE_REL,{distance_mm}")
 
     def close(self):
-        self.sock.close(); print("TCP 連接已關閉。")
+        st = self.transport.stats()
+        if st['n']: print(f"運動指令往返 ({st['transport']}): 平均 {st['mean_ms']:.1f} ms，p90 {st['p90_ms']:.1f} ms，最大 {st['max_ms']:.1f} ms")
+        self.transport.close(); print("ESP32 連接已關閉。")
 
 
 # --- 5. 主流程控制 (混合模式版) ---
@@ -250,6 +269,8 @@ def main():
     display = None
     z_axis = None
     light_engine = None
+    profile = StartupProfile()
+    profiler = LayerProfiler(config.PROFILE_TRACE_PATH, meta={'controller': 'main_controller_iic'})
 
     try:
         # ... (解壓縮檔案的程式碼不變)
@@ -262,16 +283,20 @@ def main():
         if total_layers == 0: raise FileNotFoundError("壓縮包中未找到任何PNG文件。")
         image_paths = [os.path.join(config.TEMP_EXTRACT_DIR, f) for f in image_files]
         print(f"找到 {total_layers} 個切片文件。")
+        profile.mark('slices_extracted')
 
         exe_path = os.path.abspath(config.CONTROLLER_EXE_PATH)
         subprocess.Popen(exe_path, cwd=os.path.dirname(exe_path))
+        profile.mark('exe_launched')
 
         z_axis = ZAxisControl(config.ESP32_IP_ADDRESS, config.ESP32_PORT)
         if not z_axis.send_config(config.PEEL_LIFT_DISTANCE, config.PEEL_RETURN_DISTANCE):
             raise RuntimeError("下位機配置失敗，程式終止。")
+        profile.mark('esp32_configured')
 
-        input("\n>>> 軟體已啟動。請手動操作GUI，點擊 Projector ON 並在彈窗中點擊OK。\n"
-              "    完成後，請按 Enter 鍵讓程式繼續...")
+        with profile.user_wait('manual_projector_on'):
+            input("\n>>> 軟體已啟動。請手動操作GUI，點擊 Projector ON 並在彈窗中點擊OK。\n"
+                  "    完成後，請按 Enter 鍵讓程式繼續...")
 
         # !!!!!!! 核心改變 !!!!!!!
         light_engine = HybridLightEngineControl()
@@ -279,11 +304,18 @@ def main():
         # 透過GUI設定電流
         if not light_engine.set_current_via_gui(config.LED_CURRENT_VALUE):
             raise RuntimeError("設定電流失敗，程式終止。")
+        profile.mark('light_engine_ready')
 
-        input(f">>> 電流已設定為 {config.LED_CURRENT_VALUE}。請在GUI上確認HDMI為影像來源。\n"
-              "    一切就緒後，請按 Enter 鍵開始打印...")
+        with profile.user_wait('manual_hdmi_check'):
+            input(f">>> 電流已設定為 {config.LED_CURRENT_VALUE}。請在GUI上確認HDMI為影像來源。\n"
+                  "    一切就緒後，請按 Enter 鍵開始打印...")
 
-        display = ProjectorDisplay(config.PROJECTOR_MONITOR_INDEX)
+        if config.DISPLAY_BACKEND == 'framebuffer':
+            from framebuffer_display import FramebufferDisplay
+            display = FramebufferDisplay(config.FRAMEBUFFER_DEVICE)
+        else:
+            display = ProjectorDisplay(config.PROJECTOR_MONITOR_INDEX)
+        profile.mark('display_ready')
 
         print("\n--- 所有硬體已初始化，準備開始打印 ---")
         start_time = time.time()
@@ -291,6 +323,7 @@ def main():
         for i, image_path in enumerate(image_paths):
             layer_num = i + 1
             print(f"\n--- 正在打印第 {layer_num} / {total_layers} 層 ---")
+            profiler.begin_layer(layer_num)
 
             # (計算曝光時間的邏輯不變)
             if layer_num == 1:
@@ -304,13 +337,25 @@ def main():
             print(f"曝光時間: {exposure_time:.2f} 秒")
 
             # 使用精準的I2C控制曝光
-            display.show_image(image_path)
-            light_engine.led_on()
-            time.sleep(exposure_time)
-            light_engine.led_off()
-            display.blank_screen()
-
-            if layer_num < total_layers and not z_axis.move_to_next_layer():
+            display.show_image(image_path, profiler)
+            with profiler.phase('led_on'):
+                light_engine.led_on()
+            if layer_num == 1:
+                profile.mark('first_layer')
+                print("\n".join(profile.report()))
+            with profiler.phase('exposure'):
+                time.sleep(exposure_time)
+            with profiler.phase('led_off'):
+                light_engine.led_off()
+            with profiler.phase('blank'):
+                display.blank_screen()
+
+            moved = True
+            if layer_num < total_layers:
+                with profiler.phase('motion'):
+                    moved = z_axis.move_to_next_layer()
+            profiler.end_layer()
+            if not moved:
                 print("Z軸運動失敗，打印終止！");
                 break
         else:
@@ -321,6 +366,9 @@ def main():
 
     finally:
         print("\n--- 正在執行清理程序 ---")
+        if profiler.save():
+            print("\n".join(summarize(profiler.records)))
+            print(f"逐層計時已寫入 {config.PROFILE_TRACE_PATH}，可用 'python profiling.py report {config.PROFILE_TRACE_PATH}' 查看。")
         # (清理邏輯不變)
         if light_engine: light_engine.close()
         if z_axis: z_axis.close()
@@ -1,93 +1,161 @@
 # main_gui.py - 三軸穩定版 (v3.1 - A軸改為限位開關控制)
 
-import sys, os, time, zipfile, socket, subprocess
-from multiprocessing.connection import Client
-from PIL import Image
+import sys, os, time, zipfile, subprocess, logging
+
+from profiling import StartupProfile, LayerProfiler, summarize
+from log_sink import BufferedLogHandler, get_print_logger, LOGGER_NAME
+from projector_client import launch_projector, connect_projector, DEFAULT_AUTHKEY
+from layer_program import build_layer_program, program_lines, TRIGGER_BYTE
+from motion_transport import open_transport, fetch_logs
+from motion_config import sync_config
+from protocol_trace import TraceRecorder, TracedTransport, TracedConnection
+from light_engine_uia import UIALightEngine, LIGHT_ENGINE_WINDOW_TITLE
+from layer_preview import LayerPreviewPane
+from slice_source import SLICE_FORMATS
 
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QGroupBox,
                              QLabel, QLineEdit, QPushButton, QPlainTextEdit, QDoubleSpinBox,
                              QFileDialog)
-from PyQt5.QtCore import QThread, QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import QThread, QObject, QTimer, pyqtSignal, pyqtSlot
 
-from pywinauto.application import Application
+# pywinauto / PIL 體積大、載入慢，改為在實際用到時才導入
 
 # --- 後端邏輯 ---
-class LightEngineGUIControl:
+def wait_for_light_engine_window(timeout=60, interval=0.2):
+    """輪詢光機軟體的 UIA 視窗是否出現，取代啟動後的固定等待。"""
+    from pywinauto import Desktop
+    if not Desktop(backend="uia").window(title=LIGHT_ENGINE_WINDOW_TITLE).exists(timeout=timeout, retry_interval=interval):
+        raise RuntimeError(f"等待光機軟體視窗逾時 ({timeout}s)")
+
+def extract_slices(path, temp_dir):
+    """切片壓縮包直接解壓；.ctb / .cbddlp / .photon 逐層解碼後存成與壓縮包相同命名的 1.png, 2.png ..."""
+    if os.path.splitext(path)[1].lower() == '.zip':
+        with zipfile.ZipFile(path, 'r') as zip_ref: zip_ref.extractall(temp_dir)
+        return
+    from PIL import Image
+    from slice_source import open_slice_source
+    source = open_slice_source(path)
+    try:
+        for i in range(len(source)): Image.fromarray(source.decode(i)).save(os.path.join(temp_dir, f"{i + 1}.png"))
+    finally: source.close()
+
+class LightEngineGUIControl(UIALightEngine):
+    # 元素只解析一次並快取，開關燈直接呼叫 UIA 的 SelectionItem / Invoke 模式，見 light_engine_uia.py
     def __init__(self):
-        self.app = None; self.main_win = None
-        try:
-            window_title = "Full-HD UV LE Controller v2.1"; self.app = Application(backend="uia").connect(title=window_title, timeout=60); self.main_win = self.app.window(title=window_title); self.main_win.wait('ready', timeout=30)
-            self.led_combo = self.main_win.child_window(auto_id="ComboBoxLedEnable"); self.set_led_onoff_button = self.main_win.child_window(auto_id="ButtonSetLedOnOff")
+        try: super().__init__(LIGHT_ENGINE_WINDOW_TITLE)
         except Exception as e: raise RuntimeError(f"連接到控制軟體失敗: {e}")
-    def led_on(self):
-        try: self.main_win.set_focus(); self.led_combo.select("On"); time.sleep(0.1); self.set_led_onoff_button.click(); time.sleep(0.1)
-        except Exception as e: raise RuntimeError(f"自動化控制 'LED On' 失敗: {e}")
-    def led_off(self):
-        try: self.main_win.set_focus(); self.led_combo.select("Off"); time.sleep(0.1); self.set_led_onoff_button.click(); time.sleep(0.1)
-        except Exception as e: raise RuntimeError(f"自動化控制 'LED Off' 失敗: {e}")
-    def close(self): pass
 
 class MotionController:
-    def __init__(self, host, port, timeout=60):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM); self.sock.settimeout(timeout); self.sock.connect((host, port)); self.reader = self.sock.makefile('r')
-    def _send_cmd_and_wait_response(self, cmd):
-        full_cmd = cmd + "\n"; self.sock.sendall(full_cmd.encode()); response = self.reader.readline().strip(); return response
-    def close(self): self.sock.close()
-    def config_axis(self, axis, pulse_per_rev, lead): return "OK" in self._send_cmd_and_wait_response(f"CONFIG_AXIS,{axis},{pulse_per_rev},{lead}")
-    def config_z_peel(self, params): return "OK" in self._send_cmd_and_wait_response(f"CONFIG_Z_PEEL,{params['peel_lift_z1']},{params['peel_return_z2']},{params['z_speed_down']},{params['z_speed_up']}")
-    def config_a_wipe(self, params):
-        return "OK" in self._send_cmd_and_wait_response(f"CONFIG_A_WIPE,{params['a_fast_speed']},{params['a_slow_speed']}")
+    # address 為 IP (Wi-Fi TCP) 或 'serial:COM3' (USB 串口)，見 motion_transport.py
+    # trace 為 protocol_trace.TraceRecorder 時記錄每筆指令與回覆
+    def __init__(self, address, port, timeout=60, trace=None):
+        self.transport = open_transport(address, port, timeout)
+        if trace: self.transport = TracedTransport(self.transport, trace)
+    def _send_cmd_and_wait_response(self, cmd): return self.transport.request(cmd)
+    def latency_stats(self): return self.transport.stats()
+    # 出錯後才呼叫：連線可能已經不正常，以短逾時讀取，避免卡住打印執行緒
+    def fetch_logs(self, timeout=3.0): self.transport.set_timeout(timeout); return fetch_logs(self.transport)
+    def close(self): self.transport.close()
+    # 全部軸配置 (軸參數、剝離、擦拭、運動曲線、快速移動) 一次送出 (CONFIG_BATCH)；韌體已保存相同版本時只比對雜湊，回傳 'unchanged' / 'sent' / 'legacy'
+    def sync_config(self, params): return sync_config(self._send_cmd_and_wait_response, params)
     def move_to_next_layer(self): return "DONE" in self._send_cmd_and_wait_response("NEXT_LAYER")
-    def move_relative(self, axis, distance, speed): accel = speed * 2; return "DONE" in self._send_cmd_and_wait_response(f"MOVE_REL,{axis},{distance},{speed},{accel}")
+    def upload_program(self, steps):
+        # 一次送出所有行再依序讀取回覆，上傳時間不隨層數累積往返延遲
+        lines = program_lines(steps); self.transport.write(("\n".join(lines) + "\n").encode()); replies = [self.transport.readline() for _ in lines]
+        rejected = [r for r in replies if not r.startswith("OK")]
+        if rejected: raise RuntimeError(f"逐層程式上傳失敗: {rejected[0]}")
+        return len(steps)
+    def step_program(self): self.transport.write(TRIGGER_BYTE); return self.transport.readline().startswith("STEP_DONE")
+    # 不帶速度時以該軸快速移動設定執行；位置由韌體以整數步數記錄，不累積浮點誤差
+    def move_absolute(self, axis, position, speed=None): return "DONE" in self._send_cmd_and_wait_response(f"MOVE_ABS,{axis},{position}" + (f",{speed}" if speed else ""))
+    def get_position(self, axis):
+        response = self._send_cmd_and_wait_response(f"GET_POS,{axis}")
+        if not response.startswith("POS,"): raise RuntimeError(f"讀取 {axis} 軸位置失敗: {response}")
+        return float(response.split('=')[1].split(':')[1])
+    # 不帶 accel，由韌體依該軸 CONFIG_MOTION 的曲線與加速度執行
+    def move_relative(self, axis, distance, speed): return "DONE" in self._send_cmd_and_wait_response(f"MOVE_REL,{axis},{distance},{speed}")
 
 class PrintWorker(QObject):
-    log = pyqtSignal(str); finished = pyqtSignal(); error = pyqtSignal(str)
-    def __init__(self, params): super().__init__(); self.params = params; self.is_running = True
+    finished = pyqtSignal(); error = pyqtSignal(str)
+    # 日誌不再逐行發送信號，而是寫入 logging，由 MainWindow 定時批次顯示
+    def __init__(self, params): super().__init__(); self.params = params; self.is_running = True; self.log = logging.getLogger(LOGGER_NAME)
     @pyqtSlot()
     def run(self):
         motion_controller = None; light_engine = None; projector_process = None; projector_conn = None; light_engine_process = None
+        profile = StartupProfile(); profiler = LayerProfiler(self.params.get('profile_trace_path'), meta={'controller': 'main_gui'})
+        trace = TraceRecorder(self.params['protocol_trace_path'], meta={'controller': 'main_gui'}) if self.params.get('protocol_trace_path') else None
         try:
-            black_image_path = self.params['black_image_path']; self.log.emit("--- 打印任務開始 ---")
-            exe_path = self.params['controller_exe_path']; self.log.emit(f"正在檢查光機控制軟體路徑: {exe_path}...")
+            black_image_path = self.params['black_image_path']; self.log.info("--- 打印任務開始 ---")
+            exe_path = self.params['controller_exe_path']; self.log.info(f"正在檢查光機控制軟體路徑: {exe_path}...")
             if not os.path.exists(exe_path): raise RuntimeError(f"光機控制軟體未找到，請檢查路徑: {exe_path}")
-            self.log.emit("正在啟動光機控制軟體..."); light_engine_process = subprocess.Popen([exe_path]); time.sleep(3)
-            self.log.emit("正在啟動獨立投影視窗進程..."); address = ('localhost', 6000); authkey = b'secret-key-for-projector'
-            python_exe = sys.executable; projector_script = os.path.join(os.path.dirname(__file__), 'projector_view.py')
-            if not os.path.exists(projector_script): raise RuntimeError(f"投影腳本 projector_view.py 未找到！")
-            cmd = [python_exe, projector_script, str(self.params['monitor_index']), address[0], str(address[1]), authkey.decode()]
-            startupinfo = None
-            if os.name == 'nt': startupinfo = subprocess.STARTUPINFO(); startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            projector_process = subprocess.Popen(cmd, startupinfo=startupinfo); time.sleep(2)
-            projector_conn = Client(address, authkey=authkey); self.log.emit("投影視窗進程已連接。")
-            self.log.emit(f"正在從 {self.params['zip_path']} 解壓縮文件...")
+            self.log.info("正在啟動光機控制軟體..."); light_engine_process = subprocess.Popen([exe_path]); profile.mark('exe_launched')
+            self.log.info("正在啟動獨立投影視窗進程..."); address = ('localhost', 6000); authkey = DEFAULT_AUTHKEY
+            projector_process = launch_projector(self.params['monitor_index'], address, authkey); profile.mark('projector_launched')
+            # 兩個外部進程啟動的同時，先完成解壓縮與 ESP32 配置
+            self.log.info(f"正在從 {self.params['zip_path']} 解壓縮文件...")
             if not os.path.exists(self.params['temp_dir']): os.makedirs(self.params['temp_dir'])
-            with zipfile.ZipFile(self.params['zip_path'], 'r') as zip_ref: zip_ref.extractall(self.params['temp_dir'])
+            extract_slices(self.params['zip_path'], self.params['temp_dir'])
             image_files = sorted([f for f in os.listdir(self.params['temp_dir']) if f.endswith('.png') and os.path.splitext(f)[0].isdigit()], key=lambda x: int(os.path.splitext(x)[0]))
-            total_layers = len(image_files); image_paths = [os.path.join(self.params['temp_dir'], f) for f in image_files]; self.log.emit(f"找到 {total_layers} 個切片文件。")
-            self.log.emit("正在連接到 ESP32..."); motion_controller = MotionController(self.params['esp32_ip'], self.params['esp32_port']); self.log.emit("ESP32 連接成功。")
-            self.log.emit("正在發送所有配置..."); motion_controller.config_axis('z', self.params['z_pulse_rev'], self.params['z_lead']); motion_controller.config_axis('a', self.params['a_pulse_rev'], self.params['a_lead']); motion_controller.config_axis('c', self.params['c_pulse_rev'], self.params['c_lead'])
-            motion_controller.config_z_peel(self.params); motion_controller.config_a_wipe(self.params); self.log.emit("配置發送完成。")
-            self.log.emit("正在連接到光機控制軟體..."); light_engine = LightEngineGUIControl(); self.log.emit("光機軟體連接成功。")
+            total_layers = len(image_files); image_paths = [os.path.join(self.params['temp_dir'], f) for f in image_files]; self.log.info(f"找到 {total_layers} 個切片文件。"); profile.mark('slices_extracted')
+            self.log.info("正在連接到 ESP32..."); motion_controller = MotionController(self.params['esp32_ip'], self.params['esp32_port'], trace=trace); self.log.info("ESP32 連接成功。")
+            self.log.info("正在同步配置..."); result = motion_controller.sync_config(self.params); self.log.info("配置未變更，沿用韌體已存配置。" if result == 'unchanged' else "配置發送完成。"); profile.mark('esp32_configured')
+            use_program = self.params['use_layer_program']
+            if use_program:
+                # 每層的剝離 / 擦拭參數預先上傳，層間只送一個觸發字節；韌體拒絕 (舊版或記憶體不足) 時改回逐層 NEXT_LAYER
+                try: motion_controller.upload_program(build_layer_program(total_layers, self.params)); self.log.info(f"逐層程式已上傳 ({total_layers} 層)。"); profile.mark('program_uploaded')
+                except RuntimeError as e: use_program = False; self.log.warning(f"{e}，改用 NEXT_LAYER。")
+            projector_conn, ready = connect_projector(address, authkey); self.log.info("投影視窗進程已連接。"); profile.mark('projector_ready')
+            if trace: projector_conn = TracedConnection(projector_conn, trace, 'projector', ready)
+            self.log.info("正在等待光機控制軟體視窗..."); wait_for_light_engine_window(); profile.mark('exe_window_ready')
+            self.log.info("正在連接到光機控制軟體..."); light_engine = LightEngineGUIControl(); self.log.info("光機軟體連接成功。"); profile.mark('light_engine_connected')
             projector_conn.send({'command': 'show', 'path': black_image_path})
-            self.log.emit("--- 所有硬體已初始化，打印循環開始 ---")
+            self.log.info("--- 所有硬體已初始化，打印循環開始 ---")
             for i, image_path in enumerate(image_paths):
-                if not self.is_running: self.log.emit("打印任務被用戶終止。"); break
-                layer_num = i + 1; self.log.emit(f"\n--- 正在打印第 {layer_num} / {total_layers} 層 ---")
+                if not self.is_running: self.log.info("打印任務被用戶終止。"); break
+                layer_num = i + 1; self.log.info("\n--- 正在打印第 %d / %d 層 ---", layer_num, total_layers)
                 if layer_num == 1: exposure_time = self.params['first_layer_expo']
                 elif layer_num <= self.params['transition_layers']: progress = (layer_num - 1) / (self.params['transition_layers'] - 1); exposure_time = self.params['first_layer_expo'] - (self.params['first_layer_expo'] - self.params['normal_expo']) * progress
                 else: exposure_time = self.params['normal_expo']
-                self.log.emit(f"曝光時間: {exposure_time:.2f} 秒")
-                projector_conn.send({'command': 'show', 'path': image_path}); light_engine.led_on(); time.sleep(exposure_time)
-                projector_conn.send({'command': 'show', 'path': black_image_path}); light_engine.led_off()
+                self.log.info("曝光時間: %.2f 秒", exposure_time)
+                profiler.begin_layer(layer_num)
+                with profiler.phase('display'): projector_conn.send({'command': 'show', 'path': image_path})
+                with profiler.phase('led_on'): light_engine.led_on()
+                if layer_num == 1:
+                    profile.mark('first_layer')
+                    for line in profile.report(): self.log.info(line)
+                with profiler.phase('exposure'): time.sleep(exposure_time)
+                with profiler.phase('blank'): projector_conn.send({'command': 'show', 'path': black_image_path})
+                with profiler.phase('led_off'): light_engine.led_off()
+                moved = True
                 if layer_num < total_layers:
-                    if not motion_controller.move_to_next_layer(): raise RuntimeError("層間運動失敗，打印終止！")
-            else: self.log.emit("\n打印完成！")
-        except Exception as e: self.error.emit(f"打印過程中發生錯誤: {e}")
+                    with profiler.phase('motion'): moved = motion_controller.step_program() if use_program else motion_controller.move_to_next_layer()
+                record = profiler.end_layer()
+                # 逐層日誌以 % 參數延後格式化，等級過濾掉時連結構化欄位也不建立
+                if self.log.isEnabledFor(logging.INFO): self.log.info("第 %d 層完成，耗時 %.2f 秒", layer_num, record['wall_s'], extra={'fields': dict(layer=layer_num, wall_s=record['wall_s'], **record['phases'])})
+                if not moved: raise RuntimeError("層間運動失敗，打印終止！")
+            else: self.log.info("\n打印完成！")
+        except Exception as e:
+            self.error.emit(f"打印過程中發生錯誤: {e}")
+            # 出錯時取回韌體日誌的最後幾筆 (LOGS)，方便判斷是哪一步失敗；舊版韌體不支援或連線本身已失敗 (OSError) 時略過
+            if motion_controller and not isinstance(e, OSError):
+                try:
+                    for record in motion_controller.fetch_logs()[-20:]: self.log.info("[韌體] %s", record)
+                except Exception: pass
         finally:
-            self.log.emit("正在關閉所有設備...")
+            if profiler.save():
+                for line in summarize(profiler.records): self.log.info(line)
+                self.log.info(f"逐層計時已寫入 {profiler.trace_path}")
+            self.log.info("正在關閉所有設備...")
             if projector_conn: projector_conn.send({'command': 'close'}); projector_conn.close()
             if projector_process: projector_process.terminate()
-            if motion_controller: motion_controller.close()
+            if motion_controller:
+                st = motion_controller.latency_stats()
+                if st['n']: self.log.info(f"運動指令往返 ({st['transport']}): {st['n']} 次，平均 {st['mean_ms']:.1f} ms，p90 {st['p90_ms']:.1f} ms，最大 {st['max_ms']:.1f} ms")
+                motion_controller.close()
+            if light_engine:
+                st = light_engine.stats()
+                if st['n']: self.log.info(f"光機開關燈 (UIA): {st['n']} 次，平均 {st['mean_ms']:.1f} ms，p90 {st['p90_ms']:.1f} ms，最大 {st['max_ms']:.1f} ms，元素解析 {st['resolves']} 次")
+            if trace: trace.close(); self.log.info(f"協議追蹤已寫入 {trace.path}，可用 'python protocol_trace.py replay {trace.path}' 重播")
             if light_engine_process: light_engine_process.terminate()
             self.finished.emit()
     def stop(self): self.is_running = False
@@ -100,15 +168,26 @@ class PrintConfig:
     A_PULSE_PER_REV = 12800.0; A_LEAD = 75.0
     A_WIPE_SPEED_FAST = 80.0; A_WIPE_SPEED_SLOW = 10.0; A_JOG_SPEED = 40.0
     C_PULSE_PER_REV = 12800.0; C_LEAD = 5.0; C_JOG_DISTANCE = 10.0; C_JOG_SPEED = 20.0
+    USE_LAYER_PROGRAM = True  # 打印開始時上傳逐層程式，層間以單字節觸發 (需新版四軸韌體)
+    # 各軸運動曲線 (曲線, 加速度 mm/s^2, 加加速度 mm/s^3)；加速度 0 表示沿用韌體舊規則 (速度 x 2)
+    MOTION_PROFILES = {'z': ('scurve', 40.0, 400.0), 'a': ('scurve', 160.0, 1600.0), 'c': ('linear', 0.0, 0.0)}
+    # 各軸快速移動 (MOVE_ABS 未指定速度時)：(速度 mm/s, 加速度 mm/s^2)
+    TRAVEL_PROFILES = {'z': (20.0, 40.0), 'a': (80.0, 160.0), 'c': (20.0, 40.0)}
     NORMAL_EXPOSURE_TIME_S = 2.5; FIRST_LAYER_EXPOSURE_TIME_S = 5.0; TRANSITION_LAYERS = 5
+    PROTOCOL_TRACE_PATH = None  # 設為檔案路徑時記錄運動 / 投影協議的每筆指令與回覆 (protocol_trace.py)
+    PROFILE_TRACE_PATH = "print_trace.json"; LOG_FILE_PATH = os.path.join("logs", "print.log"); LOG_MAX_LINES = 2000; LOG_FLUSH_INTERVAL_MS = 200; LOG_MAX_LINES_PER_FLUSH = 200
 
 class MainWindow(QWidget):
     def __init__(self):
-        super().__init__(); self.worker_thread = None; self.print_worker = None; self.motion_controller = None; self.initUI()
+        super().__init__(); self.worker_thread = None; self.print_worker = None; self.motion_controller = None; self.zip_path = PrintConfig.ZIP_FILE_PATH
+        self.logger = get_print_logger(PrintConfig.LOG_FILE_PATH); self.log_handler = BufferedLogHandler(); self.logger.addHandler(self.log_handler)
+        self.initUI(); self.load_preview(self.zip_path)
+        # 日誌以計時器批次刷新到畫面，避免 GUI 執行緒每行都重繪
+        self.log_timer = QTimer(self); self.log_timer.timeout.connect(self.flush_log); self.log_timer.start(PrintConfig.LOG_FLUSH_INTERVAL_MS)
     def initUI(self):
         self.setWindowTitle('三軸 DLP 打印機控制器')
         main_layout = QVBoxLayout()
-        conn_group = QGroupBox("連接設定"); conn_layout = QHBoxLayout(); conn_layout.addWidget(QLabel("ESP32 IP:")); self.esp32_ip_edit = QLineEdit(PrintConfig.ESP32_IP_ADDRESS); conn_layout.addWidget(self.esp32_ip_edit); self.connect_button = QPushButton("連接 & 初始化 ESP32"); conn_layout.addWidget(self.connect_button); conn_group.setLayout(conn_layout); main_layout.addWidget(conn_group)
+        conn_group = QGroupBox("連接設定"); conn_layout = QHBoxLayout(); conn_layout.addWidget(QLabel("ESP32 IP / 串口 (serial:COM3):")); self.esp32_ip_edit = QLineEdit(PrintConfig.ESP32_IP_ADDRESS); conn_layout.addWidget(self.esp32_ip_edit); self.connect_button = QPushButton("連接 & 初始化 ESP32"); conn_layout.addWidget(self.connect_button); conn_group.setLayout(conn_layout); main_layout.addWidget(conn_group)
         params_group = QGroupBox("打印參數設定"); params_layout = QGridLayout(); params_layout.addWidget(QLabel("層高 (mm):"), 0, 0); self.layer_height_edit = QDoubleSpinBox(); self.layer_height_edit.setDecimals(3); self.layer_height_edit.setValue(0.05); params_layout.addWidget(self.layer_height_edit, 0, 1); params_layout.addWidget(QLabel("Z 軸剝離距離 (mm):"), 0, 2); self.peel_base_dist_edit = QDoubleSpinBox(); self.peel_base_dist_edit.setValue(5.0); params_layout.addWidget(self.peel_base_dist_edit, 0, 3); params_layout.addWidget(QLabel("底層曝光 (s):"), 1, 0); self.first_expo_edit = QDoubleSpinBox(); self.first_expo_edit.setValue(PrintConfig.FIRST_LAYER_EXPOSURE_TIME_S); params_layout.addWidget(self.first_expo_edit, 1, 1); params_layout.addWidget(QLabel("正常曝光 (s):"), 1, 2); self.normal_expo_edit = QDoubleSpinBox(); self.normal_expo_edit.setValue(PrintConfig.NORMAL_EXPOSURE_TIME_S); params_layout.addWidget(self.normal_expo_edit, 1, 3); params_group.setLayout(params_layout); main_layout.addWidget(params_group)
         speed_group = QGroupBox("速度設定 (mm/s)"); speed_layout = QGridLayout()
         speed_layout.addWidget(QLabel("Z 軸下移速度:"), 0, 0); self.z_speed_down_edit = QDoubleSpinBox(); self.z_speed_down_edit.setValue(PrintConfig.Z_PEEL_SPEED); speed_layout.addWidget(self.z_speed_down_edit, 0, 1)
@@ -118,7 +197,10 @@ class MainWindow(QWidget):
         speed_layout.addWidget(QLabel("C 軸恆定速度:"), 2, 0); self.c_jog_speed_edit = QDoubleSpinBox(); self.c_jog_speed_edit.setValue(PrintConfig.C_JOG_SPEED); speed_layout.addWidget(self.c_jog_speed_edit, 2, 1)
         speed_group.setLayout(speed_layout); main_layout.addWidget(speed_group)
         self.jog_group = QGroupBox("手動控制"); jog_layout = QGridLayout(); jog_layout.addWidget(QLabel("Z 軸距離(mm):"), 0, 0); self.z_jog_dist_edit = QDoubleSpinBox(); self.z_jog_dist_edit.setValue(10.0); jog_layout.addWidget(self.z_jog_dist_edit, 0, 1); self.z_up_button = QPushButton("Z 軸向上"); jog_layout.addWidget(self.z_up_button, 0, 2); self.z_down_button = QPushButton("Z 軸向下"); jog_layout.addWidget(self.z_down_button, 0, 3); jog_layout.addWidget(QLabel("A 軸距離(mm):"), 1, 0); self.a_jog_dist_edit = QDoubleSpinBox(); self.a_jog_dist_edit.setValue(10.0); jog_layout.addWidget(self.a_jog_dist_edit, 1, 1); self.a_fwd_button = QPushButton("A 軸向前"); jog_layout.addWidget(self.a_fwd_button, 1, 2); self.a_back_button = QPushButton("A 軸向後"); jog_layout.addWidget(self.a_back_button, 1, 3); jog_layout.addWidget(QLabel("C 軸距離(mm):"), 2, 0); self.c_jog_dist_edit = QDoubleSpinBox(); self.c_jog_dist_edit.setValue(PrintConfig.C_JOG_DISTANCE); jog_layout.addWidget(self.c_jog_dist_edit, 2, 1); self.c_up_button = QPushButton("C 軸向上"); jog_layout.addWidget(self.c_up_button, 2, 2); self.c_down_button = QPushButton("C 軸向下"); jog_layout.addWidget(self.c_down_button, 2, 3); self.jog_group.setLayout(jog_layout); main_layout.addWidget(self.jog_group)
-        control_layout = QHBoxLayout(); self.start_button = QPushButton("開始打印"); self.stop_button = QPushButton("終止打印"); control_layout.addWidget(self.start_button); control_layout.addWidget(self.stop_button); main_layout.addLayout(control_layout); self.log_widget = QPlainTextEdit(); self.log_widget.setReadOnly(True); main_layout.addWidget(self.log_widget); self.setLayout(main_layout)
+        # 切片預覽：縮圖在背景執行緒池解碼並快取，面積曲線由低優先的掃描逐步填入 (layer_preview.py)
+        slice_layout = QHBoxLayout(); self.zip_label = QLabel(self.zip_path); self.choose_zip_button = QPushButton("選擇切片..."); slice_layout.addWidget(QLabel("切片壓縮包:")); slice_layout.addWidget(self.zip_label, 1); slice_layout.addWidget(self.choose_zip_button); main_layout.addLayout(slice_layout)
+        self.preview = LayerPreviewPane(); main_layout.addWidget(self.preview); self.choose_zip_button.clicked.connect(self.choose_zip)
+        control_layout = QHBoxLayout(); self.start_button = QPushButton("開始打印"); self.stop_button = QPushButton("終止打印"); control_layout.addWidget(self.start_button); control_layout.addWidget(self.stop_button); main_layout.addLayout(control_layout); self.log_widget = QPlainTextEdit(); self.log_widget.setReadOnly(True); self.log_widget.setMaximumBlockCount(PrintConfig.LOG_MAX_LINES); main_layout.addWidget(self.log_widget); self.setLayout(main_layout)
         self.connect_button.clicked.connect(self.connect_esp32); self.start_button.clicked.connect(self.start_print); self.stop_button.clicked.connect(self.stop_print)
         self.z_up_button.clicked.connect(lambda: self.jog_axis('z', 1)); self.z_down_button.clicked.connect(lambda: self.jog_axis('z', -1)); self.a_fwd_button.clicked.connect(lambda: self.jog_axis('a', 1)); self.a_back_button.clicked.connect(lambda: self.jog_axis('a', -1)); self.c_up_button.clicked.connect(lambda: self.jog_axis('c', 1)); self.c_down_button.clicked.connect(lambda: self.jog_axis('c', -1))
         self.set_controls_enabled(False)
@@ -126,28 +208,38 @@ class MainWindow(QWidget):
     def get_params(self):
         peel_base = self.peel_base_dist_edit.value(); layer_height = self.layer_height_edit.value()
         return {
-            'esp32_ip': self.esp32_ip_edit.text(), 'esp32_port': PrintConfig.ESP32_PORT, 'zip_path': PrintConfig.ZIP_FILE_PATH,
+            'esp32_ip': self.esp32_ip_edit.text(), 'esp32_port': PrintConfig.ESP32_PORT, 'zip_path': self.zip_path,
             'temp_dir': PrintConfig.TEMP_EXTRACT_DIR, 'monitor_index': PrintConfig.PROJECTOR_MONITOR_INDEX, 'controller_exe_path': PrintConfig.CONTROLLER_EXE_PATH,
-            'black_image_path': PrintConfig.BLACK_IMAGE_PATH,
+            'black_image_path': PrintConfig.BLACK_IMAGE_PATH, 'profile_trace_path': PrintConfig.PROFILE_TRACE_PATH, 'protocol_trace_path': PrintConfig.PROTOCOL_TRACE_PATH,
             'first_layer_expo': self.first_expo_edit.value(), 'normal_expo': self.normal_expo_edit.value(), 'transition_layers': PrintConfig.TRANSITION_LAYERS,
-            'z_pulse_rev': PrintConfig.Z_PULSE_PER_REV, 'z_lead': PrintConfig.Z_LEAD, 'a_pulse_rev': PrintConfig.A_PULSE_PER_REV, 'a_lead': PrintConfig.A_LEAD, 'c_pulse_rev': PrintConfig.C_PULSE_PER_REV, 'c_lead': PrintConfig.C_LEAD,
+            'z_pulse_rev': PrintConfig.Z_PULSE_PER_REV, 'z_lead': PrintConfig.Z_LEAD, 'a_pulse_rev': PrintConfig.A_PULSE_PER_REV, 'a_lead': PrintConfig.A_LEAD, 'c_pulse_rev': PrintConfig.C_PULSE_PER_REV, 'c_lead': PrintConfig.C_LEAD, 'motion_profiles': PrintConfig.MOTION_PROFILES, 'travel_profiles': PrintConfig.TRAVEL_PROFILES, 'use_layer_program': PrintConfig.USE_LAYER_PROGRAM,
             'peel_lift_z1': peel_base + layer_height, 'peel_return_z2': peel_base, 'z_speed_down': self.z_speed_down_edit.value(), 'z_speed_up': self.z_speed_up_edit.value(),
             'a_fast_speed': self.a_speed_fast_edit.value(),
             'a_slow_speed': self.a_speed_slow_edit.value(), 'c_jog_speed': self.c_jog_speed_edit.value(), 'z_jog_speed': PrintConfig.Z_JOG_SPEED, 'a_jog_speed': PrintConfig.A_JOG_SPEED,
         }
-    def log(self, message): self.log_widget.appendPlainText(message)
+    def log(self, message): self.logger.info(message)
+    def choose_zip(self):
+        path, _ = QFileDialog.getOpenFileName(self, "選擇切片檔", os.path.dirname(os.path.abspath(self.zip_path)), "切片檔 (" + " ".join("*" + ext for ext in SLICE_FORMATS) + ")")
+        if path: self.zip_path = path; self.zip_label.setText(path); self.load_preview(path)
+    def load_preview(self, path):
+        if not os.path.exists(path): return
+        try: self.preview.load(path)
+        except Exception as e: self.log(f"無法預覽切片 {path}: {e}")
+    def flush_log(self):
+        lines, dropped = self.log_handler.drain(PrintConfig.LOG_MAX_LINES_PER_FLUSH)
+        if dropped: lines.insert(0, f"... 略過 {dropped} 行，完整內容請見 {PrintConfig.LOG_FILE_PATH}")
+        if lines: self.log_widget.appendPlainText("\n".join(lines))
     @pyqtSlot()
     def connect_esp32(self):
         if self.motion_controller: self.motion_controller.close(); self.motion_controller = None
         try:
             params = self.get_params(); self.log(f"正在連接並初始化 ESP32 於 {params['esp32_ip']}..."); self.motion_controller = MotionController(params['esp32_ip'], params['esp32_port'])
-            self.motion_controller.config_axis('z', params['z_pulse_rev'], params['z_lead']); self.motion_controller.config_axis('a', params['a_pulse_rev'], params['a_lead']); self.motion_controller.config_axis('c', params['c_pulse_rev'], params['c_lead'])
-            self.motion_controller.config_z_peel(params); self.motion_controller.config_a_wipe(params); self.log("軸配置與參數發送成功。")
+            result = self.motion_controller.sync_config(params); self.log("韌體已保存相同配置，略過發送。" if result == 'unchanged' else "軸配置與參數發送成功。")
             self.set_controls_enabled(True); self.connect_button.setText("重新連接 & 初始化"); self.log("ESP32 已連接並初始化。")
         except Exception as e: self.log(f"錯誤: 無法連接或初始化 ESP32: {e}"); self.set_controls_enabled(False)
     def start_print(self):
         self.set_controls_enabled(False); self.stop_button.setEnabled(True); self.log_widget.clear(); params = self.get_params()
-        self.worker_thread = QThread(); self.print_worker = PrintWorker(params); self.print_worker.moveToThread(self.worker_thread); self.worker_thread.started.connect(self.print_worker.run); self.print_worker.finished.connect(self.on_task_finished); self.print_worker.log.connect(self.log); self.print_worker.error.connect(self.on_task_error); self.worker_thread.start()
+        self.worker_thread = QThread(); self.print_worker = PrintWorker(params); self.print_worker.moveToThread(self.worker_thread); self.worker_thread.started.connect(self.print_worker.run); self.print_worker.finished.connect(self.on_task_finished); self.print_worker.error.connect(self.on_task_error); self.worker_thread.start()
     def stop_print(self):
         if self.print_worker: self.print_worker.stop(); self.log("正在發送終止信號...")
     def on_task_finished(self):
@@ -162,12 +254,14 @@ class MainWindow(QWidget):
     def closeEvent(self, event):
         if self.motion_controller: self.motion_controller.close()
         if self.worker_thread and self.worker_thread.isRunning(): self.stop_print(); self.worker_thread.quit(); self.worker_thread.wait()
+        self.preview.close_source(); self.log_timer.stop(); self.logger.removeHandler(self.log_handler)
         event.accept()
 
 if __name__ == '__main__':
     temp_dir = PrintConfig.TEMP_EXTRACT_DIR; black_image_path = PrintConfig.BLACK_IMAGE_PATH
     if not os.path.exists(temp_dir): os.makedirs(temp_dir)
     if not os.path.exists(black_image_path):
+        from PIL import Image
         print(f"'{black_image_path}' not found, creating a new one...")
         black_img = Image.new('RGB', (1920, 1080), 'black'); black_img.save(black_image_path)
     app = QApplication(sys.argv); ex = MainWindow(); ex.show(); sys.exit(app.exec_())
\ No newline at end of file
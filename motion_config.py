@@ -0,0 +1,51 @@
+# motion_config.py - 四軸韌體的批次配置
+# 功能：把 CONFIG_AXIS / CONFIG_MOTION / CONFIG_TRAVEL / CONFIG_Z_PEEL / CONFIG_A_WIPE 組成一筆 CONFIG_BATCH，
+#       附上版本雜湊；韌體套用後寫入快閃記憶體，重新連線時只需比對 CONFIG_HASH，未變更就不重送。
+
+import zlib
+
+AXES = ('z', 'a', 'c')
+
+
+def config_lines(params):
+    """依打印參數產生配置指令 (順序固定，雜湊才會穩定)。"""
+    lines = [f"CONFIG_AXIS,{axis},{params[axis + '_pulse_rev']},{params[axis + '_lead']}" for axis in AXES]
+    for axis, (profile, accel, jerk) in sorted(params.get('motion_profiles', {}).items()):
+        lines.append(f"CONFIG_MOTION,{axis},{profile},{accel},{jerk}")
+    for axis, (speed, accel) in sorted(params.get('travel_profiles', {}).items()):
+        lines.append(f"CONFIG_TRAVEL,{axis},{speed},{accel}")
+    lines.append(f"CONFIG_Z_PEEL,{params['peel_lift_z1']},{params['peel_return_z2']},"
+                 f"{params['z_speed_down']},{params['z_speed_up']}")
+    lines.append(f"CONFIG_A_WIPE,{params.get('wipe_dist', 50.0)},{params['a_fast_speed']},{params['a_slow_speed']}")
+    return lines
+
+
+def config_hash(lines):
+    text = "\n".join(lines)
+    return f"{zlib.crc32(text.encode()):08x}"
+
+
+def batch_command(lines, version):
+    return f"CONFIG_BATCH,{version}," + ";".join(lines)
+
+
+def sync_config(request, params):
+    """
+    request(cmd) -> 回覆字串。回傳 'unchanged' (雜湊相同，未送出)、'sent' (批次已套用並保存)；
+    舊版韌體不認得 CONFIG_HASH 時逐條送出並回傳 'legacy'。失敗時丟出 RuntimeError。
+    """
+    lines = config_lines(params)
+    version = config_hash(lines)
+    reply = request("CONFIG_HASH")
+    if reply == f"HASH,{version}":
+        return 'unchanged'
+    if reply.startswith("HASH,"):
+        reply = request(batch_command(lines, version))
+        if not reply.startswith("OK"):
+            raise RuntimeError(f"批次配置失敗: {reply}")
+        return 'sent'
+    for line in lines:
+        reply = request(line)
+        if "OK" not in reply:
+            raise RuntimeError(f"配置失敗: {line} -> {reply}")
+    return 'legacy'
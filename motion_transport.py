@@ -0,0 +1,299 @@
+# motion_transport.py - 運動協議的傳輸層 (Wi-Fi TCP / USB 串口)
+# 功能：MotionController / ZAxisControl 共用的行協議傳輸，可依打印機選擇 TCP 或串口，並統計每次往返延遲。
+# 位址格式:
+#   "10.10.17.187:8899" 或 "tcp://10.10.17.187:8899"
+#   "serial:COM3" / "serial:/dev/ttyUSB0" / "serial:/dev/ttyUSB0@921600"
+# 用法:
+#   python motion_transport.py bench [--count 200]      以模擬 ESP32 比較 TCP 與偽終端 (pty) 串口的往返延遲
+#   python motion_transport.py ping serial:COM3         對實機量測往返延遲
+#   python motion_transport.py profile 10.10.17.187 --axis z --speeds 5,10,20,40
+#       以韌體的 PROFILE 指令量測各速度下實際達到的步頻與抖動 (四軸韌體)
+#   python motion_transport.py logs 10.10.17.187 [--level DEBUG] [--clear]
+#       下載韌體環形緩衝中的日誌 (四軸韌體)
+
+import os
+import time
+import socket
+import argparse
+import threading
+
+from profiling import percentile
+
+DEFAULT_BAUDRATE = 115200
+
+
+# --- 1. 傳輸後端 ---
+class Transport:
+    """行協議傳輸的共同部分：request() 送出一行並讀回一行，同時記錄往返延遲 (秒)。"""
+    name = "transport"
+
+    def __init__(self):
+        self.latencies = []
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def readline(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def set_timeout(self, seconds):
+        """之後每次讀取的逾時秒數。"""
+        raise NotImplementedError
+
+    def request(self, cmd):
+        t0 = time.perf_counter()
+        self.write((cmd + "\n").encode())
+        response = self.readline()
+        self.latencies.append(time.perf_counter() - t0)
+        return response
+
+    def stats(self):
+        samples = sorted(self.latencies)
+        if not samples:
+            return {'transport': self.name, 'n': 0}
+        return {'transport': self.name, 'n': len(samples),
+                'mean_ms': 1000.0 * sum(samples) / len(samples), 'p50_ms': 1000.0 * percentile(samples, 50),
+                'p90_ms': 1000.0 * percentile(samples, 90), 'max_ms': 1000.0 * samples[-1]}
+
+
+class TcpTransport(Transport):
+    name = "tcp"
+
+    def __init__(self, host, port, timeout=60):
+        super().__init__()
+        self.sock = socket.create_connection((host, port), timeout)
+        # 指令都很短，關閉 Nagle 避免每行被延遲合併
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('r', encoding='utf-8')
+
+    def write(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.reader.readline().strip()
+
+    def set_timeout(self, seconds):
+        self.sock.settimeout(seconds)
+
+    def close(self):
+        self.sock.close()
+
+
+class SerialTransport(Transport):
+    """USB 串口 (pyserial)。韌體在 SERIAL_TRANSPORT 模式下從 stdin 讀取同一套行協議。"""
+    name = "serial"
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE, timeout=60):
+        super().__init__()
+        import serial
+        self.serial = serial.Serial(port, baudrate, timeout=timeout)
+        self.serial.reset_input_buffer()
+
+    def write(self, data):
+        self.serial.write(data)
+        self.serial.flush()
+
+    def readline(self):
+        return self.serial.readline().decode(errors='replace').strip()
+
+    def set_timeout(self, seconds):
+        self.serial.timeout = seconds
+
+    def discard_input(self):
+        """丟棄已收到但尚未讀取的資料 (例如逾時指令遲到的回覆)。"""
+        self.serial.reset_input_buffer()
+
+    def close(self):
+        self.serial.close()
+
+
+def open_transport(address, port=None, timeout=60):
+    """
+    依位址字串建立傳輸：'serial:' 開頭為串口 (可用 @ 指定鮑率)，否則為 TCP。
+    TCP 位址未帶埠號時使用 port 參數。
+    """
+    if address.startswith('serial:'):
+        device, _, baud = address[len('serial:'):].partition('@')
+        return SerialTransport(device, int(baud) if baud else DEFAULT_BAUDRATE, timeout)
+    if address.startswith('tcp://'):
+        address = address[len('tcp://'):]
+    host, _, port_text = address.partition(':')
+    return TcpTransport(host, int(port_text) if port_text else port, timeout)
+
+
+# --- 2. 模擬 ESP32 基準測試 (偽終端) ---
+def serve_fake_on_fd(fd, device):
+    """在檔案描述符上 (pty 主端) 以韌體相同的方式讀取行協議並回覆。"""
+    from layer_program import TRIGGER_BYTE
+    with os.fdopen(fd, 'rb', buffering=0) as stream:
+        pending = b""
+        while True:
+            try:
+                chunk = stream.read(4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+            pending += chunk
+            while pending:
+                if pending[:1] == TRIGGER_BYTE:
+                    line, pending = "STEP", pending[1:]
+                elif b"\n" in pending:
+                    raw, pending = pending.split(b"\n", 1)
+                    line = raw.decode(errors='replace').strip()
+                    if not line:
+                        continue
+                else:
+                    break
+                os.write(fd, (device.handle(line) + "\n").encode())
+
+
+def open_pty_pair():
+    """建立偽終端，回傳 (主端 fd, 從端 fd, 從端裝置路徑)；主端設為 raw 模式，避免換行被轉換。"""
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    return master, slave, path
+
+
+def measure(transport, count):
+    commands = ["CONFIG_AXIS,z,12800.0,5.0", "NEXT_LAYER", "MOVE_REL,z,1.0,10.0", "GET_POS,z"]
+    for i in range(count):
+        transport.request(commands[i % len(commands)])
+    return transport.stats()
+
+
+def benchmark(count):
+    from fake_esp32 import FakeESP32, FakeESP32Server
+    results = []
+    server = FakeESP32Server().start()
+    try:
+        tcp = TcpTransport(*server.address)
+        results.append(measure(tcp, count))
+        tcp.close()
+    finally:
+        server.stop()
+    try:
+        import serial  # noqa: F401
+    except ImportError:
+        print("未安裝 pyserial，略過串口測試。")
+        return results
+    master, slave, path = open_pty_pair()
+    thread = threading.Thread(target=serve_fake_on_fd, args=(master, FakeESP32()), daemon=True)
+    thread.start()
+    link = SerialTransport(path, timeout=5)
+    try:
+        results.append(measure(link, count))
+    finally:
+        link.close()
+        os.close(slave)
+    return results
+
+
+def parse_profile(reply):
+    """'PROFILE,z:n=..:rate=..,a:...' -> {'z': {'n': .., 'rate': ..}, ...}"""
+    result = {}
+    for group in reply.split(',')[1:]:
+        axis, *fields = group.split(':')
+        result[axis] = {k: float(v) for k, v in (f.split('=') for f in fields)}
+    return result
+
+
+def profile_speeds(transport, axis, speeds, distance, stride=1):
+    """
+    開啟剖析，依序以各速度來回移動 distance mm，回傳每個速度的步進計時統計。
+    韌體只保存前 2048 個取樣點，長距離移動可加大 stride (每 stride 步取樣一次) 以涵蓋等速段。
+    """
+    if "OK" not in transport.request(f"PROFILE,ON,{stride}"):
+        raise RuntimeError("韌體不支援 PROFILE 指令。")
+    rows = []
+    try:
+        for k, speed in enumerate(speeds):
+            direction = 1 if k % 2 == 0 else -1
+            transport.request(f"MOVE_REL,{axis},{direction * distance},{speed}")
+            stats = parse_profile(transport.request(f"PROFILE,{axis}")).get(axis)
+            if stats:
+                rows.append((speed, stats))
+    finally:
+        transport.request("PROFILE,OFF")
+    return rows
+
+
+def fetch_logs(transport, clear=False):
+    """LOGS 回覆為 'LOGS,筆數' 後接逐行紀錄 ('<ticks_ms> <D|I|W|E> 訊息')。"""
+    header = transport.request("LOGS")
+    if not header.startswith("LOGS,"):
+        raise RuntimeError(f"韌體不支援 LOGS 指令: {header}")
+    records = [transport.readline() for _ in range(int(header.split(',')[1]))]
+    if clear:
+        transport.request("LOGS,CLEAR")
+    return records
+
+
+def print_stats(stats):
+    if not stats['n']:
+        print(f"{stats['transport']:<8s} 無資料")
+        return
+    print(f"{stats['transport']:<8s} n={stats['n']:<5d} 平均 {stats['mean_ms']:7.3f} ms  p50 {stats['p50_ms']:7.3f}"
+          f"  p90 {stats['p90_ms']:7.3f}  最大 {stats['max_ms']:7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="運動協議傳輸層延遲測試")
+    sub = parser.add_subparsers(dest='command', required=True)
+    s = sub.add_parser('bench', help="以模擬 ESP32 比較 TCP 與 pty 串口的往返延遲")
+    s.add_argument('--count', type=int, default=200)
+    p = sub.add_parser('ping', help="對實機量測往返延遲 (送出 GET_POS)")
+    p.add_argument('address', help="例如 10.10.17.187:8899 或 serial:COM3")
+    p.add_argument('--count', type=int, default=50)
+    f = sub.add_parser('profile', help="量測各速度下韌體步進迴圈實際達到的步頻")
+    f.add_argument('address')
+    f.add_argument('--axis', default='z')
+    f.add_argument('--speeds', default='5,10,20,40', help="速度 mm/s，以逗號分隔")
+    f.add_argument('--distance', type=float, default=2.0, help="每次移動距離 mm")
+    f.add_argument('--stride', type=int, default=1, help="每隔幾步取樣一次")
+    g = sub.add_parser('logs', help="下載韌體日誌")
+    g.add_argument('address')
+    g.add_argument('--level', choices=('DEBUG', 'INFO', 'WARN', 'ERROR'), help="之後記錄的最低等級")
+    g.add_argument('--clear', action='store_true', help="下載後清空")
+    args = parser.parse_args()
+    if args.command == 'bench':
+        for stats in benchmark(args.count):
+            print_stats(stats)
+    elif args.command == 'ping':
+        transport = open_transport(args.address, 8899, timeout=10)
+        try:
+            for _ in range(args.count):
+                transport.request("GET_POS")
+            print_stats(transport.stats())
+        finally:
+            transport.close()
+    elif args.command == 'logs':
+        transport = open_transport(args.address, 8899, timeout=10)
+        try:
+            for record in fetch_logs(transport, args.clear):
+                print(record)
+            if args.level:
+                print(transport.request(f"LOG_LEVEL,{args.level}"))
+        finally:
+            transport.close()
+    else:
+        transport = open_transport(args.address, 8899, timeout=120)
+        try:
+            rows = profile_speeds(transport, args.axis, [float(v) for v in args.speeds.split(',')], args.distance,
+                                  args.stride)
+        finally:
+            transport.close()
+        print(f"{'速度mm/s':>9s} {'指令步頻':>9s} {'實際步頻':>9s} {'達成率':>7s} {'抖動us':>7s} {'最大延遲us':>10s} {'讓出us':>7s} {'準備us':>7s}")
+        for speed, s in rows:
+            print(f"{speed:9.1f} {s['cruise_cmd_sps']:9.0f} {s['cruise_act_sps']:9.0f} {s['rate']:6.1f}% {s['jitter_us']:7.1f}"
+                  f" {s['max_late_us']:10.0f} {s['yield_us']:7.0f} {s['setup_us']:7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# plate_nesting.py - 多任務拼版：把多個切片壓縮包合併成一次打印
+# 用法: python plate_nesting.py out.zip partA.zip@0,0 partB.zip@900,0 [--gap 10]
+# 座標 (x,y) 為該零件「實際佔用範圍」左上角在成型平台上的像素位置。
+
+import io
+import argparse
+import zipfile
+
+import numpy as np
+
+from slice_source import open_slice_source
+
+
+def dilate(mask, radius):
+    """以方形結構元素膨脹二值遮罩 (可分離的平移取最大值)。"""
+    if radius <= 0:
+        return mask
+    out = mask.copy()
+    for axis in (0, 1):
+        src = out.copy()
+        for r in range(1, radius + 1):
+            if axis == 0:
+                out[r:, :] |= src[:-r, :]
+                out[:-r, :] |= src[r:, :]
+            else:
+                out[:, r:] |= src[:, :-r]
+                out[:, :-r] |= src[:, r:]
+    return out
+
+
+def check_layout(parts, plate_size, gap=0):
+    """
+    parts: [(名稱, footprint, x, y), ...]。檢查每個零件是否超出平台，以及零件之間是否至少相隔 gap 像素。
+    佔用表只記錄零件本身的範圍，只有正在放入的零件外擴 gap，間距才不會被算成兩倍。
+    """
+    width, height = plate_size
+    owner = np.full((height, width), -1, dtype=np.int16)
+    for n, (name, footprint, x, y) in enumerate(parts):
+        h, w = footprint.shape
+        if x < 0 or y < 0 or x + w > width or y + h > height:
+            raise ValueError(f"零件 {name} 放在 ({x},{y}) 尺寸 {w}x{h}，超出平台 {width}x{height}。")
+        # 先外擴 gap 再膨脹，讓間距在零件外框之外也生效；超出平台的部分裁掉
+        mask = dilate(np.pad(footprint, gap), gap)
+        y0, x0 = y - gap, x - gap
+        ys, xs = max(0, -y0), max(0, -x0)
+        ye, xe = min(mask.shape[0], height - y0), min(mask.shape[1], width - x0)
+        region = owner[y0 + ys:y0 + ye, x0 + xs:x0 + xe]
+        mask = mask[ys:ye, xs:xe]
+        clash = np.unique(region[mask & (region >= 0)])
+        if clash.size:
+            others = ", ".join(parts[int(c)][0] for c in clash)
+            raise ValueError(f"零件 {name} 與 {others} 重疊 (間距 {gap}px)。")
+        owner[y:y + h, x:x + w][footprint] = n
+
+
+# --- 1. 單一零件 ---
+class NestedJob:
+    """一個切片來源 + 平台上的擺放位置；footprint 為所有層的聯集。"""
+
+    def __init__(self, source, x, y):
+        self.source = source
+        self.x, self.y = int(x), int(y)
+        footprint = None
+        for i in range(len(source)):
+            layer = source.decode(i) > 0
+            footprint = layer if footprint is None else (footprint | layer)
+        rows = np.flatnonzero(footprint.any(axis=1))
+        cols = np.flatnonzero(footprint.any(axis=0))
+        if rows.size == 0:
+            raise ValueError(f"{source.path} 所有切片皆為空白。")
+        # 只保留有內容的範圍，擺放座標以此範圍為準
+        self.crop = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        self.footprint = footprint[self.crop]
+
+    @property
+    def size(self):
+        return self.footprint.shape[1], self.footprint.shape[0]
+
+    def __len__(self):
+        return len(self.source)
+
+
+# --- 2. 拼版結果 (可當作切片來源直接送入打印循環) ---
+class NestedSliceSource:
+    """
+    逐層合併多個零件；較矮的零件在結束後以空白補齊。
+    介面與 slice_source.ZipSliceSource 相同 (key / __len__ / decode / layer_meta / close)。
+    """
+
+    def __init__(self, jobs, plate_size, gap=0):
+        self.jobs = jobs
+        self.plate_size = tuple(plate_size)
+        self.key = "nest:" + ";".join(f"{j.source.key}@{j.x},{j.y}" for j in jobs) + f":{self.plate_size}"
+        self.path = self.key
+        self.check_layout(gap)
+
+    def check_layout(self, gap=0):
+        """檢查每個零件是否超出平台，以及零件之間 (含 gap 間距) 是否重疊。"""
+        check_layout([(job.source.path, job.footprint, job.x, job.y) for job in self.jobs], self.plate_size, gap)
+
+    def __len__(self):
+        return max(len(j) for j in self.jobs)
+
+    def decode(self, index):
+        width, height = self.plate_size
+        plate = np.zeros((height, width), dtype=np.uint8)
+        for job in self.jobs:
+            if index >= len(job):
+                continue
+            w, h = job.size
+            region = plate[job.y:job.y + h, job.x:job.x + w]
+            np.maximum(region, job.source.decode(index)[job.crop], out=region)
+        return plate
+
+    def layer_meta(self, index):
+        return {}
+
+    def write_archive(self, out_path):
+        """輸出成與 layers.zip 相同格式的壓縮包 (1.png, 2.png, ...)。"""
+        from PIL import Image
+        with zipfile.ZipFile(out_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(len(self)):
+                buf = io.BytesIO()
+                Image.fromarray(self.decode(i)).save(buf, format='PNG')
+                zf.writestr(f"{i + 1}.png", buf.getvalue())
+
+    def close(self):
+        for job in self.jobs:
+            job.source.close()
+
+
+def parse_placement(arg):
+    """'path.zip@x,y' -> (path, x, y)"""
+    path, _, pos = arg.rpartition('@')
+    x, y = pos.split(',')
+    return path, int(x), int(y)
+
+
+def build_nest(placements, plate_size=None, gap=0):
+    """placements: [(切片路徑, x, y), ...]，路徑可為任何 open_slice_source 支援的格式；平台尺寸預設取第一個零件的切片尺寸。"""
+    jobs = [NestedJob(open_slice_source(path), x, y) for path, x, y in placements]
+    if plate_size is None:
+        first = jobs[0].source.decode(0)
+        plate_size = (first.shape[1], first.shape[0])
+    return NestedSliceSource(jobs, plate_size, gap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把多個切片壓縮包拼成一次打印")
+    parser.add_argument("output", help="輸出的 zip 路徑")
+    parser.add_argument("placements", nargs='+', help="零件與位置，格式 path.zip@x,y")
+    parser.add_argument("--plate", help="平台像素尺寸 WxH (預設取第一個零件的切片尺寸)")
+    parser.add_argument("--gap", type=int, default=0, help="零件之間最小間距 (像素)")
+    args = parser.parse_args()
+    plate_size = tuple(int(v) for v in args.plate.lower().split('x')) if args.plate else None
+    nest = build_nest([parse_placement(p) for p in args.placements], plate_size, args.gap)
+    for job in nest.jobs:
+        print(f"{job.source.path}: {len(job)} 層，佔用 {job.size[0]}x{job.size[1]} 於 ({job.x},{job.y})")
+    nest.write_archive(args.output)
+    print(f"拼版完成: {len(nest)} 層 -> {args.output}")
+    nest.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# profiling.py - 打印流程計時工具
+# 功能：記錄啟動階段各步驟耗時，輸出「到第一層曝光」的啟動報告。
+
+import time
+from contextlib import contextmanager
+
+
+# --- 1. 啟動階段計時 ---
+class StartupProfile:
+    """
+    記錄從任務開始到第一層曝光之間的各個里程碑。
+    - mark(name): 記錄一個里程碑時間點。
+    - user_wait(name): 包住需要使用者手動操作的區段，報告中會單獨扣除。
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock()
+        self.marks = []        # [(name, t)]
+        self.user_waits = []   # [(name, duration)]
+
+    def mark(self, name):
+        self.marks.append((name, self.clock()))
+
+    @contextmanager
+    def user_wait(self, name):
+        t0 = self.clock()
+        try:
+            yield
+        finally:
+            self.user_waits.append((name, self.clock() - t0))
+            self.marks.append((name, self.clock()))
+
+    def elapsed(self, name=None):
+        """回傳某個里程碑（或目前）相對於開始的秒數。"""
+        if name is None:
+            return self.clock() - self.start
+        for mark_name, t in self.marks:
+            if mark_name == name:
+                return t - self.start
+        return None
+
+    def report(self, first_layer_mark='first_layer'):
+        """產生文字報告（逐行），列出各階段耗時與到第一層的總時間。"""
+        lines = ["--- 啟動耗時報告 ---"]
+        prev = self.start
+        for name, t in self.marks:
+            lines.append(f"{name:<24s} +{t - prev:7.3f}s  (累計 {t - self.start:7.3f}s)")
+            prev = t
+        ttfl = self.elapsed(first_layer_mark)
+        if ttfl is not None:
+            waited = sum(d for _, d in self.user_waits)
+            lines.append(f"到第一層曝光: {ttfl:.3f}s")
+            if waited > 0:
+                lines.append(f"扣除手動操作 {waited:.3f}s 後: {ttfl - waited:.3f}s")
+        return lines
+
+
+# --- 2. 逐層分段計時 ---
+# 各階段名稱：切片載入/解碼、縮放、送出顯示、LED 開啟延遲、曝光、LED 關閉、黑畫面、層間運動往返
+PHASES = ('load', 'scale', 'display', 'led_on', 'exposure', 'led_off', 'blank', 'motion')
+
+
+class LayerProfiler:
+    """
+    逐層記錄各階段耗時，打印結束後輸出 JSON 或 CSV 追蹤檔。
+    用法:
+        profiler.begin_layer(n)
+        with profiler.phase('display'): ...
+        record = profiler.end_layer()
+    """
+
+    def __init__(self, trace_path=None, clock=time.perf_counter, meta=None):
+        self.trace_path = trace_path
+        self.clock = clock
+        self.meta = dict(meta or {})
+        self.records = []
+        self._current = None
+        self._layer_start = None
+
+    def begin_layer(self, layer_num):
+        self._current = {'layer': layer_num, 'phases': {}}
+        self._layer_start = self.clock()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = self.clock()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                phases = self._current['phases']
+                phases[name] = phases.get(name, 0.0) + (self.clock() - t0)
+
+    def end_layer(self):
+        record = self._current
+        if record is None:
+            return None
+        record['wall_s'] = self.clock() - self._layer_start
+        self.records.append(record)
+        self._current = None
+        return record
+
+    def save(self, path=None):
+        path = path or self.trace_path
+        if not path or not self.records:
+            return None
+        save_trace(path, self.records, self.meta)
+        return path
+
+
+def save_trace(path, records, meta=None):
+    """副檔名為 .csv 時輸出 CSV，否則輸出 JSON。"""
+    import json
+    if path.lower().endswith('.csv'):
+        import csv
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['layer', 'wall_s'] + list(PHASES))
+            for r in records:
+                writer.writerow([r['layer'], f"{r['wall_s']:.6f}"] +
+                                [f"{r['phases'][p]:.6f}" if p in r['phases'] else '' for p in PHASES])
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta or {}, 'layers': records}, f, ensure_ascii=False, indent=1)
+
+
+def load_trace(path):
+    import json
+    if path.lower().endswith('.csv'):
+        import csv
+        records = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                records.append({'layer': int(row['layer']), 'wall_s': float(row['wall_s']),
+                                'phases': {p: float(row[p]) for p in PHASES if row.get(p)}})
+        return records
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['layers']
+
+
+def percentile(sorted_values, q):
+    """已排序數列的線性插值百分位數。"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(records, top=5):
+    """產生報告文字：各階段總計與百分位數、最慢的幾層、曝光以外時間佔比。"""
+    if not records:
+        return ["追蹤檔中沒有任何層的記錄。"]
+    total_wall = sum(r['wall_s'] for r in records)
+    lines = [f"--- 逐層計時報告 ({len(records)} 層，總計 {total_wall / 60:.2f} 分鐘) ---",
+             f"{'階段':<10s}{'總計(s)':>10s}{'佔比':>8s}{'p50':>9s}{'p90':>9s}{'p99':>9s}{'最大':>9s}"]
+    names = [p for p in PHASES if any(p in r['phases'] for r in records)]
+    names += sorted({p for r in records for p in r['phases']} - set(names))
+    for name in names:
+        values = sorted(r['phases'][name] for r in records if name in r['phases'])
+        total = sum(values)
+        lines.append(f"{name:<10s}{total:>10.2f}{100 * total / total_wall:>7.1f}%"
+                     f"{percentile(values, 50):>9.3f}{percentile(values, 90):>9.3f}"
+                     f"{percentile(values, 99):>9.3f}{values[-1]:>9.3f}")
+    exposure = sum(r['phases'].get('exposure', 0.0) for r in records)
+    lines.append(f"曝光以外的時間: {total_wall - exposure:.2f}s ({100 * (total_wall - exposure) / total_wall:.1f}% 的總時間)")
+    lines.append(f"最慢的 {min(top, len(records))} 層:")
+    for r in sorted(records, key=lambda r: r['wall_s'], reverse=True)[:top]:
+        overhead = r['wall_s'] - r['phases'].get('exposure', 0.0)
+        worst = max(((k, v) for k, v in r['phases'].items() if k != 'exposure'), key=lambda kv: kv[1], default=('-', 0.0))
+        lines.append(f"  第 {r['layer']:>5d} 層: {r['wall_s']:.3f}s (非曝光 {overhead:.3f}s，最耗時階段 {worst[0]} {worst[1]:.3f}s)")
+    return lines
+
+
+# --- 3. 命令列: python profiling.py report trace.json ---
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="打印逐層計時報告")
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help="讀取追蹤檔並輸出統計")
+    report.add_argument('trace', help="JSON 或 CSV 追蹤檔")
+    report.add_argument('--top', type=int, default=5, help="列出最慢的層數")
+    args = parser.parse_args()
+    if args.command == 'report':
+        print("\n".join(summarize(load_trace(args.trace), args.top)))
+
+
+if __name__ == "__main__":
+    main()
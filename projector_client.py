@@ -0,0 +1,91 @@
+# projector_client.py - 投影進程 (projector_view.py) 的啟動與連線工具
+# 供 main_gui.py 與 farm_controller.py 共用，不依賴 PyQt5。
+
+import os
+import sys
+import time
+import subprocess
+from multiprocessing.connection import Client
+
+import numpy as np
+
+PROJECTOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'projector_view.py')
+DEFAULT_AUTHKEY = b'secret-key-for-projector'
+
+
+def launch_projector(monitor_index, address, authkey=DEFAULT_AUTHKEY):
+    """以獨立進程啟動 projector_view.py，回傳 Popen 物件。"""
+    if not os.path.exists(PROJECTOR_SCRIPT):
+        raise RuntimeError(f"投影腳本 projector_view.py 未找到！")
+    cmd = [sys.executable, PROJECTOR_SCRIPT, str(monitor_index), address[0], str(address[1]), authkey.decode()]
+    startupinfo = None
+    if os.name == 'nt':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return subprocess.Popen(cmd, startupinfo=startupinfo)
+
+
+def connect_projector(address, authkey=DEFAULT_AUTHKEY, timeout=30, interval=0.1):
+    """
+    反覆嘗試連接投影進程，直到對方監聽並回報 ready 為止。
+    回傳 (conn, ready_msg)，ready_msg 內含投影螢幕的 width / height。
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"連接投影進程逾時 ({timeout}s)")
+            time.sleep(interval)
+    if not conn.poll(max(0.0, deadline - time.monotonic())):
+        conn.close()
+        raise RuntimeError("投影進程未回報就緒。")
+    msg = conn.recv()
+    if msg.get('status') != 'ready':
+        conn.close()
+        raise RuntimeError(f"投影進程回應異常: {msg}")
+    return conn, msg
+
+
+def frame_message(frame):
+    """把 HxW 的 uint8 灰階陣列包裝成 projector_view 的 'frame' 指令。"""
+    height, width = frame.shape[:2]
+    return {'command': 'frame', 'width': width, 'height': height, 'data': frame.tobytes()}
+
+
+def dirty_rects(base, frame, merge_gap=32, max_rects=8):
+    """
+    回傳 frame 相對 base 有變化的矩形 [(x, y, w, h), ...]，完全相同時為空清單。
+    有變化的列依間隔 merge_gap 分成數個水平帶，各帶取自己的左右範圍；帶數超過 max_rects 時合併成一個外接矩形。
+    """
+    changed = base != frame
+    rows = np.flatnonzero(changed.any(axis=1))
+    if rows.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > merge_gap)
+    if len(breaks) >= max_rects:
+        bands = [(rows[0], rows[-1] + 1)]
+    else:
+        bands = zip(np.r_[rows[0], rows[breaks + 1]], np.r_[rows[breaks], rows[-1]] + 1)
+    rects = []
+    for y0, y1 in bands:
+        cols = np.flatnonzero(changed[y0:y1].any(axis=0))
+        rects.append((int(cols[0]), int(y0), int(cols[-1] - cols[0] + 1), int(y1 - y0)))
+    return rects
+
+
+def update_message(base, frame, max_fraction=0.5):
+    """
+    base 為投影端目前保留的幀 (None 表示沒有)。變化面積不超過整幀的 max_fraction 時，
+    回傳只帶變化區域像素的 'patch' 指令，投影端把它畫進保留的幀；否則回傳完整的 'frame' 指令。
+    """
+    if base is None or base.shape != frame.shape:
+        return frame_message(frame)
+    rects = dirty_rects(base, frame)
+    height, width = frame.shape[:2]
+    if sum(w * h for _, _, w, h in rects) > max_fraction * width * height:
+        return frame_message(frame)
+    return {'command': 'patch', 'width': width, 'height': height,
+            'rects': [(x, y, w, h, frame[y:y + h, x:x + w].tobytes()) for x, y, w, h in rects]}
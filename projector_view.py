@@ -2,9 +2,10 @@
 # 功能：在指定螢幕上全螢幕顯示圖像，並透過網路監聽指令。
 
 import sys
+import threading
 from multiprocessing.connection import Listener
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout
-from PyQt5.QtGui import QPixmap, QColor
+from PyQt5.QtGui import QPixmap, QColor, QImage, QPainter
 from PyQt5.QtCore import Qt, QObject, pyqtSignal, QThread
 
 
@@ -13,11 +14,23 @@ class CommandListener(QObject):
     # 定義信號，用於安全地從背景執行緒向主 GUI 執行緒傳遞指令
     command_received = pyqtSignal(dict)
 
-    def __init__(self, address, authkey):
+    def __init__(self, address, authkey, ready_info=None):
         super().__init__()
         self.address = address
         self.authkey = authkey
+        self.ready_info = ready_info or {}
         self.is_running = True
+        self.conn = None
+        self.send_lock = threading.Lock()
+
+    def ack(self, msg, ok=True):
+        """
+        指令帶有 ack 時，畫面更新完成後回報 (拼接投影用來在開燈前同步所有投影儀)；
+        ok 為 False (例如 patch 沒有基準幀) 時回報 'error'，主程式需改送完整幀。
+        """
+        if msg.get('ack') and self.conn is not None:
+            with self.send_lock:
+                self.conn.send({'status': 'shown' if ok else 'error', 'seq': msg.get('seq')})
 
     def run(self):
         """監聽網路連線並接收指令"""
@@ -25,12 +38,16 @@ class CommandListener(QObject):
         # 使用 Listener 來接收來自 Client (main_gui.py) 的連線
         with Listener(self.address, authkey=self.authkey) as listener:
             with listener.accept() as conn:
+                self.conn = conn
                 print(f"[Projector] Connection accepted from {listener.last_accepted}")
+                # 通知主程式視窗已就緒，取代主程式端的固定等待
+                conn.send(dict(self.ready_info, status='ready'))
                 while self.is_running:
                     try:
                         # 等待並接收指令
                         msg = conn.recv()
-                        print(f"[Projector] Received command: {msg}")
+                        # 像素資料可能有數 MB，不要印出
+                        print(f"[Projector] Received command: {({k: v for k, v in msg.items() if k not in ('data', 'rects')})}")
                         # 透過信號發送指令到主執行緒
                         self.command_received.emit(msg)
                         if msg.get('command') == 'close':
@@ -41,6 +58,7 @@ class CommandListener(QObject):
                     except Exception as e:
                         print(f"[Projector] Error receiving command: {e}")
                         self.is_running = False
+        self.conn = None
         print("[Projector] Listener thread finished.")
 
 
@@ -63,6 +81,9 @@ class ProjectorWindow(QWidget):
         self.image_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.image_label)
 
+        # 最近一次 'frame' / 'patch' 的畫面，顯示黑畫面時仍保留，作為下一個 patch 的基準
+        self.frame = None
+
         # 初始為黑畫面
         self.show_blank()
 
@@ -70,8 +91,29 @@ class ProjectorWindow(QWidget):
         """載入並顯示指定的圖片"""
         pixmap = QPixmap(image_path)
         self.image_label.setPixmap(pixmap)
+        # 圖片未經主程式縮放，不能作為 patch 的基準
+        self.frame = None
         print(f"[Projector] Displaying image: {image_path}")
 
+    def show_frame(self, width, height, data):
+        """顯示主程式已解碼、縮放好的 8-bit 灰階像素，省去投影端重複解碼"""
+        image = QImage(data, width, height, width, QImage.Format_Grayscale8).copy()
+        self.frame = QPixmap.fromImage(image)
+        self.image_label.setPixmap(self.frame)
+
+    def patch_frame(self, width, height, rects):
+        """只把變化的矩形畫進保留的上一幀再顯示，上傳與轉換量隨變化面積而非解析度增減；沒有基準幀時回傳 False"""
+        if self.frame is None or (self.frame.width(), self.frame.height()) != (width, height):
+            print("[Projector] No base frame for patch, requesting full frame.")
+            return False
+        painter = QPainter(self.frame)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for x, y, w, h, data in rects:
+            painter.drawImage(x, y, QImage(data, w, h, w, QImage.Format_Grayscale8))
+        painter.end()
+        self.image_label.setPixmap(self.frame)
+        return True
+
     def show_blank(self):
         """顯示黑畫面"""
         # 清除圖片即可，因為背景是黑的
@@ -106,21 +148,32 @@ if __name__ == '__main__':
     screen = screens[monitor_index]
     window.move(screen.geometry().x(), screen.geometry().y())
     window.showFullScreen()
+    # 先處理一次事件，確保視窗已真正顯示後才回報就緒
+    app.processEvents()
 
     # 創建並啟動背景監聽執行緒
     listener_thread = QThread()
-    command_listener = CommandListener(address=(host, port), authkey=authkey)
+    geometry = screen.geometry()
+    command_listener = CommandListener(address=(host, port), authkey=authkey,
+                                       ready_info={'width': geometry.width(), 'height': geometry.height()})
     command_listener.moveToThread(listener_thread)
 
-    # 連接信號與槽
-    listener_thread.started.connect(command_listener.run)
-    command_listener.command_received.connect(
-        lambda msg: {
+    def dispatch(msg):
+        result = {
             'show': lambda: window.show_image(msg['path']),
+            'frame': lambda: window.show_frame(msg['width'], msg['height'], msg['data']),
+            'patch': lambda: window.patch_frame(msg['width'], msg['height'], msg['rects']),
             'blank': window.show_blank,
             'close': app.quit
         }.get(msg.get('command'), lambda: print(f"Unknown command: {msg}"))()
-    )
+        if msg.get('ack'):
+            # 同步重繪後才回報，確保回報時畫面已切換
+            window.repaint()
+            command_listener.ack(msg, result is not False)
+
+    # 連接信號與槽
+    listener_thread.started.connect(command_listener.run)
+    command_listener.command_received.connect(dispatch)
     # 監聽執行緒結束後也退出程式
     listener_thread.finished.connect(app.quit)
 
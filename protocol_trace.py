@@ -0,0 +1,366 @@
+# protocol_trace.py - 運動與投影協議的記錄與重播
+# 功能：打印時把送往 ESP32 / 投影進程的每筆指令、回覆與時間戳記寫入追蹤檔 (JSON lines)；
+#       之後以原本的時序對本機模擬 ESP32 (fake_esp32.py) 或投影替身重播，離線重現現場的時序問題，
+#       並比較協議或韌體修改前後的往返延遲。投影像素資料只記錄大小，重播時以相同大小的填充資料代替。
+# 用法:
+#   在 main_gui.PrintConfig 設定 PROTOCOL_TRACE_PATH，或在 farm.json 的打印機設定中加入 "protocol_trace_path"
+#   python protocol_trace.py info print.trace
+#   python protocol_trace.py replay print.trace [--speed 2.0] [--motion fake|10.10.17.187:8899|serial:COM3]
+#                                               [--motion-scale 1.0] [--projector fake|launch:1|none]
+
+import json
+import time
+import argparse
+import threading
+from multiprocessing.connection import Listener
+
+from motion_transport import Transport, open_transport
+from profiling import percentile
+
+TRACE_VERSION = 1
+REPLAY_PROJECTOR_PORT = 6090  # launch:N 重播時第一個投影通道的埠號，其餘通道依序 +1
+
+
+# --- 1. 記錄 ---
+class TraceRecorder:
+    """
+    執行緒安全的追蹤檔寫入器。第一行為檔頭，之後每行一個事件：
+    {"t": 相對開始的秒數, "ch": 通道, "dir": "tx" | "rx", ...}
+    運動通道以 "data" (送出的原始字元) / "line" (讀回的一行) 記錄；投影通道以 "msg" 記錄，tx 另有 "dur" (送出耗時)。
+    """
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+        header = {'trace': TRACE_VERSION, 'started': time.strftime('%Y-%m-%d %H:%M:%S'), 'meta': meta or {}}
+        self.file.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+    def now(self):
+        return time.perf_counter() - self.t0
+
+    def record(self, channel, direction, t=None, **fields):
+        event = dict(t=round(self.now() if t is None else t, 6), ch=channel, dir=direction, **fields)
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def summarize_message(msg):
+    """投影指令去掉像素資料，只留尺寸：'data' -> {'bytes': n}，'rects' 的像素 -> 矩形座標。"""
+    if not isinstance(msg, dict):
+        return {'repr': repr(msg)}
+    out = {k: v for k, v in msg.items() if k not in ('data', 'rects')}
+    if 'data' in msg:
+        out['data'] = {'bytes': len(msg['data'])}
+    if 'rects' in msg:
+        out['rects'] = [list(rect[:4]) for rect in msg['rects']]
+    return out
+
+
+def rebuild_message(summary):
+    """summarize_message 的反向：以相同大小的填充資料還原投影指令。"""
+    msg = dict(summary)
+    if isinstance(msg.get('data'), dict):
+        msg['data'] = bytes(msg['data']['bytes'])
+    if 'rects' in msg:
+        msg['rects'] = [(x, y, w, h, bytes(w * h)) for x, y, w, h in msg['rects']]
+    return msg
+
+
+class TracedTransport(Transport):
+    """包裝 motion_transport 的傳輸後端，記錄每次寫入與讀回的一行；request() / stats() 與原本相同。"""
+
+    def __init__(self, inner, recorder, channel='motion'):
+        super().__init__()
+        self.inner = inner
+        self.recorder = recorder
+        self.channel = channel
+        self.name = inner.name
+
+    def write(self, data):
+        # latin-1 可無損還原觸發字節等非文字資料
+        self.recorder.record(self.channel, 'tx', data=data.decode('latin-1'))
+        self.inner.write(data)
+
+    def readline(self):
+        line = self.inner.readline()
+        self.recorder.record(self.channel, 'rx', line=line)
+        return line
+
+    def set_timeout(self, seconds):
+        self.inner.set_timeout(seconds)
+
+    def close(self):
+        self.inner.close()
+
+
+class TracedConnection:
+    """包裝投影進程的 multiprocessing Connection (send / recv / poll / close)；ready 為連線時的就緒訊息。"""
+
+    def __init__(self, conn, recorder, channel='projector', ready=None):
+        self.conn = conn
+        self.recorder = recorder
+        self.channel = channel
+        if ready is not None:
+            recorder.record(channel, 'rx', msg=ready)
+
+    def send(self, msg):
+        t = self.recorder.now()
+        self.conn.send(msg)
+        self.recorder.record(self.channel, 'tx', t=t, msg=summarize_message(msg), dur=round(self.recorder.now() - t, 6))
+
+    def recv(self):
+        msg = self.conn.recv()
+        self.recorder.record(self.channel, 'rx', msg=msg)
+        return msg
+
+    def poll(self, timeout=0.0):
+        return self.conn.poll(timeout)
+
+    def close(self):
+        self.conn.close()
+
+
+def load_trace(path):
+    """回傳 (檔頭, 事件清單)；記錄中途中斷時略過最後不完整的一行。"""
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    header = json.loads(lines[0])
+    if header.get('trace') != TRACE_VERSION:
+        raise ValueError(f"{path} 不是協議追蹤檔 (或版本不符)。")
+    events = []
+    for line in lines[1:]:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            break
+    return header, events
+
+
+def exchanges(events, channel):
+    """把一個通道的事件配對成 [(tx 事件, [之後的 rx 事件...]), ...]；第一個 tx 之前的 rx (就緒訊息) 略過。"""
+    pairs = []
+    for event in events:
+        if event['ch'] != channel:
+            continue
+        if event['dir'] == 'tx':
+            pairs.append((event, []))
+        elif pairs:
+            pairs[-1][1].append(event)
+    return pairs
+
+
+# --- 2. 投影替身 ---
+class FakeProjector:
+    """與 projector_view.py 相同的連線流程 (就緒訊息、ack 回報)，不顯示畫面；在背景執行緒中運行。"""
+
+    def __init__(self, address, authkey, size=(1920, 1080)):
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.size = size
+        self.received = 0
+        self.thread = threading.Thread(target=self._serve, name='fake-projector', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _serve(self):
+        with self.listener, self.listener.accept() as conn:
+            conn.send({'status': 'ready', 'width': self.size[0], 'height': self.size[1]})
+            while True:
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    break
+                self.received += 1
+                if msg.get('ack'):
+                    conn.send({'status': 'shown', 'seq': msg.get('seq')})
+                if msg.get('command') == 'close':
+                    break
+
+
+# --- 3. 重播 ---
+def _wait_until(start, t, speed):
+    """等到原本的時間點；回傳落後原時序的秒數 (前一筆耗時比原本久時為正)。"""
+    delay = start + t / speed - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+        return 0.0
+    return -delay
+
+
+def replay_motion(pairs, transport, start, speed, result):
+    """逐筆依原時序送出，讀回與原本相同行數的回覆並比較內容。"""
+    for tx, rxs in pairs:
+        result['behind'].append(_wait_until(start, tx['t'], speed))
+        t0 = time.perf_counter()
+        transport.write(tx['data'].encode('latin-1'))
+        replies = [transport.readline() for _ in rxs]
+        result['replay'].append(time.perf_counter() - t0)
+        if rxs:
+            result['original'].append(rxs[-1]['t'] - tx['t'])
+        expected = [rx['line'] for rx in rxs]
+        if replies != expected:
+            result['mismatches'].append((tx['data'].strip()[:60], expected[-1:], replies[-1:]))
+
+
+def replay_projector(pairs, conn, start, speed, result, timeout=10.0):
+    """送出還原的投影指令；帶 ack 的指令等到對應 seq 的回報為止，耗時以送出到回報計算。"""
+    for tx, rxs in pairs:
+        result['behind'].append(_wait_until(start, tx['t'], speed))
+        msg = rebuild_message(tx['msg'])
+        t0 = time.perf_counter()
+        conn.send(msg)
+        if msg.get('ack'):
+            deadline = time.monotonic() + timeout
+            while conn.poll(max(0.0, deadline - time.monotonic())):
+                if conn.recv().get('seq') == msg.get('seq'):
+                    break
+            else:
+                result['mismatches'].append((msg.get('command'), ['shown'], ['timeout']))
+        result['replay'].append(time.perf_counter() - t0)
+        acks = [rx for rx in rxs if rx['msg'].get('seq') == msg.get('seq')] if msg.get('ack') else []
+        result['original'].append(acks[0]['t'] - tx['t'] if acks else tx.get('dur', 0.0))
+        if msg.get('command') == 'close':
+            break
+
+
+def _new_result(channel):
+    return {'channel': channel, 'original': [], 'replay': [], 'behind': [], 'mismatches': []}
+
+
+def _ms_stats(values):
+    samples = sorted(values)
+    if not samples:
+        return "無資料"
+    return (f"平均 {1000.0 * sum(samples) / len(samples):7.2f}  p50 {1000.0 * percentile(samples, 50):7.2f}"
+            f"  p90 {1000.0 * percentile(samples, 90):7.2f}  最大 {1000.0 * samples[-1]:7.2f} ms")
+
+
+def print_result(result):
+    print(f"[{result['channel']}] {len(result['replay'])} 筆")
+    print(f"  原始往返 {_ms_stats(result['original'])}")
+    print(f"  重播往返 {_ms_stats(result['replay'])}")
+    behind = [b for b in result['behind'] if b > 0.001]
+    if behind:
+        print(f"  {len(behind)} 筆晚於原時序，最多落後 {1000.0 * max(behind):.1f} ms")
+    for command, expected, got in result['mismatches'][:10]:
+        print(f"  回覆不同: {command} 原本 {expected} 重播 {got}")
+    if len(result['mismatches']) > 10:
+        print(f"  ... 共 {len(result['mismatches'])} 筆回覆不同")
+
+
+def open_motion_target(spec, motion_scale):
+    """'fake' 啟動本機模擬 ESP32，其餘為 open_transport 的位址；回傳 (transport, 結束時呼叫的函式)。"""
+    if spec == 'fake':
+        from fake_esp32 import FakeESP32Server
+        server = FakeESP32Server(motion_scale=motion_scale).start()
+        return open_transport("%s:%d" % server.address, timeout=60), server.stop
+    return open_transport(spec, 8899, timeout=60), None
+
+
+def open_projector_target(spec, ready, index=0):
+    """
+    'fake' 啟動投影替身，'launch:N' 在第 N 個螢幕啟動真正的 projector_view.py；回傳 (conn, 結束時呼叫的函式)。
+    index 為投影通道序號 (拼接投影的 projector0、projector1 ...)，每個通道使用各自的埠號 REPLAY_PROJECTOR_PORT + index。
+    """
+    from projector_client import launch_projector, connect_projector, DEFAULT_AUTHKEY
+    size = (ready.get('width', 1920), ready.get('height', 1080)) if ready else (1920, 1080)
+    if spec == 'fake':
+        fake = FakeProjector(('localhost', 0), DEFAULT_AUTHKEY, size).start()
+        conn, _ = connect_projector(fake.address, DEFAULT_AUTHKEY)
+        return conn, None
+    monitor = int(spec.split(':', 1)[1])
+    address = ('localhost', REPLAY_PROJECTOR_PORT + index)
+    process = launch_projector(monitor, address, DEFAULT_AUTHKEY)
+    conn, _ = connect_projector(address, DEFAULT_AUTHKEY)
+    return conn, process.terminate
+
+
+def replay(path, motion='fake', projector='fake', speed=1.0, motion_scale=0.0):
+    """
+    每個通道一個執行緒，以共同的起點依原時序重播，保留運動與投影之間的相對時序。
+    投影通道名稱以 'projector' 開頭 (拼接投影為 projector0、projector1 ...)，每個各自連接一個替身。
+    """
+    header, events = load_trace(path)
+    channels = sorted({e['ch'] for e in events})
+    closers = []
+    jobs = []
+    try:
+        for channel in channels:
+            pairs = exchanges(events, channel)
+            if not pairs:
+                continue
+            result = _new_result(channel)
+            if channel.startswith('projector'):
+                if projector == 'none':
+                    continue
+                ready = next((e['msg'] for e in events if e['ch'] == channel and e['dir'] == 'rx'
+                              and e['msg'].get('status') == 'ready'), None)
+                conn, closer = open_projector_target(projector, ready, int(channel[len('projector'):] or 0))
+                closers.append(conn.close)
+                jobs.append((replay_projector, pairs, conn, result))
+            else:
+                if motion == 'none':
+                    continue
+                transport, closer = open_motion_target(motion, motion_scale)
+                closers.append(transport.close)
+                jobs.append((replay_motion, pairs, transport, result))
+            if closer:
+                closers.append(closer)
+        start = time.perf_counter() + 0.2
+        threads = [threading.Thread(target=fn, args=(pairs, target, start, speed, result), daemon=True)
+                   for fn, pairs, target, result in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for closer in closers:
+            try:
+                closer()
+            except OSError:
+                pass
+    return header, [job[3] for job in jobs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="運動 / 投影協議追蹤檔工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    i = sub.add_parser('info', help="顯示追蹤檔內容摘要")
+    i.add_argument('path')
+    r = sub.add_parser('replay', help="依原時序重播")
+    r.add_argument('path')
+    r.add_argument('--speed', type=float, default=1.0, help="時間倍速 (2.0 為兩倍速)")
+    r.add_argument('--motion', default='fake', help="fake、none 或 ESP32 位址 (見 motion_transport.py)")
+    r.add_argument('--motion-scale', type=float, default=1.0, help="模擬 ESP32 的運動耗時倍率 (0 為立即回覆)")
+    r.add_argument('--projector', default='fake', help="fake、none 或 launch:<螢幕編號>")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        header, events = load_trace(args.path)
+        print(f"開始於 {header['started']}，{header['meta']}")
+        duration = events[-1]['t'] if events else 0.0
+        print(f"{len(events)} 個事件，長度 {duration:.1f}s")
+        for channel in sorted({e['ch'] for e in events}):
+            pairs = exchanges(events, channel)
+            original = [rxs[-1]['t'] - tx['t'] for tx, rxs in pairs if rxs]
+            print(f"[{channel}] {len(pairs)} 筆送出，往返 {_ms_stats(original)}")
+        return
+
+    header, results = replay(args.path, args.motion, args.projector, args.speed, args.motion_scale)
+    print(f"重播 {args.path} ({header['meta']})，倍速 {args.speed:g}")
+    for result in results:
+        print_result(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# slice_source.py - 切片來源與共享幀快取
+# 功能：直接從 layers.zip 讀取切片 (免解壓)，並提供可被多台打印機共用的解碼 / 縮放快取。
+#       open_slice_source() 依副檔名選擇來源格式 (PNG 壓縮包、切片軟體原生的 RLE 格式等)。
+
+import io
+import os
+import zipfile
+import importlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def layer_sort_key(name):
+    """切片檔名為 '<層號>.png'，依層號數值排序。"""
+    return int(os.path.splitext(os.path.basename(name))[0])
+
+
+def decode_png(data):
+    """PNG 位元組 -> HxW uint8 灰階陣列。"""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        return np.asarray(img.convert('L'))
+
+
+def scale_frame(frame, size):
+    """以 LANCZOS 縮放到投影尺寸 size=(width, height)；尺寸相同時直接回傳。"""
+    if (frame.shape[1], frame.shape[0]) == tuple(size):
+        return frame
+    from PIL import Image
+    return np.asarray(Image.fromarray(frame).resize(tuple(size), Image.Resampling.LANCZOS))
+
+
+# --- 1. 切片來源 ---
+class ZipSliceSource:
+    """
+    從 zip 壓縮包讀取編號 PNG 切片。
+    key 由絕對路徑、檔案大小與修改時間組成，不同打印機打開同一個文件時可共用快取。
+    """
+
+    def __init__(self, zip_path):
+        self.path = os.path.abspath(zip_path)
+        stat = os.stat(self.path)
+        self.key = f"{self.path}:{stat.st_size}:{int(stat.st_mtime)}"
+        self._zip = zipfile.ZipFile(self.path, 'r')
+        self._lock = threading.Lock()  # ZipFile 不保證多執行緒同時讀取安全
+        names = [n for n in self._zip.namelist()
+                 if n.lower().endswith('.png') and os.path.splitext(os.path.basename(n))[0].isdigit()]
+        self.layer_names = sorted(names, key=layer_sort_key)
+        if not self.layer_names:
+            raise FileNotFoundError(f"錯誤: {zip_path} 中未找到任何PNG切片。")
+
+    def __len__(self):
+        return len(self.layer_names)
+
+    def read_bytes(self, index):
+        with self._lock:
+            return self._zip.read(self.layer_names[index])
+
+    def decode(self, index):
+        return decode_png(self.read_bytes(index))
+
+    def layer_meta(self, index):
+        """每層的額外參數 (曝光、抬升等)；PNG 壓縮包沒有，回傳空字典。"""
+        return {}
+
+    def close(self):
+        self._zip.close()
+
+
+# 副檔名 -> "模組:類別"，開啟時才載入對應模組；新格式以 register_format() 加入
+SLICE_FORMATS = {
+    '.zip': ZipSliceSource,
+    '.ctb': 'chitu_format:ChituSliceSource',
+    '.cbddlp': 'chitu_format:ChituSliceSource',
+    '.photon': 'chitu_format:ChituSliceSource',
+}
+
+
+def register_format(extension, target):
+    """target 為 "模組:類別" 字串或類別本身；類別需提供 key / __len__ / decode / layer_meta / close。"""
+    SLICE_FORMATS[extension.lower()] = target
+
+
+def open_slice_source(path):
+    """
+    依副檔名開啟切片來源。layer_meta(i) 可能提供的鍵：
+    exposure_s (曝光秒數)、lift / return / dwell_ms (同 layer_program.FIELDS)、z_mm (層頂高度)。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    target = SLICE_FORMATS.get(ext)
+    if target is None:
+        raise ValueError(f"不支援的切片格式: {ext or path} (支援 {', '.join(sorted(SLICE_FORMATS))})")
+    if isinstance(target, str):
+        module, _, name = target.partition(':')
+        target = getattr(importlib.import_module(module), name)
+    return target(path)
+
+
+class TransformChain:
+    """依序套用多個投影空間處理 (例如平場補償 -> 幾何校正)，key 為各處理 key 的組合。"""
+
+    def __init__(self, transforms):
+        self.transforms = [t for t in transforms if t is not None]
+        self.key = "|".join(t.key for t in self.transforms)
+
+    def __bool__(self):
+        return bool(self.transforms)
+
+    def __call__(self, frame):
+        for transform in self.transforms:
+            frame = transform(frame)
+        return frame
+
+
+# --- 2. 共享快取 ---
+class _LRU:
+    """附帶「計算中」去重的執行緒安全 LRU：多台打印機同時要同一層時只算一次。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.items = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            event = self.pending.get(key)
+            owner = event is None
+            if owner:
+                event = self.pending[key] = threading.Event()
+                self.misses += 1
+        if not owner:
+            event.wait()
+            with self.lock:
+                if key in self.items:
+                    self.hits += 1
+                    return self.items[key]
+            return self.get_or_compute(key, compute)  # 計算者失敗，自己重算
+        try:
+            value = compute()
+            with self.lock:
+                self.items[key] = value
+                while len(self.items) > self.max_entries:
+                    self.items.popitem(last=False)
+            return value
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+    def nbytes(self):
+        with self.lock:
+            return sum(v.nbytes for v in self.items.values())
+
+
+class FrameCache:
+    """
+    解碼與縮放兩級快取，可在多個打印任務之間共用。
+    - decoded(source, i): 原始解析度灰階切片
+    - scaled(source, i, size, transform): 縮放到投影尺寸 (並經投影空間處理) 後的切片
+    """
+
+    def __init__(self, max_decoded=32, max_scaled=64):
+        self._decoded = _LRU(max_decoded)
+        self._scaled = _LRU(max_scaled)
+
+    def decoded(self, source, index):
+        return self._decoded.get_or_compute((source.key, index), lambda: source.decode(index))
+
+    def scaled(self, source, index, size, transform=None):
+        """
+        transform: 縮放後在投影空間套用的處理 (例如幾何校正)，需帶有 key 屬性；
+        處理結果與縮放幀一起快取，打印時每層不再重算。
+        """
+        size = tuple(size)
+
+        def compute():
+            frame = scale_frame(self.decoded(source, index), size)
+            return transform(frame) if transform is not None else frame
+        return self._scaled.get_or_compute((source.key, index, size, getattr(transform, 'key', None)), compute)
+
+    def stats(self):
+        return {
+            'decoded_hits': self._decoded.hits, 'decoded_misses': self._decoded.misses,
+            'scaled_hits': self._scaled.hits, 'scaled_misses': self._scaled.misses,
+            'megabytes': (self._decoded.nbytes() + self._scaled.nbytes()) / 1e6,
+        }
@@ -0,0 +1,87 @@
+import os
+import time
+import threading
+
+import pytest
+
+from fake_esp32 import FakeESP32, FakeESP32Server
+from layer_program import TRIGGER_BYTE
+from motion_transport import TcpTransport, open_transport, serve_fake_on_fd, open_pty_pair, measure
+
+
+@pytest.fixture
+def server():
+    server = FakeESP32Server().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def tcp(server):
+    transport = TcpTransport(*server.address, timeout=5)
+    yield transport
+    transport.close()
+
+
+@pytest.fixture
+def serial_link():
+    pytest.importorskip("serial")
+    if not hasattr(os, 'openpty'):
+        pytest.skip("此平台沒有偽終端")
+    from motion_transport import SerialTransport
+    master, slave, path = open_pty_pair()
+    threading.Thread(target=serve_fake_on_fd, args=(master, FakeESP32()), daemon=True).start()
+    link = SerialTransport(path, timeout=5)
+    yield link
+    link.close()
+    os.close(slave)
+
+
+def _round_trips(transport):
+    assert transport.request("CONFIG_AXIS,z,12800.0,5.0") == "OK: Axis z configured."
+    assert transport.request("MOVE_REL,z,1.0,10.0") == "DONE"
+    assert transport.request("GET_POS,z") == "POS,z=2560:1.0"
+    assert transport.request("NOT_A_COMMAND").startswith("ERROR")
+
+
+def test_tcp_round_trips(tcp):
+    _round_trips(tcp)
+
+
+def test_serial_round_trips(serial_link):
+    _round_trips(serial_link)
+
+
+def test_serial_trigger_byte_runs_program_step(serial_link):
+    for line in ("PROGRAM_BEGIN,2,1,1,0,0,0", "PROGRAM_END"):
+        assert serial_link.request(line).startswith("OK")
+    serial_link.write(TRIGGER_BYTE)
+    assert serial_link.readline() == "STEP_DONE,0"
+    serial_link.write(TRIGGER_BYTE)
+    assert serial_link.readline() == "STEP_DONE,1"
+
+
+def test_serial_discard_input_drops_late_reply(serial_link):
+    serial_link.write(b"GET_POS,z\n")
+    # 等回覆抵達後丟棄，下一筆指令只會讀到自己的回覆
+    time.sleep(0.2)
+    serial_link.discard_input()
+    assert serial_link.request("MOVE_REL,z,0.0,10.0") == "DONE"
+
+
+def test_latency_stats(tcp):
+    stats = measure(tcp, 20)
+    assert stats['transport'] == 'tcp'
+    assert stats['n'] == 20
+    assert 0 < stats['p50_ms'] <= stats['p90_ms'] <= stats['max_ms']
+
+
+def test_open_transport_parses_tcp_addresses(server):
+    host, port = server.address
+    for address, default_port in ((f"{host}:{port}", None), (f"tcp://{host}:{port}", None), (host, port)):
+        transport = open_transport(address, default_port, timeout=5)
+        try:
+            assert transport.name == 'tcp'
+            assert transport.request("GET_POS,z").startswith("POS,z=")
+        finally:
+            transport.close()
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from plate_nesting import check_layout, dilate
+
+PLATE = (100, 40)
+BLOCK = np.ones((20, 20), dtype=bool)
+
+
+def test_dilate_square_radius():
+    mask = np.zeros((7, 7), dtype=bool)
+    mask[3, 3] = True
+    assert dilate(mask, 2).sum() == 25
+    assert dilate(mask, 0) is mask
+
+
+@pytest.mark.parametrize("gap", [0, 1, 5, 10])
+def test_parts_exactly_gap_apart_are_accepted(gap):
+    # A 佔 0..19 欄，B 從 20 + gap 欄開始：中間恰好空出 gap 欄
+    check_layout([("A", BLOCK, 0, 0), ("B", BLOCK, 20 + gap, 0)], PLATE, gap)
+
+
+@pytest.mark.parametrize("gap", [1, 5, 10])
+def test_parts_closer_than_gap_are_rejected(gap):
+    with pytest.raises(ValueError, match="重疊"):
+        check_layout([("A", BLOCK, 0, 0), ("B", BLOCK, 19 + gap, 0)], PLATE, gap)
+
+
+def test_gap_is_not_doubled_by_earlier_parts():
+    # 三個零件各自相隔 gap：第三個只需與已放入零件的實際範圍比較
+    gap = 4
+    parts = [("A", BLOCK, 0, 0), ("B", BLOCK, 24, 0), ("C", BLOCK, 48, 0)]
+    check_layout(parts, PLATE, gap)
+
+
+def test_gap_applies_diagonally_beyond_bounding_box():
+    gap = 3
+    check_layout([("A", BLOCK, 0, 0), ("B", BLOCK, 23, 20)], (100, 60), gap)
+    with pytest.raises(ValueError):
+        check_layout([("A", BLOCK, 0, 0), ("B", BLOCK, 22, 20)], (100, 60), gap)
+
+
+def test_part_outside_plate_is_rejected():
+    with pytest.raises(ValueError, match="超出平台"):
+        check_layout([("A", BLOCK, 90, 0)], PLATE)
+
+
+def test_gap_is_clipped_at_plate_edge():
+    # 零件貼齊平台邊緣時，外擴的間距超出平台的部分不算錯誤
+    check_layout([("A", BLOCK, 0, 0), ("B", BLOCK, 80, 20)], PLATE, 5)
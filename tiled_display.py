@@ -0,0 +1,186 @@
+# tiled_display.py - 多投影儀拼接輸出
+# 功能：把一層切片切成帶重疊區的多個分塊，重疊區以漸變權重融合，每個分塊送到各自的 projector_view.py 進程；
+#       所有投影儀回報畫面已切換後才開燈，以擴大成型面積而不降低 XY 解析度。
+# 用法:
+#   python tiled_display.py preview layers.zip --grid 2x1 --tile 1920x1080 --overlap 120 --layer 10 -o tile
+#   (輸出 tile_0.png、tile_1.png 供檢查切割與融合結果)
+
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from projector_client import launch_projector, connect_projector, frame_message, DEFAULT_AUTHKEY
+
+
+def parse_pair(text):
+    a, b = text.lower().split('x')
+    return int(a), int(b)
+
+
+def blend_ramp(length, overlap, ramp_start, ramp_end, gamma=1.0):
+    """
+    一維融合權重：重疊區內線性漸變，相鄰兩塊的權重相加為 1 (以劑量計)。
+    gamma 為投影儀灰階到光強的指數，權重先做 1/gamma 次方再寫入灰階。
+    """
+    weight = np.ones(length, dtype=np.float64)
+    if overlap > 0:
+        ramp = (np.arange(overlap) + 0.5) / overlap
+        if ramp_start:
+            weight[:overlap] = ramp
+        if ramp_end:
+            weight[length - overlap:] = ramp[::-1]
+    return weight ** (1.0 / gamma)
+
+
+# --- 1. 分塊與融合 ---
+class TileLayout:
+    """
+    cols x rows 個同尺寸投影分塊，相鄰分塊重疊 overlap 像素。
+    canvas_size 為整個成型面的像素尺寸；切片應先縮放到此尺寸。
+    作為投影空間處理使用時 (帶 key，可放進 TransformChain / FrameCache)，
+    回傳 (分塊數, 高, 寬) 的 uint8 陣列，切割與融合隨縮放結果一起快取。
+    """
+
+    def __init__(self, tile_size, grid, overlap=0, gamma=1.0):
+        self.tile_size = tuple(tile_size)
+        self.grid = tuple(grid)
+        self.overlap = int(overlap)
+        tile_w, tile_h = self.tile_size
+        cols, rows = self.grid
+        if not 0 <= self.overlap < min(tile_w, tile_h):
+            raise ValueError(f"重疊寬度 {overlap} 超出分塊尺寸。")
+        self.canvas_size = (cols * tile_w - (cols - 1) * self.overlap, rows * tile_h - (rows - 1) * self.overlap)
+        self.origins = [(c * (tile_w - self.overlap), r * (tile_h - self.overlap))
+                        for r in range(rows) for c in range(cols)]
+        # 每塊的融合權重預先算成 8.8 定點數，套用時一次整數乘法
+        self.weights = []
+        for r in range(rows):
+            wy = blend_ramp(tile_h, self.overlap, r > 0, r < rows - 1, gamma)
+            for c in range(cols):
+                wx = blend_ramp(tile_w, self.overlap, c > 0, c < cols - 1, gamma)
+                self.weights.append(np.rint(np.outer(wy, wx) * 256.0).astype(np.uint16))
+        self.key = f"tiles:{self.grid}:{self.tile_size}:{self.overlap}:{gamma}"
+
+    def __len__(self):
+        return len(self.origins)
+
+    def __call__(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.canvas_size:
+            raise ValueError(f"幀尺寸 {frame.shape[1]}x{frame.shape[0]} 與拼接畫布 "
+                             f"{self.canvas_size[0]}x{self.canvas_size[1]} 不符。")
+        tile_w, tile_h = self.tile_size
+        tiles = np.empty((len(self), tile_h, tile_w), dtype=np.uint8)
+        for k, (x, y) in enumerate(self.origins):
+            tile = frame[y:y + tile_h, x:x + tile_w].astype(np.uint16)
+            tiles[k] = (tile * self.weights[k] + 128) >> 8
+        return tiles
+
+
+# --- 2. 多進程投影輸出 ---
+class TiledProjector:
+    """
+    每個分塊一個 projector_view.py 進程。show() 並行送出所有分塊，
+    並等待每個進程回報已重繪 (ack) 後才返回，呼叫端接著開燈即可保證所有畫面已切換。
+    """
+
+    def __init__(self, layout, monitors, host='localhost', base_port=6100, authkey=DEFAULT_AUTHKEY, ack_timeout=5.0):
+        if len(monitors) != len(layout):
+            raise ValueError(f"需要 {len(layout)} 個投影螢幕，只指定了 {len(monitors)} 個。")
+        self.layout = layout
+        self.monitors = list(monitors)
+        self.addresses = [(host, base_port + k) for k in range(len(monitors))]
+        self.authkey = authkey
+        self.ack_timeout = ack_timeout
+        self.processes = []
+        self.conns = []
+        self.seq = 0
+        self.pool = ThreadPoolExecutor(max_workers=len(monitors), thread_name_prefix='tile')
+
+    @property
+    def size(self):
+        return self.layout.canvas_size
+
+    def open(self):
+        self.processes = [launch_projector(m, a, self.authkey) for m, a in zip(self.monitors, self.addresses)]
+        results = list(self.pool.map(lambda a: connect_projector(a, self.authkey), self.addresses))
+        self.conns = [conn for conn, _ in results]
+        for monitor, (_, ready) in zip(self.monitors, results):
+            if (ready['width'], ready['height']) != self.layout.tile_size:
+                print(f"警告: 螢幕 {monitor} 解析度 {ready['width']}x{ready['height']} 與分塊尺寸 "
+                      f"{self.layout.tile_size[0]}x{self.layout.tile_size[1]} 不同，畫面將置中顯示。")
+
+    def _broadcast(self, messages):
+        self.seq += 1
+        for msg in messages:
+            msg.update(ack=True, seq=self.seq)
+        list(self.pool.map(lambda pair: pair[0].send(pair[1]), zip(self.conns, messages)))
+        deadline = time.monotonic() + self.ack_timeout
+        replies = []
+        for k, conn in enumerate(self.conns):
+            while True:
+                if not conn.poll(max(0.0, deadline - time.monotonic())):
+                    raise RuntimeError(f"投影分塊 {k} 未在 {self.ack_timeout}s 內回報畫面切換。")
+                reply = conn.recv()
+                if reply.get('seq') == self.seq:
+                    replies.append(reply)
+                    break
+        return replies
+
+    def show(self, tiles, messages=None):
+        """
+        tiles 為 TileLayout 的輸出；返回時所有投影儀都已顯示新畫面。
+        messages 為預先算好的每塊指令 (例如 projector_client.update_message 的 'patch')，未指定時送出完整分塊。
+        """
+        replies = self._broadcast(messages or [frame_message(tile) for tile in tiles])
+        if any(reply.get('status') != 'shown' for reply in replies):
+            # 有投影端沒有 patch 的基準幀 (例如投影進程重啟過)：全部改送完整分塊
+            replies = self._broadcast([frame_message(tile) for tile in tiles])
+            if any(reply.get('status') != 'shown' for reply in replies):
+                raise RuntimeError(f"投影分塊顯示失敗: {replies}")
+
+    def blank(self):
+        self._broadcast([{'command': 'blank'} for _ in self.conns])
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send({'command': 'close'})
+            except OSError:
+                pass
+            conn.close()
+        for process in self.processes:
+            process.terminate()
+        self.pool.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多投影儀拼接輸出")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('preview', help="把一層切片切割融合後輸出成分塊 PNG")
+    p.add_argument('zip_path')
+    p.add_argument('--grid', default='2x1', help="橫向x縱向分塊數，例如 2x1")
+    p.add_argument('--tile', default='1920x1080', help="每台投影儀解析度 WxH")
+    p.add_argument('--overlap', type=int, default=120)
+    p.add_argument('--gamma', type=float, default=1.0)
+    p.add_argument('--layer', type=int, default=1, help="層號 (從 1 開始)")
+    p.add_argument('-o', '--output', default='tile')
+    args = parser.parse_args()
+
+    from PIL import Image
+    from slice_source import open_slice_source, scale_frame
+    layout = TileLayout(parse_pair(args.tile), parse_pair(args.grid), args.overlap, args.gamma)
+    source = open_slice_source(args.zip_path)
+    try:
+        tiles = layout(scale_frame(source.decode(args.layer - 1), layout.canvas_size))
+    finally:
+        source.close()
+    print(f"畫布 {layout.canvas_size[0]}x{layout.canvas_size[1]}，共 {len(layout)} 塊。")
+    for k, tile in enumerate(tiles):
+        Image.fromarray(tile).save(f"{args.output}_{k}.png")
+        print(f"已輸出 {args.output}_{k}.png (位置 {layout.origins[k]})")
+
+
+if __name__ == "__main__":
+    main()
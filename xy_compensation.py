@@ -0,0 +1,199 @@
+# xy_compensation.py - XY 尺寸補償 (灰階侵蝕 / 膨脹 + 邊緣抗鋸齒)
+# 功能：不重新切片，直接在每層切片上把輪廓外擴或內縮 (可為小數像素)，再以盒狀模糊做邊緣抗鋸齒，
+#       用來補償樹脂溢光造成的尺寸偏大或收縮。全部以 NumPy 陣列運算完成；
+#       farm_controller 把它放在投影空間處理的最前面，結果隨縮放幀一起進入 FrameCache；
+#       apply 子命令以進程池處理整個任務並輸出新的壓縮包，調整參數後數秒即可重算。
+# 用法:
+#   python xy_compensation.py preview layers.zip --layer 10 --offset -1.5 --aa 1 -o comp.png
+#   python xy_compensation.py apply layers.zip -o layers_comp.zip --offset -1.5 --aa 1 [--size 1920x1080] [--workers 8]
+
+import io
+import os
+import time
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# --- 1. 向量化形態學 ---
+def _window(a, start, size, axis):
+    index = [slice(None)] * a.ndim
+    index[axis] = slice(start, start + size)
+    return a[tuple(index)]
+
+
+def window_reduce(a, radius, axis, op):
+    """
+    沿 axis 取中心窗口 (2*radius+1) 的最大 / 最小值 (op 為 np.maximum / np.minimum)，畫面外視為 0。
+    窗口長度以倍增方式擴大，只需 O(log radius) 次整幅陣列運算。
+    """
+    if radius <= 0:
+        return a
+    n = 2 * radius + 1
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (radius, radius)
+    m = np.pad(a, pad)
+    length = 1
+    while 2 * length <= n:
+        size = m.shape[axis] - length
+        m = op(_window(m, 0, size, axis), _window(m, length, size, axis))
+        length *= 2
+    if length < n:
+        size = m.shape[axis] - (n - length)
+        m = op(_window(m, 0, size, axis), _window(m, n - length, size, axis))
+    return m
+
+
+def grow(frame, radius):
+    """灰階膨脹 (radius > 0) 或侵蝕 (radius < 0)，方形結構元素；抗鋸齒的邊緣灰階一併平移。"""
+    op = np.maximum if radius > 0 else np.minimum
+    for axis in (0, 1):
+        frame = window_reduce(frame, abs(radius), axis, op)
+    return frame
+
+
+def offset_frame(frame, offset_px):
+    """輪廓外擴 offset_px 像素 (負值為內縮)；小數部分以相鄰兩個整數半徑的結果線性插值。"""
+    lo = int(np.floor(abs(offset_px)))
+    frac = abs(offset_px) - lo
+    sign = 1 if offset_px > 0 else -1
+    base = grow(frame, sign * lo)
+    if frac < 1e-3:
+        return base
+    weight = int(round(frac * 256))
+    mixed = base.astype(np.uint16) * (256 - weight) + grow(frame, sign * (lo + 1)).astype(np.uint16) * weight
+    return ((mixed + 128) >> 8).astype(np.uint8)
+
+
+def box_blur(frame, radius):
+    """可分離的盒狀模糊 (累積和)，畫面外延伸邊緣值；均勻區域不變，只有邊緣被平滑。"""
+    if radius <= 0:
+        return frame
+    n = 2 * radius + 1
+    out = frame.astype(np.uint32)
+    for axis in (0, 1):
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (radius + 1, radius)
+        c = np.cumsum(np.pad(out, pad, mode='edge'), axis=axis, dtype=np.uint32)
+        size = c.shape[axis] - n
+        out = _window(c, n, size, axis) - _window(c, 0, size, axis)
+    return ((out + n * n // 2) // (n * n)).astype(np.uint8)
+
+
+# --- 2. 投影空間處理 ---
+class XYCompensation:
+    """
+    帶 key 的投影空間處理，可放進 TransformChain / FrameCache。
+    offset_px 為輪廓外擴像素 (負值內縮，補償溢光)，aa_px 為邊緣抗鋸齒的模糊半徑。
+    需在成型面座標下計算，應放在平場補償、幾何校正與多段曝光分區之前。
+    """
+
+    def __init__(self, offset_px=0.0, aa_px=0):
+        self.offset_px = float(offset_px)
+        self.aa_px = int(aa_px)
+        self.key = f"xycomp:{self.offset_px:g}:{self.aa_px}"
+
+    @classmethod
+    def from_params(cls, spec):
+        """由設定檔字典建立，例如 {"offset_px": -1.5, "aa_px": 1}。"""
+        return cls(spec.get('offset_px', 0.0), spec.get('aa_px', 0))
+
+    def __bool__(self):
+        return abs(self.offset_px) >= 1e-3 or self.aa_px > 0
+
+    def __call__(self, frame):
+        if abs(self.offset_px) >= 1e-3:
+            frame = offset_frame(frame, self.offset_px)
+        return box_blur(frame, self.aa_px)
+
+
+# --- 3. 進程池批次處理 ---
+_worker = {}
+
+
+def _init_worker(path, size, comp):
+    from slice_source import open_slice_source
+    _worker.update(source=open_slice_source(path), size=size, comp=comp)
+
+
+def _process_layer(index):
+    from PIL import Image
+    from slice_source import scale_frame
+    frame = _worker['source'].decode(index)
+    if _worker['size']:
+        frame = scale_frame(frame, _worker['size'])
+    buf = io.BytesIO()
+    Image.fromarray(_worker['comp'](frame)).save(buf, format='PNG')
+    return index, buf.getvalue()
+
+
+def compensate_layers(path, comp, size=None, workers=None, indices=None):
+    """
+    以進程池逐層解碼、補償並編碼成 PNG，依層號順序產出 (index, png_bytes)。
+    每個工作進程在初始化時自行開啟切片來源，不需傳送壓縮包內容。
+    """
+    from slice_source import open_slice_source
+    if indices is None:
+        source = open_slice_source(path)
+        indices = range(len(source))
+        source.close()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path, size, comp)) as pool:
+        yield from pool.map(_process_layer, indices, chunksize=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XY 尺寸補償 (侵蝕 / 膨脹 + 抗鋸齒)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, text in (('preview', "補償單層並輸出 PNG"), ('apply', "以進程池補償所有層並輸出新的壓縮包")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument('path', help="切片壓縮包或 .ctb / .cbddlp / .photon")
+        p.add_argument('--offset', type=float, default=0.0, help="輪廓外擴像素，負值內縮 (可為小數)")
+        p.add_argument('--aa', type=int, default=0, help="邊緣抗鋸齒模糊半徑 (像素)")
+        p.add_argument('--size', help="先縮放到投影尺寸 WxH")
+        if name == 'preview':
+            p.add_argument('--layer', type=int, default=1, help="層號 (從 1 開始)")
+            p.add_argument('-o', '--output', default='comp.png')
+        else:
+            p.add_argument('-o', '--output', required=True, help="輸出壓縮包")
+            p.add_argument('--workers', type=int, default=None, help="進程數 (預設為 CPU 核心數)")
+    args = parser.parse_args()
+    comp = XYCompensation(args.offset, args.aa)
+    size = tuple(int(v) for v in args.size.lower().split('x')) if args.size else None
+
+    if args.command == 'preview':
+        from PIL import Image
+        from slice_source import open_slice_source, scale_frame
+        source = open_slice_source(args.path)
+        try:
+            frame = source.decode(args.layer - 1)
+        finally:
+            source.close()
+        if size:
+            frame = scale_frame(frame, size)
+        t0 = time.perf_counter()
+        out = comp(frame)
+        elapsed = (time.perf_counter() - t0) * 1000
+        before, after = int(frame.sum()) / 255.0, int(out.sum()) / 255.0
+        print(f"{comp.key}: {frame.shape[1]}x{frame.shape[0]}，{elapsed:.1f} ms，"
+              f"面積 {before:.0f} -> {after:.0f} 像素 ({100.0 * (after - before) / max(before, 1.0):+.2f}%)")
+        Image.fromarray(out).save(args.output)
+        print(f"已輸出 -> {args.output}")
+        return
+
+    t0 = time.perf_counter()
+    count = 0
+    tmp_path = args.output + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as out:
+        # PNG 已壓縮，壓縮包不再壓縮
+        for index, data in compensate_layers(args.path, comp, size, args.workers):
+            out.writestr(f"{index + 1}.png", data)
+            count += 1
+    os.replace(tmp_path, args.output)
+    elapsed = time.perf_counter() - t0
+    print(f"{comp.key}: {count} 層，{elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} 層/秒) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()